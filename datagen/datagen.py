@@ -14,11 +14,13 @@ def main():
             gen_run_parameters
         )
         from subroutines.run_stages import run_stages
+        from subroutines.structure_cache import structure_cache
     else:
         from datagen.subroutines.run_parameters import (
             gen_run_parameters
         )
         from datagen.subroutines.run_stages import run_stages
+        from datagen.subroutines.structure_cache import structure_cache
     datagen_dir = sys.path[0].split('datagen')[0]
 
     # Reads in command line inputs
@@ -64,6 +66,16 @@ def main():
     elif stage in ['4']:
         analysis.run_stage_4(datagen_dir)
 
+    # Reports the usage of the parsed structure cache (for tuning the
+    # structurecachesize run parameter)
+    cache_stats = structure_cache.stats()
+    print('Parsed structure cache: {} hits, {} misses, {} structures '
+          '({:.1f} of {:.1f} MB)'.format(
+              cache_stats['hits'], cache_stats['misses'],
+              cache_stats['entries'], cache_stats['size_mb'],
+              cache_stats['max_size_mb']
+          ))
+
 
 # Calls 'main' function if datagen.py is run as a script
 if __name__ == '__main__':
@@ -1,5 +1,7 @@
 
 import os
+import json
+import sqlite3
 import pandas as pd
 from collections import OrderedDict
 
@@ -36,12 +38,187 @@ def gen_domain_desc_list(orig_dir):
     return domains_desc
 
 
-def domain_desc_filter(cathcode, domains_desc, discard_non_tm):
-    # Filters the domain descriptions list for beta-structures (either
-    # sandwiches or barrels depending upon the user's choice), picking out PDB
-    # accession codes and sequences, whose values are stored in a dataframe.
+def parse_domain_desc(domain):
+    # Extracts the PDB code, domain id, chain, CATHCODE, DSEQS, SSEQS and
+    # SRANGE (segment start and stop) fields from an individual domain
+    # description
+    domain_sublist = domain.split('\n')
+    domain_fields = OrderedDict()
+    dseqs_list = []
+    sseqs_consec_list = []
+    sseqs_list = []
+    sseqs_start_stop_list = []
 
-    tm_pdb_codes = gen_tm_pdb_codes_list()
+    for index, line in enumerate(domain_sublist):
+        if line.startswith('SSEQS') and domain_sublist[index+1].startswith('SSEQS'):
+            sseqs_consec_list.append(index)
+    for index in sseqs_consec_list:
+        domain_sublist[index+1] = ''.join(domain_sublist[index:index+2])
+        domain_sublist[index] = ''
+
+    for line in domain_sublist:
+        if line.startswith('DOMAIN'):
+            domain_fields['PDB_CODE'] = line[10:14]
+            domain_fields['DOMAIN_ID'] = line[10:].strip()
+            chain = line[14:].strip()
+            chain = ''.join([char for char in chain if char.isalpha()])
+            domain_fields['CHAIN'] = chain
+        elif line.startswith('CATHCODE'):
+            domain_fields['CATHCODE'] = line[10:]
+        elif line.startswith('DSEQS'):
+            line = line.replace('DSEQS', '')
+            line = line.replace(' ', '')
+            dseqs_list.append(line)
+        elif line.startswith('SSEQS'):
+            line = line.replace('SSEQS', '')
+            line = line.replace(' ', '')
+            sseqs_list.append(line)
+        elif line.startswith('SRANGE'):
+            line = line.replace('SRANGE', '')
+            start_stop = line.split()
+            start_stop = [item.strip() for item in start_stop if item.strip() != '']
+            sseqs_start_stop_list.append(start_stop)
+    domain_fields['DSEQS'] = ''.join(dseqs_list)
+    domain_fields['SSEQS'] = sseqs_list
+    domain_fields['SSEQS_START_STOP'] = sseqs_start_stop_list
+
+    return domain_fields
+
+
+def compile_domain_desc_table(orig_dir, cache_dir):
+    # Compiles the domain descriptions in CATH_domain_desc_v_4_2_0.txt into
+    # an SQLite table (one row per domain, indexed on CATHCODE) stored in the
+    # cache directory. The table is only (re)compiled if the domain
+    # description file has changed since it was last compiled.
+    desc_path = '{}/docs/CATH_domain_desc_v_4_2_0.txt'.format(orig_dir)
+    table_path = '{}CATH_domain_desc_v_4_2_0.db'.format(cache_dir)
+    stat = os.stat(desc_path)
+    source = (os.path.abspath(desc_path), stat.st_mtime_ns, stat.st_size)
+
+    connection = sqlite3.connect(table_path)
+    connection.execute('CREATE TABLE IF NOT EXISTS source (desc_path TEXT, '
+                       'mtime_ns INTEGER, file_size INTEGER)')
+    if connection.execute('SELECT * FROM source').fetchall() == [source]:
+        connection.close()
+        return table_path
+
+    print('Compiling CATH domain descriptions into {}'.format(table_path))
+    domains_desc = gen_domain_desc_list(orig_dir)
+    rows = []
+    for row_id, domain in enumerate(domains_desc):
+        domain_fields = parse_domain_desc(domain)
+        cath_levels = domain_fields['CATHCODE'].strip().split('.')
+        rows.append((row_id, domain_fields['PDB_CODE'],
+                     domain_fields['DOMAIN_ID'], domain_fields['CHAIN'],
+                     domain_fields['CATHCODE'],
+                     domain_fields['CATHCODE'].strip(),
+                     '.'.join(cath_levels[0:1]), '.'.join(cath_levels[0:2]),
+                     '.'.join(cath_levels[0:3]), domain_fields['DSEQS'],
+                     json.dumps(domain_fields['SSEQS']),
+                     json.dumps(domain_fields['SSEQS_START_STOP'])))
+
+    with connection:
+        connection.execute('DROP TABLE IF EXISTS domains')
+        connection.execute(
+            'CREATE TABLE domains (row_id INTEGER PRIMARY KEY, pdb_code TEXT, '
+            'domain_id TEXT, chain TEXT, cathcode TEXT, cathcode_key TEXT, '
+            'class_code TEXT, arch_code TEXT, topol_code TEXT, dseqs TEXT, '
+            'sseqs TEXT, srange TEXT)'
+        )
+        connection.executemany('INSERT INTO domains VALUES (?, ?, ?, ?, ?, ?, '
+                               '?, ?, ?, ?, ?, ?)', rows)
+        connection.execute('CREATE INDEX cathcode_index ON domains '
+                           '(cathcode_key, row_id)')
+        connection.execute('DELETE FROM source')
+        connection.execute('INSERT INTO source VALUES (?, ?, ?)', source)
+    connection.close()
+
+    return table_path
+
+
+class cathcode_trie():
+
+    def __init__(self, cathcodes):
+        # Builds a prefix trie over the levels (class, architecture, topology,
+        # homologous superfamily) of the input CATHCODEs. Each input code marks
+        # its node as terminal, matching every domain within that node of the
+        # CATH hierarchy.
+        self.root = OrderedDict()
+        for code in cathcodes:
+            # Codes with more than 4 levels can't match any domain
+            if code.count('.') > 3:
+                continue
+            node = self.root
+            for level in code.split('.'):
+                node = node.setdefault(level, OrderedDict())
+            node[None] = True
+
+    def match(self, cathcode):
+        # Returns True if the input (complete) CATHCODE lies within any of the
+        # codes in the trie
+        node = self.root
+        for level in cathcode.split('.'):
+            if not level in node:
+                return False
+            node = node[level]
+            if None in node:
+                return True
+        return False
+
+    def terminal_codes(self):
+        # Lists the minimal set of codes in the trie that together cover all
+        # of its codes (i.e. codes that lie within another code in the trie,
+        # e.g. 2.60.40.10 within 2.60, are dropped)
+        codes = []
+        nodes = [([], self.root)]
+        while len(nodes) > 0:
+            levels, node = nodes.pop(0)
+            for level, child in node.items():
+                if level is None:
+                    continue
+                if None in child:
+                    codes.append('.'.join(levels + [level]))
+                else:
+                    nodes.append((levels + [level], child))
+        return codes
+
+
+def domain_desc_filter(cathcode, domain_desc_table, discard_non_tm):
+    # Filters the compiled table of domain descriptions for beta-structures
+    # (either sandwiches or barrels depending upon the user's choice), picking
+    # out PDB accession codes and sequences, whose values are stored in a
+    # dataframe.
+
+    tm_pdb_codes = set(gen_tm_pdb_codes_list())
+
+    # Merges the input CATHCODEs into a trie, then looks up all of the
+    # domains within the codes in the trie in a single scan of the CATHCODE
+    # index. Partial codes only match complete levels of the hierarchy, and
+    # complete codes are matched exactly, preventing cathcodes at the same
+    # level of the hierarchy with overlapping codes (e.g. 2.60.40.10 and
+    # 2.60.40.1090) from being mistaken for one another.
+    trie = cathcode_trie(cathcode.split('_'))
+    conditions = []
+    parameters = []
+    for code in trie.terminal_codes():
+        if code.count('.') == 3:
+            conditions.append('cathcode_key = ?')
+            parameters.append(code)
+        else:
+            conditions.append('(cathcode_key >= ? AND cathcode_key < ?)')
+            parameters += ['{}.'.format(code), '{}/'.format(code)]
+
+    connection = sqlite3.connect(domain_desc_table)
+    domain_rows = []
+    if len(conditions) > 0:
+        rows = connection.execute(
+            'SELECT cathcode_key, pdb_code, domain_id, chain, cathcode, dseqs, '
+            'sseqs, srange FROM domains WHERE {} ORDER BY row_id'.format(
+                ' OR '.join(conditions)
+            ), parameters
+        )
+        domain_rows = [row[1:] for row in rows if trie.match(row[0])]
+    connection.close()
 
     domain_pdb_ids = []
     domain_ids = []
@@ -50,64 +227,22 @@ def domain_desc_filter(cathcode, domains_desc, discard_non_tm):
     domain_dseqs = []
     domain_sseqs = []
     domain_sseqs_start_stop = []
-    for domain in domains_desc:
-        # Prevents cathcodes at the same level of the hierarchy with
-        # overlapping codes (e.g. 2.60.40.10 and 2.60.40.1090) from being
-        # mistaken for one another
-        for code in cathcode.split('_'):
-            if (
-                    (code.count('.') == 3 and 'CATHCODE  {}\n'.format(code) in domain)
-                    or
-                    (code.count('.') < 3 and 'CATHCODE  {}.'.format(code) in domain)
-            ):
-                # Discards structures whose PDB codes are not in the OPM
-                # database if the user has set discard_non_tm to True
-                domain_sublist = domain.split('\n')
-                pdb_code = [line for line in domain_sublist if
-                            line.startswith('DOMAIN')][0][10:14]
-                if (
-                        (discard_non_tm is True and pdb_code in tm_pdb_codes)
-                        or
-                        (discard_non_tm is False)
-                ):
-                    dseqs_list = []
-                    sseqs_consec_list = []
-                    sseqs_list = []
-                    sseqs_start_stop_list = []
-
-                    for index, line in enumerate(domain_sublist):
-                        if line.startswith('SSEQS') and domain_sublist[index+1].startswith('SSEQS'):
-                            sseqs_consec_list.append(index)
-                    for index in sseqs_consec_list:
-                        domain_sublist[index+1] = ''.join(domain_sublist[index:index+2])
-                        domain_sublist[index] = ''
-
-                    for line in domain_sublist:
-                        if line.startswith('DOMAIN'):
-                            domain_pdb_ids.append(line[10:14])
-                            domain_ids.append(line[10:].strip())
-                            chain = line[14:].strip()
-                            chain = ''.join([char for char in chain if char.isalpha()])
-                            domain_chains.append(chain)
-                        elif line.startswith('CATHCODE'):
-                            domain_cathcodes.append(line[10:])
-                        elif line.startswith('DSEQS'):
-                            line = line.replace('DSEQS', '')
-                            line = line.replace(' ', '')
-                            dseqs_list.append(line)
-                        elif line.startswith('SSEQS'):
-                            line = line.replace('SSEQS', '')
-                            line = line.replace(' ', '')
-                            sseqs_list.append(line)
-                        elif line.startswith('SRANGE'):
-                            line = line.replace('SRANGE', '')
-                            start_stop = line.split()
-                            start_stop = [item.strip() for item in start_stop if item.strip() != '']
-                            sseqs_start_stop_list.append(start_stop)
-                    dseqs = ''.join(dseqs_list)
-                    domain_dseqs.append(dseqs)
-                    domain_sseqs.append(sseqs_list)
-                    domain_sseqs_start_stop.append(sseqs_start_stop_list)
+    for (pdb_code, domain_id, chain, domain_cathcode, dseqs, sseqs, srange
+         ) in domain_rows:
+        # Discards structures whose PDB codes are not in the OPM database if
+        # the user has set discard_non_tm to True
+        if (
+                (discard_non_tm is True and pdb_code in tm_pdb_codes)
+                or
+                (discard_non_tm is False)
+        ):
+            domain_pdb_ids.append(pdb_code)
+            domain_ids.append(domain_id)
+            domain_chains.append(chain)
+            domain_cathcodes.append(domain_cathcode)
+            domain_dseqs.append(dseqs)
+            domain_sseqs.append(json.loads(sseqs))
+            domain_sseqs_start_stop.append(json.loads(srange))
 
     domain_df = pd.DataFrame(OrderedDict({'PDB_CODE': domain_pdb_ids,
                                           'DOMAIN_ID': domain_ids,
@@ -1,12 +1,19 @@
 
 import os
-import copy
 import pandas as pd
 from collections import OrderedDict
 if __name__ == 'subroutines.CDHIT':
     from subroutines.run_stages import run_stages
+    from subroutines.pdb_header_index import pdb_header_index
+    from subroutines.cluster_sequences import (
+        cluster_sequences, write_cluster_fasta
+    )
 else:
     from datagen.subroutines.run_stages import run_stages
+    from datagen.subroutines.pdb_header_index import pdb_header_index
+    from datagen.subroutines.cluster_sequences import (
+        cluster_sequences, write_cluster_fasta
+    )
 
 
 class filter_beta_structure(run_stages):
@@ -19,70 +26,41 @@ class filter_beta_structure(run_stages):
     # Rfactor (working value) below the user-specified cutoff values.
     # (Recommended: resolution < 1.6 Angstroms, Rfactor (working value) < 0.20)
     def resn_rfac_filter(self, domain_df):
-        unprocessed_list_1 = []
-        unprocessed_list_2 = []
-        processed_list = []
-        resolution_list = []
-        rfactor_list = []
-
-        for row in range(domain_df.shape[0]):
-            print('Obtaining header information for {}'.format(domain_df['PDB_CODE'][row]))
-            print('{:0.2f}%'.format(((row+1)/domain_df.shape[0])*100))
-
-            middle_characters = domain_df['PDB_CODE'][row][1:3]
-
-            header_pdb_lines = []
-            try:
-                with open('{}{}/{}.pdb'.format(self.pdb_au_database, middle_characters,
-                                               domain_df['PDB_CODE'][row]), 'r') as pdb_file:
-                    remark_end = False
-                    for line in pdb_file:
-                        if (line.replace(' ', ''))[0:7] == 'REMARK4':
-                            remark_end = True
-
-                        if remark_end is True:
-                            break
-                        else:
-                            header_pdb_lines.append(line)
-            except FileNotFoundError:
-                unprocessed_list_1.append(domain_df['PDB_CODE'][row])
-
-            resolution = 0
-            rfactor = 0
-            for line in header_pdb_lines:
-                whitespace_remv_line = line.replace(' ', '')
-                if whitespace_remv_line.startswith('EXPDTA'):
-                    if not any(x in whitespace_remv_line for x in ['XRAYDIFFRACTION', 'X-RAYDIFFRACTION']):
-                        unprocessed_list_2.append(domain_df['PDB_CODE'][row])
-                        break
-                elif (whitespace_remv_line.startswith('REMARK2')
-                      and 'ANGSTROM' in whitespace_remv_line
-                      ):
-                    try:
-                        resolution = float(line[23:30])
-                    except ValueError:
-                        resolution = 0
-                        break
-                elif whitespace_remv_line.startswith('REMARK3RVALUE'):
-                    if any(x in whitespace_remv_line for x in ['(WORKINGSET)', '(WORKINGSET,NOCUTOFF)']):
-                        rfactor = whitespace_remv_line.split(':')
-                        try:
-                            rfactor = float(rfactor[len(rfactor)-1])
-                            break
-                        except ValueError:
-                            rfactor = 0
+        # Looks up the experimental method, resolution and Rfactor of each PDB
+        # code in the persistent index of PDB header information (which only
+        # reads the headers of PDB files that are new or have changed since
+        # the index was last updated, spread across the user-specified number
+        # of worker processes), then joins this information onto the domain
+        # dataframe
+        header_index = pdb_header_index(
+            self.cache_dir, self.pdb_au_database, self.workers
+        )
+        header_df = header_index.lookup(domain_df['PDB_CODE'].tolist())
+        header_index.close()
+        header_df = domain_df[['PDB_CODE']].merge(
+            header_df, how='left', on='PDB_CODE'
+        )
 
-            if resolution == 0 or rfactor == 0:
-                unprocessed_list_2.append(domain_df['PDB_CODE'][row])
-            elif resolution <= self.resn and rfactor <= self.rfac:
-                processed_list.append(domain_df['PDB_CODE'][row])
-                resolution_list.append(resolution)
-                rfactor_list.append(rfactor)
+        not_found = ~header_df['FOUND']
+        failed = (
+              header_df['NOT_XRAY']
+            | (header_df['RESOLUTION'] == 0)
+            | (header_df['RFACTOR'] == 0)
+        )
+        processed = (
+              ~failed
+            & (header_df['RESOLUTION'] <= self.resn)
+            & (header_df['RFACTOR'] <= self.rfac)
+        )
+        unprocessed_list_1 = header_df['PDB_CODE'][not_found].tolist()
+        unprocessed_list_2 = header_df['PDB_CODE'][failed].tolist()
 
-        filtered_domain_df_part_1 = domain_df[domain_df['PDB_CODE'].isin(processed_list)]
+        filtered_domain_df_part_1 = domain_df[processed.values]
         filtered_domain_df_part_1 = filtered_domain_df_part_1.reset_index(drop=True)
-        filtered_domain_df_part_2 = pd.DataFrame(OrderedDict({'RESOLUTION': resolution_list,
-                                                              'RFACTOR': rfactor_list}))
+        filtered_domain_df_part_2 = pd.DataFrame(OrderedDict({
+            'RESOLUTION': header_df['RESOLUTION'][processed].tolist(),
+            'RFACTOR': header_df['RFACTOR'][processed].tolist()
+        }))
         filtered_domain_df = pd.concat(
             [filtered_domain_df_part_1, filtered_domain_df_part_2], axis=1
         )
@@ -92,7 +70,7 @@ class filter_beta_structure(run_stages):
         with open('Unprocessed_domains.txt', 'w') as unprocessed_file:
             unprocessed_file.write('PDB accession code not in PDB database '
                                    '(downloaded 11/06/2018):\n')
-            unprocessed_list_1 = set(unprocessed_list_1)
+            unprocessed_list_1 = sorted(set(unprocessed_list_1))
             for pdb in unprocessed_list_1:
                 unprocessed_file.write('{}\n'.format(pdb))
 
@@ -100,30 +78,41 @@ class filter_beta_structure(run_stages):
                                    'failed to extract value for resolution OR '
                                    'failed to extract value for Rfactor '
                                    '(working value):\n')
-            unprocessed_list_2 = set(unprocessed_list_2)
+            unprocessed_list_2 = sorted(set(unprocessed_list_2))
             for pdb in unprocessed_list_2:
                 unprocessed_file.write('{}\n'.format(pdb))
         return filtered_domain_df
 
     # Generates list of beta-structure chain entries for sequence redundancy
-    # filtering using the CD-HIT web server
+    # filtering using the CD-HIT web server. If local clustering has been
+    # selected, also clusters the sequences in-process (with CD-HIT-like
+    # settings), writing the representative sequences to CDHIT_output.txt in
+    # the same format as the CD-HIT web server output (so that stage 2 can
+    # be run straight away).
     def gen_cdhit_list(self, filtered_domain_df):
-        fasta = filtered_domain_df['DSEQS'].tolist()
-        domain_ids = filtered_domain_df['DOMAIN_ID'].tolist()
+        # Removes duplicate sequences, retaining the first domain listed with
+        # each sequence
+        unique_seqs = OrderedDict()
+        for domain_id, seq in zip(filtered_domain_df['DOMAIN_ID'].tolist(),
+                                  filtered_domain_df['DSEQS'].tolist()):
+            if not seq in unique_seqs:
+                unique_seqs[seq] = domain_id
 
-        fasta_copy = copy.copy(fasta)
-        fasta_repeat = []
-        for index, seq in enumerate(fasta_copy):
-            if seq in fasta_repeat:
-                fasta[index] = None
-                domain_ids[index] = None
-            elif seq not in fasta_repeat:
-                fasta_repeat.append(seq)
-
-        fasta = [seq for seq in fasta if seq is not None]
-        domain_ids = [domain_id for domain_id in domain_ids if domain_id is not None]
+        fasta = list(unique_seqs.keys())
+        domain_ids = list(unique_seqs.values())
 
         with open('CDHIT_entries.txt', 'w') as chain_entries_file:
             for num in range(len(fasta)):
                 chain_entries_file.write('>{}\n'.format(domain_ids[num]))
                 chain_entries_file.write('{}\n'.format(fasta[num]))
+
+        if self.local_clustering is True:
+            print('Clustering {} sequences at {} sequence identity'.format(
+                len(fasta), self.cluster_identity
+            ))
+            clusters = cluster_sequences(
+                domain_ids, fasta, self.cluster_identity, self.cluster_word_length
+            )
+            write_cluster_fasta(
+                'CDHIT_output.txt', clusters, dict(zip(domain_ids, fasta))
+            )
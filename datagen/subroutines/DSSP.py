@@ -5,13 +5,16 @@ import matplotlib.pyplot as plt  # Necessary to make prevent 'Invalid DISPLAY
 # variable' error, don't remove!
 import os
 import shutil
-import copy
-import isambard_dev as isambard
+import numpy as np
 import pandas as pd
 from collections import OrderedDict
 if __name__ == 'subroutines.DSSP':
+    from subroutines.dssp_cache import decode_dssp_records, dssp_result_cache
+    from subroutines.parent_assemblies import parent_assembly_key
     from subroutines.run_stages import run_stages
 else:
+    from datagen.subroutines.dssp_cache import decode_dssp_records, dssp_result_cache
+    from datagen.subroutines.parent_assemblies import parent_assembly_key
     from datagen.subroutines.run_stages import run_stages
 
 
@@ -21,39 +24,66 @@ class beta_structure_dssp_classification(run_stages):
         run_stages.__init__(self, run_parameters)
 
     def extract_dssp_file_lines(self, dssp_domain_df):
-        # Creates dictionary of DSSP file lines for all input PDB accession
-        # codes
+        # Creates dictionary of the DSSP records (decoded into column arrays)
+        # of the residues in each input domain
         unprocessed_list = []
 
         dssp_residues_dict = OrderedDict()
 
+        # DSSP output is obtained (from the DSSP database / cache where
+        # possible) and decoded once per parent assembly, and is retained
+        # until it has been parsed for all of the domains taken from that
+        # assembly
+        dssp_results = dssp_result_cache(
+            self.cache_dir, self.dssp_database, self.dssp_backend
+        )
+        assembly_keys = [parent_assembly_key(domain_id) for domain_id
+                         in dssp_domain_df['DOMAIN_ID'].tolist()]
+        remaining_domains = OrderedDict()
+        for assembly_key in assembly_keys:
+            remaining_domains[assembly_key] = remaining_domains.get(assembly_key, 0) + 1
+        assembly_dssp_columns = OrderedDict()
+
         for row in range(dssp_domain_df.shape[0]):
-            dssp_indv_file_lines = []
             domain_id = dssp_domain_df['DOMAIN_ID'][row]
-
-            print('Running DSSP for {}'.format(domain_id))
-
-            dssp_out = isambard.external_programs.dssp.run_dssp(
-                pdb='Parent_assemblies/{}.pdb'.format(domain_id),
-                path=True, outfile=None
-            )
-            dssp_out = dssp_out.split('\n')
-
-            chain_num_list = copy.copy(dssp_domain_df['CHAIN_NUM'][row])
-            for line in dssp_out:
-                if (line[11:12].strip()+line[5:11].strip()) in chain_num_list:
-                    dssp_indv_file_lines.append(line.strip('\n'))
-                    index = chain_num_list.index(line[11:12].strip()+line[5:11].strip())
-                    chain_num_list[index] = ''
-
-            chain_num_list = [chain_num for chain_num in chain_num_list if chain_num != '']
-            if len(chain_num_list) == 0:
-                dssp_indv_file_lines.append('TER'.ljust(136)+'\n')  # Extra line
-                # enables strand numbering method in following function
-                dssp_residues_dict[domain_id] = dssp_indv_file_lines
-            elif len(chain_num_list) > 0:
+            assembly_key = assembly_keys[row]
+
+            if not assembly_key in assembly_dssp_columns:
+                print('Obtaining DSSP output for {}'.format(domain_id))
+                dssp_out = dssp_results.get_dssp_output(
+                    'Parent_assemblies/{}.pdb'.format(domain_id), assembly_key
+                )
+                dssp_columns = decode_dssp_records(dssp_out)
+                # Numbers the repeat occurrences of each RES_ID (e.g. in
+                # assemblies containing multiple copies of a chain)
+                res_id_series = pd.Series(dssp_columns['RES_ID'])
+                occurrences = res_id_series.groupby(res_id_series).cumcount().values
+                assembly_dssp_columns[assembly_key] = (dssp_columns, occurrences)
+            dssp_columns, occurrences = assembly_dssp_columns[assembly_key]
+            remaining_domains[assembly_key] -= 1
+            if remaining_domains[assembly_key] == 0:
+                del assembly_dssp_columns[assembly_key]
+
+            # Selects the first DSSP record of each residue listed in the
+            # domain (the first n records if a RES_ID is listed n times),
+            # in the order in which they are listed in the DSSP output
+            chain_num_list = dssp_domain_df['CHAIN_NUM'][row]
+            required = pd.Series(chain_num_list, dtype=object).value_counts()
+            required = required.reindex(dssp_columns['RES_ID']).fillna(0).values
+            mask = occurrences < required
+
+            if np.count_nonzero(mask) == len(chain_num_list):
+                dssp_residues_dict[domain_id] = OrderedDict(
+                    (column, values[mask]) for column, values in dssp_columns.items()
+                )
+            else:
                 unprocessed_list.append(domain_id)
 
+        print('DSSP output obtained from: {}'.format(
+            ', '.join('{} {}'.format(source, count) for source, count
+                      in dssp_results.counts.items())
+        ))
+
         # Writes PDB accession codes that could not be processed to output file
         with open('Unprocessed_domains.txt', 'a') as unprocessed_file:
             unprocessed_file.write('\n\nError in DSSP run:\n')
@@ -74,107 +104,91 @@ class beta_structure_dssp_classification(run_stages):
         dssp_to_pdb_dict = OrderedDict()
 
         for index_1, domain_id in enumerate(list(dssp_residues_dict.keys())):
-            dssp_indv_file_lines = dssp_residues_dict[domain_id]
+            dssp_columns = dssp_residues_dict[domain_id]
             pdb_df = all_atoms_dfs_dict[domain_id]
-            dssp_to_pdb_dict[domain_id] = OrderedDict()
 
             print('Generating dataframe summarising DSSP info for {}'.format(domain_id))
             print('{:0.2f}%'.format(((index_1+1)/len(list(dssp_residues_dict.keys())))*100))
 
-            chain_res_num = []
-            dssp_num = []
+            chain_res_num = dssp_columns['RES_ID'].tolist()
+            dssp_num = dssp_columns['DSSP_NUM'].astype(str).tolist()
+            dssp_to_pdb_dict[domain_id] = OrderedDict(zip(dssp_num, chain_res_num))
+
+            # Numbers the strands (= runs of consecutive residues assigned as
+            # 'E', not interrupted by a chain break) in the order in which
+            # they are listed in the DSSP output
+            strand_mask = dssp_columns['SEC_STRUCT'] == 'E'
+            strand_starts = strand_mask & ~np.append(False, (
+                strand_mask[:-1] & (np.diff(dssp_columns['SEGMENT']) == 0)
+            ))
+            strand_nums = np.cumsum(strand_starts)
+
+            # Converts the ladder labels into strand orientations (uppercase
+            # => antiparallel strands, lowercase => parallel strands)
+            orientations = []
+            for ladder in [dssp_columns['LADDER_1'], dssp_columns['LADDER_2']]:
+                orientations.append(np.where(
+                    ladder == ' ', '', np.where(
+                        np.char.isupper(ladder), 'A', np.where(
+                            np.char.islower(ladder), 'P', ladder
+                        )
+                    )
+                ).tolist())
+            bridge_1 = dssp_columns['BRIDGE_1'].astype(str).tolist()
+            bridge_2 = dssp_columns['BRIDGE_2'].astype(str).tolist()
+
             sec_struct_assignment = []
-            strand_number = 1
             strand_number_list = []
             sheet_number_list = []
             orientation_list = []
             bridge_pair_list = []
-            lines = []
-
-            # Extracts secondary structure information from the DSSP file lines
-            for index_2, line in enumerate(dssp_indv_file_lines):
-                if not line.startswith('TER'):
-                    res_id = line[11:12].strip() + line[5:11].replace(' ', '')
-                    dssp_to_pdb_dict[domain_id][line[0:5].strip()] = res_id
-
-                    chain_res_num.append(res_id)
-                    dssp_num.append(line[0:5].strip())
-                    secondary_structure = line[16:17]
-                    lines.append(line.strip('\n'))
-                    if secondary_structure == 'E':
-                        sec_struct_assignment.append(secondary_structure)
-                        strand_number_list.append(strand_number)
-                        if dssp_indv_file_lines[index_2+1][16:17] != 'E':
-                            strand_number = strand_number + 1
-                        sheet_number_list.append(line[33:34])
-                        ladder_1 = line[23:24]
-                        if ladder_1 == ' ':
-                            ladder_1 = ''
-                        elif ladder_1.isupper():  # Uppercase => antiparallel strands
-                            ladder_1 = 'A'
-                        elif ladder_1.islower():  # Lowercase => parallel strands
-                            ladder_1 = 'P'
-                        ladder_2 = line[24:25]
-                        if ladder_2 == ' ':
-                            ladder_2 = ''
-                        elif ladder_2.isupper():  # Uppercase => antiparallel strands
-                            ladder_2 = 'A'
-                        elif ladder_2.islower():  # Lowercase => parallel strands
-                            ladder_2 = 'P'
-                        orientation_list.append([ladder_1, ladder_2])
-                        bridge_pair_list.append([line[25:29].strip(),
-                                                 line[29:33].strip()])
-                    elif secondary_structure != 'E':
-                        sec_struct_assignment.append('')
-                        strand_number_list.append('')
-                        sheet_number_list.append('')
-                        orientation_list.append(['', ''])
-                        bridge_pair_list.append(['', ''])
-
-            # Initialises lists of additional properties extracted from the
-            # DSSP file lines to be appended to the dataframe of PDB information
-            # (created by extract_beta_structure_coords.get_xyz_coords function)
+            for index_2, strand in enumerate(strand_mask.tolist()):
+                if strand:
+                    sec_struct_assignment.append('E')
+                    strand_number_list.append(int(strand_nums[index_2]))
+                    sheet_number_list.append(dssp_columns['SHEET'][index_2])
+                    orientation_list.append([orientations[0][index_2],
+                                             orientations[1][index_2]])
+                    bridge_pair_list.append([bridge_1[index_2], bridge_2[index_2]])
+                else:
+                    sec_struct_assignment.append('')
+                    strand_number_list.append('')
+                    sheet_number_list.append('')
+                    orientation_list.append(['', ''])
+                    bridge_pair_list.append(['', ''])
+
+            # Joins the DSSP info (= per-residue) onto the CA rows of the PDB
+            # info (= per-atom) by RES_ID (the first DSSP line listed for each
+            # RES_ID is taken). All other rows, plus CA rows without a
+            # matching DSSP line, are filled with ''.
+            dssp_res_df = pd.DataFrame(OrderedDict({'RES_ID': chain_res_num,
+                                                    'DSSP_NUM': dssp_num,
+                                                    'SHEET?': sec_struct_assignment,
+                                                    'STRAND_NUM': strand_number_list,
+                                                    'SHEET_NUM': sheet_number_list,
+                                                    'ORIENTATION': orientation_list,
+                                                    'BRIDGE_PAIRS': bridge_pair_list}))
+            dssp_res_df = dssp_res_df.drop_duplicates(subset='RES_ID', keep='first')
+            dssp_res_df = dssp_res_df.set_index('RES_ID')
+
             row_num = pdb_df.shape[0]
-            dssp_num_extnd_df = ['']*row_num
-            sec_struct_assignment_extnd_df = ['']*row_num
-            strand_number_list_extnd_df = ['']*row_num
-            sheet_number_list_extnd_df = ['']*row_num
-            orientation_list_extnd_df = ['']*row_num
-            bridge_pair_list_extnd_df = ['']*row_num
-            lines_extnd_df = ['']*row_num
-
-            # Fills lists created in the previous step
-            for row in range(row_num):
-                if pdb_df['ATMNAME'][row] == 'CA':  # All DSSP info
-                    # (= per-residue) appended to the CA rows of the PDB info
-                    # (= per-atom)
-                    for index_3, value in enumerate(chain_res_num):
-                        if pdb_df['RES_ID'][row] == chain_res_num[index_3]:
-                            dssp_num_extnd_df[row] = dssp_num[index_3]
-                            sec_struct_assignment_extnd_df[row] = sec_struct_assignment[index_3]
-                            strand_number_list_extnd_df[row] = strand_number_list[index_3]
-                            sheet_number_list_extnd_df[row] = sheet_number_list[index_3]
-                            orientation_list_extnd_df[row] = orientation_list[index_3]
-                            bridge_pair_list_extnd_df[row] = bridge_pair_list[index_3]
-                            lines_extnd_df[row] = lines[index_3]
-                            break
+            ca_rows = np.nonzero((pdb_df['ATMNAME'] == 'CA').values)[0]
+            ca_dssp_df = pdb_df[['RES_ID']].iloc[ca_rows].join(dssp_res_df, on='RES_ID')
+            matched = ca_dssp_df['DSSP_NUM'].notnull().values
 
-            # Appends DSSP info to dataframe of PDB info
-            dssp_df = pd.DataFrame(OrderedDict({'DSSP_FILE_LINES': lines_extnd_df,
-                                                'DSSP_NUM': dssp_num_extnd_df,
-                                                'SHEET?': sec_struct_assignment_extnd_df,
-                                                'STRAND_NUM': strand_number_list_extnd_df,
-                                                'SHEET_NUM': sheet_number_list_extnd_df,
-                                                'ORIENTATION': orientation_list_extnd_df,
-                                                'BRIDGE_PAIRS': bridge_pair_list_extnd_df}))
+            dssp_df = OrderedDict()
+            for column in dssp_res_df.columns:
+                values = np.full(row_num, '', dtype=object)
+                values[ca_rows[matched]] = ca_dssp_df[column].values[matched]
+                dssp_df[column] = values
+            dssp_df = pd.DataFrame(dssp_df)
 
+            # Appends DSSP info to dataframe of PDB info
             extnd_df = pd.concat([pdb_df, dssp_df], axis=1)
             all_atoms_dfs_dict[domain_id] = extnd_df
 
-            retained_res = extnd_df[extnd_df['SHEET?'] == 'E']['RES_ID'].tolist()
-            for row in range(extnd_df.shape[0]):
-                if extnd_df['RES_ID'][row] not in retained_res:
-                    extnd_df.loc[row, 'REC'] = None
+            retained_res = extnd_df[extnd_df['SHEET?'] == 'E']['RES_ID']
+            extnd_df.loc[~extnd_df['RES_ID'].isin(retained_res), 'REC'] = None
             filtered_extnd_df = extnd_df[extnd_df['REC'].notnull()]
             filtered_extnd_df = filtered_extnd_df.reset_index(drop=True)
             filtered_extnd_df.to_pickle(
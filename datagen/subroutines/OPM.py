@@ -1,6 +1,7 @@
 
+import os
+import pickle
 import pandas as pd
-import networkx as nx
 import numpy as np
 from collections import OrderedDict
 if __name__ == 'subroutines.OPM':
@@ -9,6 +10,51 @@ else:
     from datagen.subroutines.run_stages import run_stages
 
 
+class opm_tm_index():
+
+    def __init__(self):
+        # Maps PDB code -> chain -> (tilt angle, sorted TM residue ranges)
+        self.pdb_codes = OrderedDict()
+
+    def add_chain(self, pdb_code, chain, tilt_angle, tm_ranges):
+        # Adds the TM segments of a chain listed in OPM_TM_subunits.txt. The
+        # ranges are stored as sorted arrays of start and stop residue numbers
+        # (merging any ranges listed for the chain on an earlier line).
+        chains = self.pdb_codes.setdefault(pdb_code, OrderedDict())
+        if chain in chains:
+            tm_ranges = tm_ranges + list(zip(chains[chain]['STARTS'],
+                                             chains[chain]['STOPS']))
+            tilt_angle = chains[chain]['TILT_ANGLE']
+        tm_ranges = sorted(tm_ranges)
+
+        chains[chain] = OrderedDict({
+            'TILT_ANGLE': tilt_angle,
+            'STARTS': np.array([tm_range[0] for tm_range in tm_ranges]),
+            'STOPS': np.maximum.accumulate(
+                np.array([tm_range[1] for tm_range in tm_ranges])
+            )
+        })
+
+    def get_tilt_angle(self, pdb_code):
+        # Returns the tilt angle listed for the (first chain listed of the)
+        # input PDB code, or None if the PDB code is not in the OPM database
+        if not pdb_code in self.pdb_codes:
+            return None
+        return list(self.pdb_codes[pdb_code].values())[0]['TILT_ANGLE']
+
+    def is_tm_residue(self, pdb_code, chain, res_num):
+        # Determines whether the input residue lies within a TM segment, via a
+        # binary search for the last segment starting at or before the residue
+        # (the stop values are the running maxima of the segment ends, so also
+        # cover overlapping segments)
+        try:
+            tm_ranges = self.pdb_codes[pdb_code][chain]
+        except KeyError:
+            return False
+        index = np.searchsorted(tm_ranges['STARTS'], res_num, side='right') - 1
+        return bool(index >= 0 and tm_ranges['STOPS'][index] >= res_num)
+
+
 class extract_barrel_info_from_OPM(run_stages):
 
     def __init__(self, run_parameters):
@@ -16,76 +62,72 @@ class extract_barrel_info_from_OPM(run_stages):
 
     def parse_opm(self, orig_dir):
         # Extracts strand tilt and TM information from the OPM database
-        # (docs/OPM_TM_subunits.txt)
-        pdb_codes = []
-        chains = []
-        tilt_angles = []
-        tm_lists = []
-        tm_segment_lists = []
-
-        print('Creating datframe of OPM database information')
-
-        with open('{}/docs/OPM_TM_subunits.txt'.format(orig_dir), 'r') as opm_file:
+        # (docs/OPM_TM_subunits.txt) into an interval index. The parsed index
+        # is pickled alongside OPM_TM_subunits.txt, and is only regenerated if
+        # OPM_TM_subunits.txt has changed since it was last parsed.
+        opm_path = '{}/docs/OPM_TM_subunits.txt'.format(orig_dir)
+        index_path = '{}/docs/OPM_TM_subunits_index.pkl'.format(orig_dir)
+        stat = os.stat(opm_path)
+        source = (stat.st_mtime_ns, stat.st_size)
+
+        if os.path.isfile(index_path):
+            try:
+                with open(index_path, 'rb') as pickle_file:
+                    index_source, pdb_codes = pickle.load(pickle_file)
+                if index_source == source:
+                    opm_index = opm_tm_index()
+                    opm_index.pdb_codes = pdb_codes
+                    return opm_index
+            except (pickle.UnpicklingError, EOFError, ValueError):
+                pass
+
+        print('Creating interval index of OPM database information')
+
+        opm_index = opm_tm_index()
+        with open(opm_path, 'r') as opm_file:
             for line in opm_file:
                 line_segments = line.split('-')
 
-                pdb_codes.append(line_segments[0][0:4])
-
+                pdb_code = line_segments[0][0:4]
                 chain = line_segments[0][4:].strip()
-                chains.append(chain)
 
                 tilt_angle = line_segments[1].replace('Tilt:', '')
                 tilt_angle = tilt_angle.replace('°', '')
-                tilt_angles.append(tilt_angle.strip())
+                tilt_angle = tilt_angle.strip()
 
                 tm_segments = '-'.join(line_segments[2:])
                 tm_segments = tm_segments.replace('Segments:', '')
                 tm_segments = tm_segments.split(',')
-                tm_segment_lists.append(tm_segments)
 
-                tm_residues = []
+                tm_ranges = []
                 for segment in tm_segments:
-                    tm_range = ''
-                    start = False
-                    stop = False
-                    for char in list(segment):
-                        if char == ')':
-                            stop = True
-
-                        if start is True and stop is False:
-                            tm_range += char
-
-                        if char == '(':
-                            start = True
-
+                    tm_range = segment.split('(')[1].split(')')[0]
                     res_min = int(tm_range.split('-')[0])
                     res_max = int(tm_range.split('-')[1])
-                    tm_residues += [chain+str(num) for num in
-                                    range(res_min, res_max+1)]  # No insertion
-                    # code available in OPM_TM_subunits.txt
-                tm_lists.append(tm_residues)
+                    tm_ranges.append((res_min, res_max))  # No insertion code
+                    # available in OPM_TM_subunits.txt
+
+                opm_index.add_chain(pdb_code, chain, tilt_angle, tm_ranges)
 
-        opm_df = pd.DataFrame(OrderedDict({'PDB_CODE': pdb_codes,
-                                           'CHAIN': chains,
-                                           'TILT_ANGLE': tilt_angles,
-                                           'TM_RANGE': tm_lists,
-                                           'SEGMENTS': tm_segment_lists}))
+        try:
+            with open(index_path, 'wb') as pickle_file:
+                pickle.dump((source, opm_index.pdb_codes), pickle_file)
+        except OSError:
+            print('Unable to save OPM index to {}'.format(index_path))
 
-        return opm_df
+        return opm_index
 
-    def find_strand_tilt(self, sec_struct_dfs_dict, opm_df):
+    def find_strand_tilt(self, sec_struct_dfs_dict, opm_index):
         # Determines strand tilt
-        pdb_codes_list = opm_df['PDB_CODE'].tolist()
         tilt_angles = OrderedDict()
 
         for domain_id in list(sec_struct_dfs_dict.keys()):
             print('Calculating tilt angle for {}'.format(domain_id))
 
             pdb_code = domain_id[0:4]
+            tilt_angle = opm_index.get_tilt_angle(pdb_code)
 
-            if pdb_code in pdb_codes_list:
-                index = pdb_codes_list.index(pdb_code)
-                tilt_angle = opm_df['TILT_ANGLE'][index]
+            if tilt_angle is not None:
                 tilt_angles[domain_id] = tilt_angle
             else:
                 tilt_angles[domain_id] = 'Undefined'
@@ -5,8 +5,10 @@ import pandas as pd
 import isambard_dev as isambard
 from collections import OrderedDict
 if __name__ == 'subroutines.RING':
+    from subroutines.parent_assemblies import parent_assembly_key
     from subroutines.run_stages import run_stages
 else:
+    from datagen.subroutines.parent_assemblies import parent_assembly_key
     from datagen.subroutines.run_stages import run_stages
 
 
@@ -17,17 +19,30 @@ class calculate_residue_interaction_network(run_stages):
 
     def run_RING(self, sec_struct_dfs_dict):
         # Runs RING on the parent structure (biological assembly / asymmetric
-        # unit, as specified by the user)
+        # unit, as specified by the user). RING is run once per parent
+        # assembly, with the output file of each domain linked to that of its
+        # parent assembly.
         if not os.path.isdir('ring'):
             os.mkdir('ring')
         for domain_id in list(sec_struct_dfs_dict.keys()):
             if not os.path.isfile('ring/{}.ring'.format(domain_id)):
-                print('Running RING for {}'.format(domain_id))
-                os.system(
-                    '/opt/ring/bin/Ring -i Parent_assemblies/{}.pdb --all -n lollipop -g 1 --all_edges > ring/{}.ring'.format(
-                        domain_id, domain_id
+                assembly_key = parent_assembly_key(domain_id)
+                if assembly_key == domain_id:
+                    ring_file = 'ring/{}.ring'.format(domain_id)
+                else:
+                    ring_file = 'ring/Assemblies/{}.ring'.format(assembly_key)
+                    if not os.path.isdir('ring/Assemblies'):
+                        os.mkdir('ring/Assemblies')
+
+                if not os.path.isfile(ring_file):
+                    print('Running RING for {}'.format(domain_id))
+                    os.system(
+                        '/opt/ring/bin/Ring -i Parent_assemblies/{}.pdb --all -n lollipop -g 1 --all_edges > {}'.format(
+                            domain_id, ring_file
+                        )
                     )
-                )
+                if ring_file != 'ring/{}.ring'.format(domain_id):
+                    os.link(ring_file, 'ring/{}.ring'.format(domain_id))
 
     def parse_RING_output(self, sec_struct_dfs_dict, domain_sheets_dict):
         # Appends residue interaction network information to dssp_df.
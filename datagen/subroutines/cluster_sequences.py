@@ -0,0 +1,118 @@
+import math
+from collections import Counter, OrderedDict
+
+# Greedy incremental clustering of protein sequences following the approach
+# of CD-HIT (Li & Godzik, Bioinformatics, 2006): sequences are processed from
+# longest to shortest, and each sequence either joins the cluster of the
+# first representative sequence it matches at or above the identity
+# threshold, or else becomes the representative of a new cluster. Sequence
+# identity is calculated as the number of identical aligned residues divided
+# by the length of the shorter sequence, and pairs of sequences are only
+# aligned if they share enough short words (k-mers) to possibly reach the
+# identity threshold.
+
+
+def count_words(seq, word_length):
+    # Counts the occurrences of each word (k-mer) of the input length in the
+    # input sequence
+    return Counter(seq[i:i+word_length] for i in range(len(seq)-word_length+1))
+
+
+def min_shared_words(length, identity, word_length):
+    # Calculates the minimum number of words that a sequence of the input
+    # length must share with another sequence for the two to be able to align
+    # at the identity threshold (each mismatched residue can disrupt up to
+    # word_length words)
+    mismatches = math.ceil(round((1-identity)*length, 6))
+    return length - word_length + 1 - mismatches*word_length
+
+
+def count_identical_residues(short_seq, long_seq, max_gap):
+    # Aligns the shorter sequence to the longer sequence (without gap
+    # penalties), returning the maximum number of identical aligned residues.
+    # The alignment is restricted to a band of diagonals spanning every
+    # possible offset of the shorter sequence within the longer sequence,
+    # extended by max_gap in either direction.
+    short_len = len(short_seq)
+    long_len = len(long_seq)
+    min_diag = -max_gap
+    max_diag = long_len - short_len + max_gap
+
+    prev_row = [0]*(long_len+1)
+    for i in range(1, short_len+1):
+        row = [0]*(long_len+1)
+        j_min = max(1, i + min_diag)
+        j_max = min(long_len, i + max_diag)
+        res = short_seq[i-1]
+        for j in range(j_min, j_max+1):
+            if res == long_seq[j-1]:
+                row[j] = prev_row[j-1] + 1
+            elif prev_row[j] > row[j-1]:
+                row[j] = prev_row[j]
+            else:
+                row[j] = row[j-1]
+        for j in range(j_max+1, long_len+1):
+            row[j] = row[j_max]
+        prev_row = row
+
+    return prev_row[long_len]
+
+
+def cluster_sequences(seq_ids, seqs, identity=0.9, word_length=5):
+    # Clusters the input sequences, returning an ordered dictionary of the id
+    # of each representative sequence (in the order in which the
+    # representatives were selected, i.e. longest first) and the ids of the
+    # sequences in its cluster
+    order = sorted(range(len(seqs)), key=lambda index: -len(seqs[index]))
+
+    clusters = OrderedDict()
+    rep_seqs = []
+    rep_ids = []
+    word_index = {}  # Word: list of (representative, word count)
+    for index in order:
+        seq = seqs[index]
+        seq_len = len(seq)
+        words = count_words(seq, word_length)
+        min_words = min_shared_words(seq_len, identity, word_length)
+
+        # Shortlists representatives sharing enough words with the sequence
+        if min_words > 0:
+            shared_words = Counter()
+            for word, count in words.items():
+                for rep, rep_count in word_index.get(word, []):
+                    shared_words[rep] += min(count, rep_count)
+            candidates = sorted(rep for rep, count in shared_words.items()
+                                if count >= min_words)
+        else:
+            candidates = range(len(rep_seqs))
+
+        min_identical = math.ceil(round(identity*seq_len, 6))
+        max_gap = seq_len - min_identical
+        cluster = None
+        for rep in candidates:
+            if seq == rep_seqs[rep] or count_identical_residues(
+                seq, rep_seqs[rep], max_gap
+            ) >= min_identical:
+                cluster = rep
+                break
+
+        if cluster is None:
+            for word, count in words.items():
+                word_index.setdefault(word, []).append((len(rep_seqs), count))
+            rep_seqs.append(seq)
+            rep_ids.append(seq_ids[index])
+            clusters[seq_ids[index]] = [seq_ids[index]]
+        else:
+            clusters[rep_ids[cluster]].append(seq_ids[index])
+
+    return clusters
+
+
+def write_cluster_fasta(file_name, clusters, seq_dict):
+    # Writes the representative sequences of the input clusters to a FASTA
+    # file, in the same format as the sequences output from the CD-HIT web
+    # server
+    with open(file_name, 'w') as fasta_file:
+        for rep_id in clusters.keys():
+            fasta_file.write('>{}\n'.format(rep_id))
+            fasta_file.write('{}\n'.format(seq_dict[rep_id]))
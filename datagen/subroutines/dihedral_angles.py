@@ -4,8 +4,10 @@ import isambard_dev as isambard
 from collections import OrderedDict
 if __name__ == 'subroutines.dihedral_angles':
     from subroutines.run_stages import run_stages
+    from subroutines.structure_cache import convert_pdb_to_ampal
 else:
     from datagen.subroutines.run_stages import run_stages
+    from datagen.subroutines.structure_cache import convert_pdb_to_ampal
 
 
 class calc_torsion_angles():
@@ -133,7 +135,7 @@ class dihedral_angles(run_stages):
             dssp_df = sec_struct_dfs_dict[domain_id]
 
             # Creates AMPAL object
-            pdb = isambard.ampal.convert_pdb_to_ampal(
+            pdb = convert_pdb_to_ampal(
                 'Beta_strands/{}.pdb'.format(domain_id)
             )
 
@@ -0,0 +1,233 @@
+import gzip
+import json
+import os
+import shutil
+import subprocess
+import numpy as np
+from collections import OrderedDict
+if __name__ == 'subroutines.dssp_cache':
+    from subroutines.dssp_engine import dssp_engine_version, run_dssp_engine
+    from subroutines.parse_pdb import (
+        convert_numeric, decode_strings, open_pdb_file, slice_columns
+    )
+    from subroutines.parent_assemblies import hash_pdb_file
+else:
+    from datagen.subroutines.dssp_engine import dssp_engine_version, run_dssp_engine
+    from datagen.subroutines.parse_pdb import (
+        convert_numeric, decode_strings, open_pdb_file, slice_columns
+    )
+    from datagen.subroutines.parent_assemblies import hash_pdb_file
+
+# Fixed-width column boundaries of the fields in the residue lines of DSSP
+# output used by the DataGen pipeline
+dssp_record_fields = OrderedDict({'DSSP_NUM': (0, 5),
+                                  'RESNUM': (5, 10),
+                                  'INSCODE': (10, 11),
+                                  'CHAIN': (11, 12),
+                                  'BREAK': (13, 14),
+                                  'SEC_STRUCT': (16, 17),
+                                  'LADDER_1': (23, 24),
+                                  'LADDER_2': (24, 25),
+                                  'BRIDGE_1': (25, 29),
+                                  'BRIDGE_2': (29, 33),
+                                  'SHEET': (33, 34)})
+dssp_int_fields = ['DSSP_NUM', 'RESNUM', 'BRIDGE_1', 'BRIDGE_2']
+
+
+def decode_dssp_records(dssp_out):
+    # Decodes the residue lines of DSSP output (input as a string) into a
+    # dictionary of column arrays in a single pass. String fields are
+    # stripped of whitespace (except for the ladder labels, which are case
+    # sensitive, so are left as ' ' where blank) and the DSSP / residue /
+    # bridge partner numbers are converted into integers. Chain break lines
+    # (marked with '!') and blank lines are dropped. The RES_ID (= chain +
+    # residue number + insertion code) of each residue is listed, along with
+    # its SEGMENT (= the number of chain breaks that precede it).
+    dssp_bytes = dssp_out.encode('utf-8', 'replace')
+    header = dssp_bytes.find(b'  #  RESIDUE')
+    if header == -1:
+        lines = []
+    else:
+        lines = dssp_bytes[header:].splitlines()[1:]
+    if len(lines) == 0:
+        lines = np.array([], dtype='S34')
+    else:
+        lines = np.array(lines)
+
+    # Pads (with spaces) / truncates every line to 34 characters, then views
+    # the lines as an (n x 34) array of bytes from which each field is sliced
+    fixed_width = lines.astype('S34').view(np.uint8).reshape(-1, 34).copy()
+    fixed_width[fixed_width == 0] = 32
+    chain_breaks = fixed_width[:, 13] == ord('!')
+    segments = np.cumsum(chain_breaks)
+    residue_mask = ~chain_breaks & (fixed_width[:, 0:5] != 32).any(axis=1)
+    fixed_width = fixed_width[residue_mask]
+
+    dssp_columns = OrderedDict()
+    for field, (start, stop) in dssp_record_fields.items():
+        values = slice_columns(fixed_width, start, stop)
+        if field in dssp_int_fields:
+            column = convert_numeric(values, int, 0)
+        elif field in ['LADDER_1', 'LADDER_2']:
+            column = decode_strings(values)
+        else:
+            column = decode_strings(np.char.strip(values))
+        dssp_columns[field] = column
+    del dssp_columns['BREAK']
+
+    dssp_columns['RES_ID'] = decode_strings(np.char.replace(np.char.add(
+        slice_columns(fixed_width, 11, 12), slice_columns(fixed_width, 5, 11)
+    ), b' ', b''))
+    dssp_columns['SEGMENT'] = segments[residue_mask]
+
+    return dssp_columns
+
+
+def find_dssp_database_file(dssp_database, pdb_code):
+    # Returns the path of the precomputed DSSP file of the input PDB code in
+    # the local DSSP database (either a flat directory or divided into
+    # subdirectories by the middle two characters of the PDB code, as for the
+    # PDB database, with the files optionally gzipped), else None if the PDB
+    # code is not in the database
+    for directory in ['{}{}/'.format(dssp_database, pdb_code[1:3]), dssp_database]:
+        for file_name in ['{}.dssp'.format(pdb_code), '{}.dssp'.format(pdb_code.upper())]:
+            for dssp_path in ['{}{}'.format(directory, file_name),
+                              '{}{}.gz'.format(directory, file_name)]:
+                if os.path.isfile(dssp_path):
+                    return dssp_path
+
+    return None
+
+
+def find_dssp_program():
+    # Returns the path of the DSSP program run by ISAMBARD
+    try:
+        import isambard_dev as isambard
+        dssp_path = isambard.settings.global_settings['dssp']['path']
+    except (ImportError, AttributeError, KeyError, TypeError):
+        dssp_path = 'mkdssp'
+
+    if not os.path.isfile(dssp_path):
+        dssp_path = shutil.which(dssp_path)
+
+    return dssp_path
+
+
+def get_dssp_version(cache_dir):
+    # Determines the version of the DSSP program. The version reported by
+    # the program is cached against the path, modification time and size of
+    # the program file, so that DSSP is only run to check its version when
+    # the program has changed.
+    dssp_path = find_dssp_program()
+    if dssp_path is None:
+        return 'unknown'
+
+    stat = os.stat(dssp_path)
+    key = '{}:{}:{}'.format(os.path.realpath(dssp_path), stat.st_mtime_ns,
+                            stat.st_size)
+    versions_path = '{}DSSP_cache/dssp_versions.json'.format(cache_dir)
+    versions = {}
+    if os.path.isfile(versions_path):
+        try:
+            with open(versions_path, 'r') as versions_file:
+                versions = json.load(versions_file)
+        except ValueError:
+            versions = {}
+    if key in versions:
+        return versions[key]
+
+    try:
+        version_out = subprocess.run(
+            [dssp_path, '--version'], stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT, timeout=60
+        ).stdout.decode('utf-8', 'replace')
+        version = [word for word in version_out.split() if word[0:1].isdigit()]
+        version = version[0] if version != [] else 'unknown'
+    except (OSError, subprocess.SubprocessError):
+        version = 'unknown'
+
+    versions[key] = version
+    with open(versions_path, 'w') as versions_file:
+        json.dump(versions, versions_file)
+
+    return version
+
+
+class dssp_result_cache():
+
+    def __init__(self, cache_dir, dssp_database='', backend='dssp'):
+        # Obtains the DSSP output for parent assemblies from (in order of
+        # preference) the precomputed DSSP files in the local DSSP database,
+        # the persistent cache of DSSP output (keyed by the hash of the
+        # contents of the parent assembly PDB file and the DSSP version)
+        # stored in the cache directory, or else a fresh run of DSSP (either
+        # the DSSP program or the in-process NumPy implementation, depending
+        # upon the selected backend)
+        self.dssp_database = dssp_database
+        self.backend = backend
+        self.cache_dir = cache_dir
+        if not os.path.isdir('{}DSSP_cache'.format(cache_dir)):
+            os.mkdir('{}DSSP_cache'.format(cache_dir))
+        self.version = None
+        self.counts = OrderedDict({'database': 0,
+                                   'cache': 0,
+                                   'dssp': 0})
+
+    def get_database_output(self, assembly_key):
+        # Precomputed DSSP files describe the deposited PDB entry, so are only
+        # used for parent assemblies that are asymmetric units
+        if self.dssp_database == '' or not assembly_key.endswith('_assembly_au'):
+            return None
+
+        pdb_code = assembly_key[:-len('_assembly_au')]
+        dssp_path = find_dssp_database_file(self.dssp_database, pdb_code)
+        if dssp_path is None:
+            return None
+
+        with open_pdb_file(dssp_path, 'r') as dssp_file:
+            return dssp_file.read()
+
+    def get_cache_path(self, pdb_path):
+        if self.version is None:
+            if self.backend == 'numpy':
+                self.version = 'numpy-{}'.format(dssp_engine_version)
+            else:
+                self.version = get_dssp_version(self.cache_dir)
+        return '{}DSSP_cache/{}_{}.dssp.gz'.format(
+            self.cache_dir, hash_pdb_file(pdb_path), self.version
+        )
+
+    def get_dssp_output(self, pdb_path, assembly_key):
+        # Returns the DSSP output (as a string) of the input parent assembly
+        dssp_out = self.get_database_output(assembly_key)
+        if dssp_out is not None:
+            self.counts['database'] += 1
+            return dssp_out
+
+        cache_path = self.get_cache_path(pdb_path)
+        if os.path.isfile(cache_path):
+            try:
+                with gzip.open(cache_path, 'rt') as dssp_file:
+                    dssp_out = dssp_file.read()
+                self.counts['cache'] += 1
+                return dssp_out
+            except (OSError, EOFError):
+                pass
+
+        if self.backend == 'numpy':
+            dssp_out = run_dssp_engine(pdb_path)
+        else:
+            import isambard_dev as isambard
+            dssp_out = isambard.external_programs.dssp.run_dssp(
+                pdb=pdb_path, path=True, outfile=None
+            )
+        self.counts['dssp'] += 1
+        # Failed runs aren't cached. The output is written to a temporary
+        # file first, so that an interrupted run can't leave a truncated DSSP
+        # file in the cache.
+        if dssp_out.strip() != '':
+            with gzip.open('{}.tmp'.format(cache_path), 'wt') as dssp_file:
+                dssp_file.write(dssp_out)
+            os.replace('{}.tmp'.format(cache_path), cache_path)
+
+        return dssp_out
@@ -0,0 +1,641 @@
+import sys
+import numpy as np
+from collections import OrderedDict
+if __name__ == 'subroutines.dssp_engine':
+    from subroutines.parse_pdb import decode_pdb_records, open_pdb_file
+    from subroutines.variables import gen_amino_acids_dict
+else:
+    from datagen.subroutines.parse_pdb import decode_pdb_records, open_pdb_file
+    from datagen.subroutines.variables import gen_amino_acids_dict
+
+# In-process implementation of the DSSP secondary structure assignment
+# (Kabsch & Sander, Biopolymers, 1983), following the conventions of DSSP
+# 2.x: backbone hydrogen bond energies, beta-bridges, ladders (including
+# beta-bulges) and sheets, plus helices, turns and bends (which take
+# precedence over / are needed to determine the beta-strand assignment).
+# Output is written in the format of the DSSP program, with the columns up
+# to and including the sheet label filled in (solvent accessibility is not
+# calculated).
+
+# Version of this implementation, used to key its output in the DSSP cache
+# (must be incremented whenever the output of this module changes)
+dssp_engine_version = '1'
+
+coupling_constant = -27.888  # = -332 * 0.42 * 0.2 (kcal/mol)
+min_hbond_energy = -9.9
+max_hbond_energy = -0.5
+min_distance = 0.5
+min_ca_distance = 9.0
+max_peptide_bond_length = 2.5
+helix_flags = {'none': ' ', 'start': '>', 'end': '<', 'start_and_end': 'X'}
+
+
+def read_backbone(pdb_path):
+    # Extracts the N, CA, C and O coordinates of every residue (with a
+    # complete backbone) in the first model of the input PDB file. Residues
+    # are listed in the order in which they appear in the file, and the
+    # first listed position of each backbone atom is taken (i.e. the first
+    # listed alternate conformer).
+    with open_pdb_file(pdb_path, 'rb') as pdb_file:
+        pdb_bytes = pdb_file.read()
+    end = pdb_bytes.find(b'\nENDMDL')
+    if end != -1:
+        pdb_bytes = pdb_bytes[:end+1]
+    pdb_columns = decode_pdb_records(pdb_bytes)
+
+    atom_mask = pdb_columns['REC'] == 'ATOM'
+    res_ids = pdb_columns['RES_ID'][atom_mask]
+    atom_names = pdb_columns['ATMNAME'][atom_mask]
+    xyz = np.stack([pdb_columns['XPOS'][atom_mask], pdb_columns['YPOS'][atom_mask],
+                    pdb_columns['ZPOS'][atom_mask]], axis=1)
+
+    unique_ids, first_indices, res_codes = np.unique(
+        res_ids, return_index=True, return_inverse=True
+    )
+    order = np.argsort(first_indices, kind='stable')
+    rank = np.empty(order.shape[0], dtype=np.int64)
+    rank[order] = np.arange(order.shape[0])
+    res_codes = rank[res_codes]
+    first_indices = first_indices[order]
+
+    backbone = OrderedDict()
+    complete = np.ones(order.shape[0], dtype=bool)
+    for atom_name in ['N', 'CA', 'C', 'O']:
+        atom_indices = np.nonzero(atom_names == atom_name)[0]
+        codes, first = np.unique(res_codes[atom_indices], return_index=True)
+        coords = np.full((order.shape[0], 3), np.nan)
+        coords[codes] = xyz[atom_indices[first]]
+        complete[~np.isin(np.arange(order.shape[0]), codes)] = False
+        backbone[atom_name] = coords
+
+    atom_rows = np.nonzero(atom_mask)[0][first_indices[complete]]
+    residues = OrderedDict({
+        'CHAIN': pdb_columns['CHAIN'][atom_rows],
+        'RESNUM': pdb_columns['RESNUM'][atom_rows],
+        'INSCODE': pdb_columns['INSCODE'][atom_rows],
+        'RESNAME': pdb_columns['RESNAME'][atom_rows]
+    })
+    for atom_name, coords in backbone.items():
+        residues[atom_name] = coords[complete]
+
+    return residues
+
+
+def calc_hydrogen_positions(residues, same_chain):
+    # Places the backbone amide hydrogen of each residue 1 A from its N atom,
+    # in the direction of the C=O bond of the preceding residue in the chain
+    # (the H atom is placed on the N atom for the first residue of each chain,
+    # and for prolines)
+    h_coords = residues['N'].copy()
+    prev_co = residues['C'][:-1] - residues['O'][:-1]
+    prev_co = prev_co / np.linalg.norm(prev_co, axis=1)[:, None]
+    mask = same_chain & (residues['RESNAME'][1:] != 'PRO')
+    h_coords[1:][mask] += prev_co[mask]
+
+    return h_coords
+
+
+def round_energy(energy):
+    # Rounds energies to 3 decimal places, rounding halves away from zero (as
+    # in DSSP)
+    return np.sign(energy)*np.floor(np.abs(energy)*1000 + 0.5)/1000
+
+
+def calc_hbond_energies(residues, h_coords, block_size=500):
+    # Calculates the electrostatic energy of the hydrogen bond from the N-H
+    # group of each donor residue to the C=O group of each acceptor residue
+    # whose C_alpha atom lies within 9 A. Donor / acceptor pairs are
+    # calculated in blocks of donors, to limit memory usage for large
+    # assemblies. Returns the donor and acceptor indices plus the energy of
+    # every pair with a negative energy.
+    ca = residues['CA']
+    num_res = ca.shape[0]
+    is_proline = residues['RESNAME'] == 'PRO'
+
+    donors = []
+    acceptors = []
+    energies = []
+    for start in range(0, num_res, block_size):
+        stop = min(num_res, start+block_size)
+        ca_dist = np.linalg.norm(ca[start:stop, None, :] - ca[None, :, :], axis=2)
+        pair_mask = ca_dist < min_ca_distance
+        donor_range = np.arange(start, stop)
+        # Excludes each residue paired with itself, the pair of each residue
+        # (donor) with its preceding residue (acceptor), and proline donors
+        pair_mask[donor_range-start, donor_range] = False
+        prev_mask = donor_range > 0
+        pair_mask[donor_range[prev_mask]-start, donor_range[prev_mask]-1] = False
+        pair_mask[is_proline[start:stop], :] = False
+
+        donor, acceptor = np.nonzero(pair_mask)
+        donor += start
+        dist_ho = np.linalg.norm(h_coords[donor] - residues['O'][acceptor], axis=1)
+        dist_hc = np.linalg.norm(h_coords[donor] - residues['C'][acceptor], axis=1)
+        dist_nc = np.linalg.norm(residues['N'][donor] - residues['C'][acceptor], axis=1)
+        dist_no = np.linalg.norm(residues['N'][donor] - residues['O'][acceptor], axis=1)
+        with np.errstate(divide='ignore'):
+            energy = (coupling_constant/dist_ho - coupling_constant/dist_hc
+                      + coupling_constant/dist_nc - coupling_constant/dist_no)
+        too_close = np.min(np.stack([dist_ho, dist_hc, dist_nc, dist_no]), axis=0) < min_distance
+        energy[too_close] = min_hbond_energy
+        energy = np.maximum(round_energy(energy), min_hbond_energy)
+
+        negative = energy < 0
+        donors.append(donor[negative])
+        acceptors.append(acceptor[negative])
+        energies.append(energy[negative])
+
+    return np.concatenate(donors), np.concatenate(acceptors), np.concatenate(energies)
+
+
+def select_best_pairs(group, partner, energy):
+    # Selects the (up to) two lowest energy pairs of each residue in group
+    # (ties are resolved in favour of the lower partner index, matching the
+    # order in which DSSP evaluates the pairs)
+    order = np.lexsort((partner, energy, group))
+    group = group[order]
+    rank = np.arange(group.shape[0])
+    group_start = np.r_[0, np.nonzero(np.diff(group))[0]+1]
+    rank = rank - np.repeat(group_start, np.diff(np.r_[group_start, group.shape[0]]))
+    return order[rank < 2]
+
+
+class hbond_map():
+
+    def __init__(self, num_res, donors, acceptors, energies):
+        # Stores the hydrogen bonds counted by DSSP: those with an energy
+        # below -0.5 kcal/mol that are one of the two lowest energy bonds of
+        # their donor N-H group
+        best = select_best_pairs(donors, acceptors, energies)
+        bonded = best[energies[best] < max_hbond_energy]
+        self.num_res = num_res
+        self.pair_codes = np.sort(donors[bonded]*num_res + acceptors[bonded])
+        self.pairs = set(zip(donors[bonded].tolist(), acceptors[bonded].tolist()))
+
+    def test_bonds(self, donors, acceptors):
+        # Vectorised test of whether the N-H of each donor is hydrogen bonded
+        # to the C=O of the corresponding acceptor
+        donors = np.asarray(donors)
+        acceptors = np.asarray(acceptors)
+        valid = (donors >= 0) & (donors < self.num_res) & (acceptors >= 0) & (acceptors < self.num_res)
+        codes = np.where(valid, donors*self.num_res + acceptors, -1)
+        return valid & np.isin(codes, self.pair_codes)
+
+    def test_bond(self, donor, acceptor):
+        return (donor, acceptor) in self.pairs
+
+
+def find_bridges(bonds, segments):
+    # Identifies all parallel and antiparallel beta-bridges between residues
+    # i and j (j > i + 2), listed in order of i then j
+    num_res = segments.shape[0]
+    if num_res < 6:
+        return []
+
+    # Lists the (i, j) pairs that could form a bridge given the hydrogen
+    # bonds present (each bridge requires at least one bond from / to
+    # residue i or its neighbours)
+    donors, acceptors = np.divmod(bonds.pair_codes, num_res)
+    candidates = [(acceptors, donors), (donors, acceptors),
+                  (donors-1, acceptors), (acceptors, donors-1),
+                  (acceptors+1, donors), (donors, acceptors+1),
+                  (donors-1, acceptors+1), (acceptors+1, donors-1)]
+    i_list = np.concatenate([pair[0] for pair in candidates] + [pair[1] for pair in candidates])
+    j_list = np.concatenate([pair[1] for pair in candidates] + [pair[0] for pair in candidates])
+    mask = (i_list >= 1) & (i_list + 4 < num_res) & (j_list >= i_list + 3) & (j_list + 1 < num_res)
+    codes = np.unique(i_list[mask]*num_res + j_list[mask])
+    i_list, j_list = np.divmod(codes, num_res)
+
+    # Both sets of flanking residues must be free of chain breaks
+    mask = (segments[i_list-1] == segments[i_list+1]) & (segments[j_list-1] == segments[j_list+1])
+    i_list = i_list[mask]
+    j_list = j_list[mask]
+
+    parallel = ((bonds.test_bonds(i_list+1, j_list) & bonds.test_bonds(j_list, i_list-1))
+                | (bonds.test_bonds(j_list+1, i_list) & bonds.test_bonds(i_list, j_list-1)))
+    antiparallel = ((bonds.test_bonds(i_list+1, j_list-1) & bonds.test_bonds(j_list+1, i_list-1))
+                    | (bonds.test_bonds(j_list, i_list) & bonds.test_bonds(i_list, j_list)))
+    antiparallel = antiparallel & ~parallel
+
+    bridges = []
+    for i, j, is_parallel, is_antiparallel in zip(
+        i_list.tolist(), j_list.tolist(), parallel.tolist(), antiparallel.tolist()
+    ):
+        if is_parallel:
+            bridges.append((i, j, 'parallel'))
+        elif is_antiparallel:
+            bridges.append((i, j, 'antiparallel'))
+
+    return bridges
+
+
+def udiff(a, b):
+    # Difference a - b, treating negative differences as a very large number
+    # (replicating the unsigned integer arithmetic used by DSSP)
+    return a - b if a >= b else 2**32 + a - b
+
+
+def build_ladders(bridges, chains):
+    # Combines consecutive bridges into ladders, then joins ladders
+    # separated by beta-bulges
+    ladders = []
+    for i, j, bridge_type in bridges:
+        found = False
+        for ladder in ladders:
+            if bridge_type != ladder['type'] or i != ladder['i'][-1] + 1:
+                continue
+            if bridge_type == 'parallel' and ladder['j'][-1] + 1 == j:
+                ladder['i'].append(i)
+                ladder['j'].append(j)
+                found = True
+                break
+            if bridge_type == 'antiparallel' and ladder['j'][0] - 1 == j:
+                ladder['i'].append(i)
+                ladder['j'].insert(0, j)
+                found = True
+                break
+        if not found:
+            ladders.append({'type': bridge_type, 'i': [i], 'j': [j],
+                            'chain': chains[i]})
+
+    ladders = sorted(ladders, key=lambda ladder: (ladder['chain'], ladder['i'][0]))
+
+    index_1 = 0
+    while index_1 < len(ladders):
+        index_2 = index_1 + 1
+        while index_2 < len(ladders):
+            ladder_1 = ladders[index_1]
+            ladder_2 = ladders[index_2]
+            ibi, iei = ladder_1['i'][0], ladder_1['i'][-1]
+            jbi, jei = ladder_1['j'][0], ladder_1['j'][-1]
+            ibj, iej = ladder_2['i'][0], ladder_2['i'][-1]
+            jbj, jej = ladder_2['j'][0], ladder_2['j'][-1]
+
+            if (
+                   ladder_1['type'] != ladder_2['type']
+                or chains[min(ibi, ibj)] != chains[max(iei, iej)]
+                or chains[min(jbi, jbj)] != chains[max(jei, jej)]
+                or udiff(ibj, iei) >= 6
+                or (iei >= ibj and ibi <= iej)
+            ):
+                index_2 += 1
+                continue
+
+            if ladder_1['type'] == 'parallel':
+                bulge = ((udiff(jbj, jei) < 6 and udiff(ibj, iei) < 3)
+                         or udiff(jbj, jei) < 3)
+            else:
+                bulge = ((udiff(jbi, jej) < 6 and udiff(ibj, iei) < 3)
+                         or udiff(jbi, jej) < 3)
+
+            if bulge:
+                ladder_1['i'] = ladder_1['i'] + ladder_2['i']
+                if ladder_1['type'] == 'parallel':
+                    ladder_1['j'] = ladder_1['j'] + ladder_2['j']
+                else:
+                    ladder_1['j'] = ladder_2['j'] + ladder_1['j']
+                del ladders[index_2]
+            else:
+                index_2 += 1
+        index_1 += 1
+
+    return ladders
+
+
+def assign_sheets(ladders):
+    # Groups ladders that share residues into sheets, numbering sheets and
+    # ladders in the order of their first ladder
+    remaining = list(range(len(ladders)))
+    residue_sets = [set(ladder['i']) | set(ladder['j']) for ladder in ladders]
+    sheet_num = 1
+    ladder_num = 0
+    while len(remaining) > 0:
+        sheet = [remaining.pop(0)]
+        sheet_residues = set(residue_sets[sheet[0]])
+        linked = True
+        while linked:
+            linked = False
+            for index in remaining:
+                if len(residue_sets[index] & sheet_residues) > 0:
+                    sheet.append(index)
+                    sheet_residues |= residue_sets[index]
+                    remaining.remove(index)
+                    linked = True
+                    break
+        for index in sorted(sheet):
+            ladders[index]['ladder'] = ladder_num
+            ladders[index]['sheet'] = sheet_num
+            ladder_num += 1
+        sheet_num += 1
+
+
+def calc_helix_flags(bonds, segments, chains):
+    # Flags the start, middle and end residues of every n-turn (n = 3, 4 and
+    # 5) identified from the hydrogen bond from the N-H of residue i + n to
+    # the C=O of residue i
+    num_res = segments.shape[0]
+    flags = OrderedDict()
+    for stride in [3, 4, 5]:
+        stride_flags = np.full(num_res, 'none', dtype=object)
+        starts = np.arange(max(0, num_res-stride))
+        turn = ((segments[starts] == segments[starts+stride])
+                & (chains[starts] == chains[starts+stride])
+                & bonds.test_bonds(starts+stride, starts))
+        for i in np.nonzero(turn)[0].tolist():
+            stride_flags[i+stride] = 'end'
+            for j in range(i+1, i+stride):
+                if stride_flags[j] == 'none':
+                    stride_flags[j] = 'middle'
+            if stride_flags[i] == 'end':
+                stride_flags[i] = 'start_and_end'
+            else:
+                stride_flags[i] = 'start'
+        flags[stride] = stride_flags
+
+    return flags
+
+
+def calc_ca_angles(ca, segments):
+    # Calculates the kappa (bend) angle at each residue (between the C_alpha
+    # atoms of residues i - 2, i and i + 2) and the alpha (chirality) dihedral
+    # angle (between the C_alpha atoms of residues i - 1 to i + 2), set to 360
+    # where undefined
+    num_res = ca.shape[0]
+    kappa = np.full(num_res, 360.0)
+    alpha = np.full(num_res, 360.0)
+    if num_res >= 5:
+        index = np.arange(2, num_res-2)
+        valid = segments[index-2] == segments[index+2]
+        vec_1 = ca[index] - ca[index-2]
+        vec_2 = ca[index+2] - ca[index]
+        cos_kappa = (np.sum(vec_1*vec_2, axis=1)
+                     / (np.linalg.norm(vec_1, axis=1)*np.linalg.norm(vec_2, axis=1)))
+        cos_kappa = np.clip(cos_kappa, -1, 1)
+        kappa[index[valid]] = np.degrees(np.arctan2(
+            np.sqrt(1 - cos_kappa**2), cos_kappa
+        ))[valid]
+    if num_res >= 4:
+        index = np.arange(1, num_res-2)
+        valid = segments[index-1] == segments[index+2]
+        b_1 = ca[index] - ca[index-1]
+        b_2 = ca[index+1] - ca[index]
+        b_3 = ca[index+2] - ca[index+1]
+        n_1 = np.cross(b_1, b_2)
+        n_2 = np.cross(b_2, b_3)
+        m_1 = np.cross(n_1, b_2/np.linalg.norm(b_2, axis=1)[:, None])
+        x = np.sum(n_1*n_2, axis=1)
+        y = np.sum(m_1*n_2, axis=1)
+        alpha[index[valid]] = np.degrees(np.arctan2(-y, x))[valid]
+
+    return kappa, alpha
+
+
+def assign_secondary_structure(residues):
+    # Runs the DSSP secondary structure assignment on the input backbone
+    # coordinates, returning an ordered dictionary of per-residue arrays of
+    # the DSSP fields
+    num_res = residues['CA'].shape[0]
+    chains = residues['CHAIN']
+
+    # Chain breaks are placed between residues in different chains and
+    # between residues whose peptide bond is longer than 2.5 A. Residues in
+    # the same segment are numbered consecutively by DSSP.
+    same_chain = chains[1:] == chains[:-1]
+    peptide_bond = np.linalg.norm(residues['C'][:-1] - residues['N'][1:], axis=1)
+    breaks = ~same_chain | (peptide_bond > max_peptide_bond_length)
+    segments = np.r_[0, np.cumsum(breaks)]
+    dssp_nums = np.arange(1, num_res+1) + segments
+
+    h_coords = calc_hydrogen_positions(residues, same_chain)
+    donors, acceptors, energies = calc_hbond_energies(residues, h_coords)
+    bonds = hbond_map(num_res, donors, acceptors, energies)
+
+    # Beta-bridges, ladders and sheets
+    ladders = build_ladders(find_bridges(bonds, segments), chains)
+    assign_sheets(ladders)
+
+    sec_struct = np.full(num_res, ' ', dtype='U1')
+    sheet_labels = np.full(num_res, ' ', dtype='U1')
+    bridge_labels = np.full((num_res, 2), ' ', dtype='U1')
+    bridge_partners = np.zeros((num_res, 2), dtype=np.int64)
+    has_partner = np.zeros(num_res, dtype=bool)
+    for ladder in ladders:
+        beta_i = 1 if has_partner[ladder['i']].any() else 0
+        beta_j = 1 if has_partner[ladder['j']].any() else 0
+        ss = 'E' if len(ladder['i']) > 1 else 'B'
+        label = chr(ord('A') + ladder['ladder'] % 26)
+        if ladder['type'] == 'parallel':
+            label = label.lower()
+            partners_i = ladder['j']
+            partners_j = ladder['i']
+        else:
+            partners_i = ladder['j'][::-1]
+            partners_j = ladder['i'][::-1]
+        for residue, partner in zip(ladder['i'], partners_i):
+            bridge_partners[residue, beta_i] = dssp_nums[partner]
+            bridge_labels[residue, beta_i] = label
+            has_partner[residue] = True
+        for residue, partner in zip(ladder['j'], partners_j):
+            bridge_partners[residue, beta_j] = dssp_nums[partner]
+            bridge_labels[residue, beta_j] = label
+            has_partner[residue] = True
+
+        sheet_label = chr(ord('A') + (ladder['sheet'] - 1) % 26)
+        for residues_range in [ladder['i'], ladder['j']]:
+            span = np.arange(residues_range[0], residues_range[-1]+1)
+            span_ss = sec_struct[span]
+            sec_struct[span] = np.where(span_ss == 'E', 'E', ss)
+            sheet_labels[span] = sheet_label
+
+    # Helices, turns and bends
+    flags = calc_helix_flags(bonds, segments, chains)
+    helix_start = OrderedDict()
+    for stride, stride_flags in flags.items():
+        helix_start[stride] = np.isin(stride_flags, ['start', 'start_and_end'])
+    kappa, alpha = calc_ca_angles(residues['CA'], segments)
+
+    for i in range(1, num_res-4):
+        if helix_start[4][i] and helix_start[4][i-1]:
+            sec_struct[i:i+4] = 'H'
+    for i in range(1, num_res-3):
+        if helix_start[3][i] and helix_start[3][i-1]:
+            if np.isin(sec_struct[i:i+3], [' ', 'G']).all():
+                sec_struct[i:i+3] = 'G'
+    for i in range(1, num_res-5):
+        if helix_start[5][i] and helix_start[5][i-1]:
+            if np.isin(sec_struct[i:i+5], [' ', 'I', 'H']).all():
+                sec_struct[i:i+5] = 'I'
+    for i in range(1, num_res-1):
+        if sec_struct[i] == ' ':
+            turn = False
+            for stride in [3, 4, 5]:
+                for k in range(1, stride):
+                    if i >= k and helix_start[stride][i-k]:
+                        turn = True
+            if turn:
+                sec_struct[i] = 'T'
+            elif kappa[i] != 360 and kappa[i] > 70:
+                sec_struct[i] = 'S'
+
+    turn_labels = np.full((num_res, 3), ' ', dtype='U1')
+    for column, (stride, stride_flags) in enumerate(flags.items()):
+        for i, flag in enumerate(stride_flags.tolist()):
+            if flag == 'middle':
+                turn_labels[i, column] = str(stride)
+            else:
+                turn_labels[i, column] = helix_flags[flag]
+    bend_labels = np.where((kappa != 360) & (kappa > 70), 'S', ' ')
+    chirality = np.where(alpha == 360, ' ', np.where(alpha < 0, '-', '+'))
+
+    assignment = OrderedDict({'DSSP_NUM': dssp_nums,
+                              'SEGMENT': segments,
+                              'SEC_STRUCT': sec_struct,
+                              'TURNS': turn_labels,
+                              'BEND': bend_labels,
+                              'CHIRALITY': chirality,
+                              'BRIDGE_LABELS': bridge_labels,
+                              'BRIDGE_PARTNERS': bridge_partners,
+                              'SHEET': sheet_labels})
+    return assignment
+
+
+def format_dssp_output(residues, assignment):
+    # Writes the secondary structure assignment in the format of the DSSP
+    # program (with a break line, marked '!' (or '!*' between chains), at
+    # each chain break)
+    amino_acids_dict = gen_amino_acids_dict()
+    lines = ['==== Secondary Structure Definition by the in-process '
+             'implementation of DSSP in DataGen, version {} ===='.format(dssp_engine_version),
+             '  #  RESIDUE AA STRUCTURE BP1 BP2  ACC']
+
+    prev_segment = 0
+    for index in range(residues['CA'].shape[0]):
+        segment = assignment['SEGMENT'][index]
+        if segment != prev_segment:
+            chain_break = '*' if residues['CHAIN'][index] != residues['CHAIN'][index-1] else ' '
+            lines.append('{:5d}        !{}             0   0    0'.format(
+                assignment['DSSP_NUM'][index] - 1, chain_break
+            ).ljust(136))
+            prev_segment = segment
+
+        lines.append('{:5d}{:5d}{:1s}{:1s} {:1s}  {:1s} {}{}{}{}{:4d}{:4d}{:1s}{:4d}'.format(
+            assignment['DSSP_NUM'][index], residues['RESNUM'][index],
+            residues['INSCODE'][index][0:1], residues['CHAIN'][index][0:1],
+            amino_acids_dict.get(residues['RESNAME'][index], 'X'),
+            assignment['SEC_STRUCT'][index], ''.join(assignment['TURNS'][index]),
+            assignment['BEND'][index], assignment['CHIRALITY'][index],
+            ''.join(assignment['BRIDGE_LABELS'][index]),
+            assignment['BRIDGE_PARTNERS'][index][0],
+            assignment['BRIDGE_PARTNERS'][index][1], assignment['SHEET'][index], 0
+        ).ljust(136))
+
+    return '\n'.join(lines) + '\n'
+
+
+def run_dssp_engine(pdb_path):
+    # Returns the DSSP output (as a string) of the input PDB file, calculated
+    # in-process
+    residues = read_backbone(pdb_path)
+    assignment = assign_secondary_structure(residues)
+    return format_dssp_output(residues, assignment)
+
+
+def parse_dssp_residues(dssp_out):
+    # Extracts the fields used by the DataGen pipeline from the residue lines
+    # of DSSP output: secondary structure, parallel / antiparallel ladder
+    # labels, bridge partners (as RES_IDs) and sheet label, keyed by RES_ID
+    lines = dssp_out.split('\n')
+    start = [index for index, line in enumerate(lines) if line.startswith('  #  RESIDUE')]
+    lines = lines[start[0]+1:] if start != [] else []
+
+    dssp_num_to_res_id = OrderedDict()
+    for line in lines:
+        if len(line) > 13 and line[13] != '!':
+            dssp_num_to_res_id[line[0:5].strip()] = line[11:12].strip() + line[5:11].replace(' ', '')
+
+    fields = OrderedDict()
+    for line in lines:
+        if len(line) <= 13 or line[13] == '!':
+            continue
+        res_id = line[11:12].strip() + line[5:11].replace(' ', '')
+        orientation = []
+        for label in line[23:25]:
+            if label == ' ':
+                orientation.append('')
+            elif label.isupper():
+                orientation.append('A')
+            else:
+                orientation.append('P')
+        partners = [dssp_num_to_res_id.get(line[25:29].strip(), ''),
+                    dssp_num_to_res_id.get(line[29:33].strip(), '')]
+        fields[res_id] = (line[16:17], tuple(orientation), tuple(partners), line[33:34])
+
+    return fields
+
+
+def compare_dssp_outputs(ref_dssp_out, test_dssp_out):
+    # Compares the beta-strand assignment (the fields used by the DataGen
+    # pipeline) of two DSSP outputs residue by residue, returning the number
+    # of residues compared and the number with differing E assignment,
+    # ladder orientation, bridge partners and sheet membership (sheets are
+    # compared by the sets of residues that they contain, since their labels
+    # depend upon the order in which they are found)
+    ref_fields = parse_dssp_residues(ref_dssp_out)
+    test_fields = parse_dssp_residues(test_dssp_out)
+    res_ids = [res_id for res_id in ref_fields if res_id in test_fields]
+
+    def sheet_sets(fields):
+        sheets = OrderedDict()
+        for res_id in res_ids:
+            if fields[res_id][0] == 'E':
+                sheets.setdefault(fields[res_id][3], set()).add(res_id)
+        return OrderedDict((res_id, frozenset(sheets.get(fields[res_id][3], set()))
+                            if fields[res_id][0] == 'E' else frozenset())
+                           for res_id in res_ids)
+
+    ref_sheets = sheet_sets(ref_fields)
+    test_sheets = sheet_sets(test_fields)
+
+    differences = OrderedDict({'residues': len(res_ids),
+                               'strand': 0,
+                               'orientation': 0,
+                               'partners': 0,
+                               'sheet': 0})
+    for res_id in res_ids:
+        ref_strand = ref_fields[res_id][0] == 'E'
+        test_strand = test_fields[res_id][0] == 'E'
+        if ref_strand != test_strand:
+            differences['strand'] += 1
+        elif ref_strand:
+            if sorted(ref_fields[res_id][1]) != sorted(test_fields[res_id][1]):
+                differences['orientation'] += 1
+            if sorted(ref_fields[res_id][2]) != sorted(test_fields[res_id][2]):
+                differences['partners'] += 1
+            if ref_sheets[res_id] != test_sheets[res_id]:
+                differences['sheet'] += 1
+
+    return differences
+
+
+def validate_dssp_engine(pdb_paths, dssp_paths):
+    # Validates the in-process implementation against the output of the
+    # DSSP program for a reference set of structures, printing the number of
+    # residues whose beta-strand assignment differs
+    totals = OrderedDict()
+    for pdb_path, dssp_path in zip(pdb_paths, dssp_paths):
+        with open_pdb_file(dssp_path, 'r') as dssp_file:
+            ref_dssp_out = dssp_file.read()
+        differences = compare_dssp_outputs(ref_dssp_out, run_dssp_engine(pdb_path))
+        print('{}: {}'.format(pdb_path, dict(differences)))
+        for key, value in differences.items():
+            totals[key] = totals.get(key, 0) + value
+    print('Total: {}'.format(dict(totals)))
+
+    return totals
+
+
+# Validates the in-process implementation against DSSP for a reference set
+# of PDB files, each paired with the DSSP output generated from it, e.g.
+# python dssp_engine.py 1abc.pdb 1abc.dssp 2xyz.pdb 2xyz.dssp
+if __name__ == '__main__':
+    validate_dssp_engine(sys.argv[1::2], sys.argv[2::2])
@@ -5,21 +5,74 @@ import matplotlib.pyplot as plt  # Necessary to make prevent 'Invalid DISPLAY
 # variable' error, don't remove!
 import os
 import random
-import requests
-import shutil
 import string
-import isambard_dev as isambard
+import numpy as np
 import pandas as pd
-from collections import OrderedDict
-from difflib import SequenceMatcher
+from collections import Counter, OrderedDict
 if __name__ == 'subroutines.extract_coordinates':
     from subroutines.run_stages import run_stages
+    from subroutines.parse_pdb import (
+        find_pdb_file, select_pdb_records, index_pdb_residues
+    )
+    from subroutines.structure_cache import load_pdb_records
+    from subroutines.parent_assemblies import (
+        copy_parent_assemblies, link_domain_view, parent_assembly_name
+    )
+    from subroutines.pdbe_assemblies import (
+        offline_assembly_resolver, preferred_assembly_cache
+    )
+    from subroutines.sequence_similarity import segment_similarity
     from subroutines.variables import gen_amino_acids_dict
 else:
     from datagen.subroutines.run_stages import run_stages
+    from datagen.subroutines.parse_pdb import (
+        find_pdb_file, select_pdb_records, index_pdb_residues
+    )
+    from datagen.subroutines.structure_cache import load_pdb_records
+    from datagen.subroutines.parent_assemblies import (
+        copy_parent_assemblies, link_domain_view, parent_assembly_name
+    )
+    from datagen.subroutines.pdbe_assemblies import (
+        offline_assembly_resolver, preferred_assembly_cache
+    )
+    from datagen.subroutines.sequence_similarity import segment_similarity
     from datagen.subroutines.variables import gen_amino_acids_dict
 
 
+def find_segment_indices(residue_index, ter_blocks, res_keys, chain, start,
+                         stop):
+    # Lists the line offsets of every stretch of records in a PDB file that
+    # begins at the START residue of a domain segment and runs until either
+    # the STOP residue or the end of its TER-delimited block. Rather than
+    # rescanning every line of the file, jumps directly between the offsets of
+    # the START and STOP residues (and of the TER records) listed in the
+    # residue index. As in the line-by-line scan this replaces, the record
+    # following the end of each stretch is skipped before searching for the
+    # next START residue.
+    if chain == '':  # Blank chain ids in the PDB file are never matched to a
+        # domain without a chain id
+        return []
+
+    num_records = res_keys.shape[0]
+    empty = np.array([], dtype=int)
+    starts = residue_index.get((chain, start), empty)
+    stop_offsets = residue_index.get((chain, stop), empty)
+    next_res_keys = np.append(res_keys, '')[stop_offsets+1]
+    ends = np.union1d(ter_blocks[:, 1] - 1, stop_offsets[next_res_keys != stop])
+    ends = ends[ends >= 0]
+
+    segments = []
+    offset = 0
+    while offset < num_records:
+        end = ends[np.searchsorted(ends, offset)]
+        start_index = np.searchsorted(starts, offset)
+        if start_index < starts.shape[0] and starts[start_index] <= end:
+            segments.append(np.arange(starts[start_index], end+1))
+        offset = end + 2
+
+    return segments
+
+
 class extract_beta_structure_coords(run_stages):
 
     def __init__(self, run_parameters):
@@ -37,19 +90,22 @@ class extract_beta_structure_coords(run_stages):
                 fasta_list.append(seq)
         fasta_list = [seq for seq in fasta_list if seq != '']
 
+        # Maps each DSEQS sequence in the filtered dataframe of CATH domains to
+        # the rows at which it is listed
+        seq_rows = OrderedDict()
+        for row, seq in enumerate(filtered_domain_df['DSEQS'].tolist()):
+            if not seq in seq_rows:
+                seq_rows[seq] = []
+            seq_rows[seq].append(row)
+
         # For each of the sequences returned by the CD-HIT web server, selects
         # a random entry from the filtered dataframe of CATH domains from which
         # to select coordinates
         df_index_list = []
         for seq in fasta_list:
-            df_index_sub_list = []
-            for row in range(filtered_domain_df.shape[0]):
-                if seq == filtered_domain_df['DSEQS'][row]:
-                    df_index_sub_list.append(row)
-
+            df_index_sub_list = seq_rows.get(seq, [])
             rand_num = random.randint(0, len(df_index_sub_list)-1)
-            index = df_index_sub_list[rand_num]
-            df_index_list.append(index)
+            df_index_list.append(df_index_sub_list[rand_num])
 
         # Filters dataframe further to retain only the domains selected in the
         # previous step
@@ -61,47 +117,44 @@ class extract_beta_structure_coords(run_stages):
     def copy_parent_assembly_pdb(self, cdhit_domain_df):
         # Copies the parent assembly (specified by the user to be either the
         # asymmetric unit or the biological assembly) PDB file of every
-        # retained structure to the output files directory.
+        # retained structure to the output files directory. Each parent
+        # assembly is stored once in 'Parent_assemblies/Assemblies/', with the
+        # PDB file of each domain ('Parent_assemblies/{domain_id}.pdb') linked
+        # to the assembly it is taken from.
 
         unprocessed_list_1 = []
         unprocessed_list_2 = []
+        copy_tasks = OrderedDict()
+        domain_assemblies = OrderedDict()
+
+        # Looks up the preferred assembly of each PDB code (once per code),
+        # either from the PDBe website (with the pages requested concurrently
+        # and the results cached on disk) or offline from a bulk table of
+        # preferred assemblies / the REMARK 350 records of the asymmetric
+        # unit PDB files
+        if self.pdb_au_database != self.pdb_ba_database:
+            if self.assembly_lookup == 'offline':
+                assembly_resolver = offline_assembly_resolver(
+                    self.cache_dir, self.pdb_au_database, self.assembly_table
+                )
+            else:
+                assembly_resolver = preferred_assembly_cache(
+                    self.cache_dir, self.pdbe_connections, self.pdbe_cache_ttl
+                )
+            assemblies = assembly_resolver.lookup(cdhit_domain_df['PDB_CODE'].tolist())
+            assembly_resolver.close()
 
         for row in range(cdhit_domain_df.shape[0]):
             pdb_code = cdhit_domain_df['PDB_CODE'][row]
             domain_id = cdhit_domain_df['DOMAIN_ID'][row]
 
-            # Finds preferred assembly from screen scrape of PDBe website
-            count = 0
-            assembly = 0
-            error = False
-
+            # Finds preferred assembly
             if self.pdb_au_database == self.pdb_ba_database:
                 count = 1
                 assembly = ''
+                error = False
             else:
-                page = requests.get(
-                    'https://www.ebi.ac.uk/pdbe/entry/pdb/{}/analysis'.format(pdb_code.lower())).text
-                for line in page.split('\n'):
-                    if '(preferred)' in line:
-                        count += 1
-                        line = [sub_line for sub_line in line.split('<') if
-                                '(preferred)' in sub_line]
-                        if len(line) != 1:
-                            error = True
-
-                        line = line[0]
-                        line = [sub_line for sub_line in line.split('>') if
-                                '(preferred)' in sub_line]
-                        if len(line) != 1:
-                            error = True
-
-                        else:
-                            line = line[0]
-                            assembly = [int(s) for s in line.split() if s.isdigit()]
-                            if len(assembly) != 1:
-                                error = True
-                            else:
-                                assembly = assembly[0]
+                count, assembly, error = assemblies[pdb_code]
 
             # Copies preferred assembly PDB file from PDB database (stored on
             # local machine / hard drive) to output directory
@@ -116,25 +169,44 @@ class extract_beta_structure_coords(run_stages):
                 pass
             else:
                 if not os.path.isfile('Parent_assemblies/{}.pdb'.format(domain_id)):
-                    try:
-                        print('Copying {}{}.pdb{} to \'Parent_assemblies/\' '
-                              'output directory'.format(pdb_code, self.suffix, assembly))
-                        shutil.copy('{}{}/{}{}.pdb{}'.format(
-                            self.pdb_ba_database, pdb_code[1:3], pdb_code,
-                            self.suffix, assembly
-                        ), 'Parent_assemblies/{}.pdb'.format(domain_id)
-                        )
-                        # Checks that PDB file of parent assembly can be parsed
-                        # by ISAMBARD
+                    # Each parent assembly is only copied once, however many
+                    # of the retained domains are taken from it
+                    assembly_name = parent_assembly_name(pdb_code, assembly)
+                    if not assembly_name in copy_tasks:
                         try:
-                            domain = isambard.ampal.convert_pdb_to_ampal(
-                                'Parent_assemblies/{}.pdb'.format(domain_id)
+                            print('Copying {}{}.pdb{} to \'Parent_assemblies/\' '
+                                  'output directory'.format(pdb_code, self.suffix, assembly))
+                            copy_tasks[assembly_name] = (assembly_name, find_pdb_file(
+                                '{}{}/{}{}.pdb{}'.format(
+                                    self.pdb_ba_database, pdb_code[1:3], pdb_code,
+                                    self.suffix, assembly
+                                )), 'Parent_assemblies/Assemblies/{}.pdb'.format(assembly_name)
                             )
-                        except ValueError:
-                            os.remove('Parent_assemblies/{}.pdb'.format(domain_id))
-                            unprocessed_list_2.append(domain_id)
-                    except FileNotFoundError:
-                        unprocessed_list_1.append(domain_id)
+                        except FileNotFoundError:
+                            copy_tasks[assembly_name] = None
+                    domain_assemblies[domain_id] = assembly_name
+
+        # Copies the parent assembly PDB files (in parallel if more than one
+        # worker process is specified) and checks that they can be parsed by
+        # ISAMBARD
+        if not os.path.isdir('Parent_assemblies/Assemblies'):
+            os.mkdir('Parent_assemblies/Assemblies')
+        valid_dict = copy_parent_assemblies(
+            [task for task in copy_tasks.values() if task is not None],
+            self.cache_dir, self.workers
+        )
+
+        # Creates the view of its parent assembly PDB file for each domain
+        for domain_id, assembly_name in domain_assemblies.items():
+            if copy_tasks[assembly_name] is None:
+                unprocessed_list_1.append(domain_id)
+            elif valid_dict[assembly_name] is False:
+                unprocessed_list_2.append(domain_id)
+            else:
+                link_domain_view(
+                    'Parent_assemblies/Assemblies/{}.pdb'.format(assembly_name),
+                    'Parent_assemblies/{}.pdb'.format(domain_id)
+                )
 
         unprocessed_list = unprocessed_list_1 + unprocessed_list_2
         cdhit_domain_df = cdhit_domain_df[~cdhit_domain_df['DOMAIN_ID'].isin(unprocessed_list)
@@ -161,135 +233,75 @@ class extract_beta_structure_coords(run_stages):
         all_atoms_dfs_dict = OrderedDict()
         domain_residue_dict = OrderedDict()
         unprocessed_list = []
+        similarity = segment_similarity(0.95)
 
         for row in range(cdhit_domain_df.shape[0]):
             first_chain = ''
             count = 0
             residue_list = []
-            rec = []
-            atmnum = []
-            atmname = []
-            conformer = []
-            resname = []
-            chain = []
-            resnum = []
-            insertion = []
-            xpos = []
-            ypos = []
-            zpos = []
-            occ = []
-            bfac = []
-            element = []
-            charge = []
-            chain_num_ins = []
-            lines = []
+            selected_indices = []
 
             # Extracts ATOM / HETATM records from biological assembly PDB file
             # copied to the output files directory in the previous step
             pdb_code = cdhit_domain_df['PDB_CODE'][row]
             domain_id = cdhit_domain_df['DOMAIN_ID'][row]
+            domain_chain = cdhit_domain_df['CHAIN'][row]
 
             print('Obtaining ATOM / HETATM records for {}'.format(pdb_code))
             print('{:0.2f}%'.format(((row+1)/cdhit_domain_df.shape[0])*100))
 
-            with open('Parent_assemblies/{}.pdb'.format(domain_id), 'r') as pdb_file:
-                pdb_file_lines = [line.strip('\n') for line in pdb_file if
-                                  line[0:6].strip() in ['ATOM', 'HETATM', 'TER']]
-            pdb_file_lines.append('TER'.ljust(80))
-            pdb_file_lines.append('TER'.ljust(80))  # Second TER line ensures
-            # that entire sequence segment is extracted if TER cards have not
-            # been placed correctly in the input PDB file
+            # Indexes the records of each residue, plus the TER-delimited
+            # blocks of records, in the input PDB file
+            pdb_columns = load_pdb_records(
+                'Parent_assemblies/{}.pdb'.format(domain_id)
+            )
+            residue_index, ter_blocks = index_pdb_residues(pdb_columns)
+            res_keys = pdb_columns['RES_KEY']
+            res_ends = (
+                (res_keys != np.append(res_keys[1:], ''))
+                | (np.append(pdb_columns['REC'][1:], 'TER') == 'TER')
+            )  # Final record of each residue
 
             # For each segment sequence in the domain, makes a list of all
             # sequences in the input PDB file that lie between the recorded
             # start and stop residue numbers and have the same chain id
             for index_1, segment in enumerate(cdhit_domain_df['SSEQS'][row]):
-                sequences = []
-                indices = []
-
                 start = cdhit_domain_df['SSEQS_START_STOP'][row][index_1][0].replace('START=', '')
                 stop = cdhit_domain_df['SSEQS_START_STOP'][row][index_1][1].replace('STOP=', '')
-                start_seq = False
-                stop_seq = False
-                sequence = ''
-                index_list = []
-
-                for index_2, line in enumerate(pdb_file_lines):
-                    if index_2 != (len(pdb_file_lines)-1):
-                        if (line[22:27].strip() == start
-                                and line[21:22] == cdhit_domain_df['CHAIN'][row]
-                                ):
-                            start_seq = True
-
-                        if start_seq is True and stop_seq is False:
-                            index_list.append(index_2)
-                            if (line[22:27].strip() != pdb_file_lines[index_2+1][22:27].strip()
-                                    or pdb_file_lines[index_2+1][0:3] == 'TER'
-                                    ):
-                                if line[17:20].strip() in amino_acids_dict:
-                                    sequence = sequence + amino_acids_dict[line[17:20].strip()]
-                        elif stop_seq is True:
-                            sequences.append(sequence)
-                            indices.append(index_list)
-                            sequence = ''
-                            index_list = []
-                            start_seq = False
-                            stop_seq = False
-                            continue
-
-                        if (pdb_file_lines[index_2+1][0:3] == 'TER'
-                                or (line[22:27].strip() == stop
-                                    and line[21:22] == cdhit_domain_df['CHAIN'][row]
-                                    and pdb_file_lines[index_2+1][22:27].strip() != stop
-                                    )
-                                ):
-                            stop_seq = True
+
+                indices = find_segment_indices(
+                    residue_index, ter_blocks, res_keys, domain_chain, start, stop
+                )
+                sequences = []
+                for index_list in indices:
+                    res_names = pdb_columns['RESNAME'][index_list][res_ends[index_list]]
+                    sequences.append(''.join(
+                        [amino_acids_dict[res_name] for res_name in res_names
+                         if res_name in amino_acids_dict]
+                    ))
 
                 # Selects the first identified sequence from the input PDB that
                 # shares greater than 95% sequence similarity with the domain
                 # segment sequence in question
                 count += 1
                 sequence_identified = False
+                segment_counts = Counter(segment)
                 for index_3, sequence in enumerate(sequences):
-                    sseqs_list = []
-                    similarity = SequenceMatcher(a=segment, b=sequence).ratio()
-                    if similarity >= 0.95:
+                    if similarity.is_similar(segment, sequence, segment_counts):
                         # Ensures that all selected SSEQS are in the same chain
                         if count == 1:
-                            first_chain = pdb_file_lines[indices[index_3][0]][21:22].strip()
+                            first_chain = pdb_columns['CHAIN'][indices[index_3][0]]
                         elif count > 1:
-                            new_chain = pdb_file_lines[indices[index_3][0]][21:22].strip()
+                            new_chain = pdb_columns['CHAIN'][indices[index_3][0]]
                             if new_chain != first_chain:
                                 break
 
                         sequence_identified = True
 
-                        for index_4 in indices[index_3]:
-                            sseqs_list.append(pdb_file_lines[index_4][21:27].replace(' ', ''))
-
-                            rec.append(pdb_file_lines[index_4][0:6].strip())
-                            atmnum.append(int(pdb_file_lines[index_4][6:11].strip()))
-                            atmname.append(pdb_file_lines[index_4][12:16].strip())
-                            conformer.append(pdb_file_lines[index_4][16:17].strip())
-                            resname.append(pdb_file_lines[index_4][17:20].strip())
-                            chain.append(pdb_file_lines[index_4][21:22].strip())
-                            resnum.append(int(pdb_file_lines[index_4][22:26].strip()))
-                            insertion.append(pdb_file_lines[index_4][26:27].strip())
-                            xpos.append(float(pdb_file_lines[index_4][30:38].strip()))
-                            ypos.append(float(pdb_file_lines[index_4][38:46].strip()))
-                            zpos.append(float(pdb_file_lines[index_4][46:54].strip()))
-                            occ.append(float(pdb_file_lines[index_4][54:60].strip()))
-                            bfac.append(float(pdb_file_lines[index_4][60:66].strip()))
-                            element.append(pdb_file_lines[index_4][76:78].strip())
-                            charge.append(pdb_file_lines[index_4][78:80].strip())
-                            chain_num_ins.append(pdb_file_lines[index_4][21:27].replace(' ', ''))
-                            # Removes alternate conformer labels from pdb file
-                            # lines (but not from dataframe)
-                            line_start = pdb_file_lines[index_4][:16]
-                            line_end = pdb_file_lines[index_4][17:].strip('\n')
-                            lines.append(line_start + ' ' + line_end)
-
-                        residue_list.extend(sseqs_list)
+                        selected_indices += indices[index_3].tolist()
+                        residue_list.extend(
+                            pdb_columns['RES_ID'][indices[index_3]].tolist()
+                        )
                         break
 
                 if sequence_identified is False:
@@ -299,23 +311,17 @@ class extract_beta_structure_coords(run_stages):
             # Makes a dataframe of the PDB information for the domain sequence
             # if each of its SSEQS were identified in the input PDB file
             if not cdhit_domain_df['DOMAIN_ID'][row] in unprocessed_list:
-                pdb_df = pd.DataFrame(OrderedDict({'PDB_FILE_LINES': lines,
-                                                   'REC': rec,
-                                                   'ATMNUM': atmnum,
-                                                   'ATMNAME': atmname,
-                                                   'CONFORMER': conformer,
-                                                   'RESNAME': resname,
-                                                   'CHAIN': chain,
-                                                   'RESNUM': resnum,
-                                                   'INSCODE': insertion,
-                                                   'XPOS': xpos,
-                                                   'YPOS': ypos,
-                                                   'ZPOS': zpos,
-                                                   'OCC': occ,
-                                                   'BFAC': bfac,
-                                                   'ELEMENT': element,
-                                                   'CHARGE': charge,
-                                                   'RES_ID': chain_num_ins}))
+                pdb_df = pd.DataFrame(select_pdb_records(
+                    pdb_columns, np.array(selected_indices, dtype=int),
+                    ['PDB_FILE_LINES', 'REC', 'ATMNUM', 'ATMNAME', 'CONFORMER',
+                     'RESNAME', 'CHAIN', 'RESNUM', 'INSCODE', 'XPOS', 'YPOS',
+                     'ZPOS', 'OCC', 'BFAC', 'ELEMENT', 'CHARGE', 'RES_ID']
+                ))
+                # Removes alternate conformer labels from pdb file lines (but
+                # not from dataframe)
+                pdb_df['PDB_FILE_LINES'] = [
+                    line[:16] + ' ' + line[17:] for line in pdb_df['PDB_FILE_LINES']
+                ]
                 all_atoms_dfs_dict[cdhit_domain_df['DOMAIN_ID'][row]] = pdb_df
 
             # Makes a list of residue numbers of the domain sequence if
@@ -358,54 +364,38 @@ class extract_beta_structure_coords(run_stages):
         # different structures).
         for domain_id in list(all_atoms_dfs_dict.keys()):
             pdb_df = all_atoms_dfs_dict[domain_id]
-
-            alternate_conformers_chainresnum = []
-            alternate_conformers_label = []
-            alternate_conformers_occupancy = []
-
-            for row in range(pdb_df.shape[0]):
-                if pdb_df['CONFORMER'][row] != '':
-                    alternate_conformers_chainresnum.append(pdb_df['RES_ID'][row])
-                    alternate_conformers_label.append(pdb_df['CONFORMER'][row])
-                    alternate_conformers_occupancy.append(float(pdb_df['OCC'][row]))
-
-            df = pd.DataFrame({'chainresnum': alternate_conformers_chainresnum,
-                               'conformer': alternate_conformers_label,
-                               'occupancy': alternate_conformers_occupancy})
-            df = df.drop_duplicates()
-            chainresnum = df['chainresnum'].tolist()
-            conformer = df['conformer'].tolist()
-            occupancy = df['occupancy'].tolist()
-
-            alternate_conformers = {}
-            chainresnum_set = set(chainresnum)
-            for number in chainresnum_set:
-                indices = []
-                a = ''
-                b = ''
-                c = 0
-                for index_1, value_1 in enumerate(chainresnum):
-                    if value_1 == number:
-                        indices.append(index_1)
-                for index_2 in indices:
-                    if occupancy[index_2] > c:
-                        a = chainresnum[index_2]
-                        b = conformer[index_2]
-                        c = occupancy[index_2]
-                alternate_conformers[a] = b
-
-            for row in range(pdb_df.shape[0]):
-                # Removes alternate conformers
-                if (pdb_df['RES_ID'][row] in alternate_conformers
-                        and pdb_df['CONFORMER'][row] not in
-                        [alternate_conformers[pdb_df['RES_ID'][row]], '']
-                        ):
-                    pdb_df.loc[row, 'REC'] = None
-                # Removes hydrogens
-                if pdb_df['ELEMENT'][row] == 'H':
-                    pdb_df.loc[row, 'REC'] = None
-
-            pdb_df = pdb_df[pdb_df['REC'].notnull()]
+            conformers = pdb_df['CONFORMER']
+            conformer_mask = (conformers != '')
+
+            # For each residue with alternate conformers, selects the
+            # conformer with the highest (positive) occupancy, taking the
+            # first listed in the case of a tie
+            alt_df = pd.DataFrame({'RES_ID': pdb_df['RES_ID'][conformer_mask],
+                                   'CONFORMER': conformers[conformer_mask],
+                                   'OCC': pdb_df['OCC'][conformer_mask].astype(float)})
+            max_occ = alt_df.groupby('RES_ID', sort=False)['OCC'].transform('max')
+            best_df = alt_df[(alt_df['OCC'] == max_occ) & (alt_df['OCC'] > 0)]
+            best_df = best_df.drop_duplicates(subset='RES_ID', keep='first')
+            alternate_conformers = pd.Series(best_df['CONFORMER'].tolist(),
+                                             index=best_df['RES_ID'].tolist(),
+                                             dtype=object)
+            # Residues whose alternate conformers all have zero (or missing)
+            # occupancy are left unfiltered (they are recorded under an empty
+            # RES_ID, as in the original row-by-row implementation)
+            if (
+                    best_df.shape[0] < alt_df['RES_ID'].nunique()
+                and not '' in alternate_conformers.index
+            ):
+                alternate_conformers[''] = ''
+
+            # Removes alternate conformers and hydrogens with a single mask
+            selected_conformers = pdb_df['RES_ID'].map(alternate_conformers)
+            remove_mask = (conformer_mask
+                           & selected_conformers.notnull()
+                           & (conformers != selected_conformers))
+            remove_mask = remove_mask | (pdb_df['ELEMENT'] == 'H')
+
+            pdb_df = pdb_df[~remove_mask & pdb_df['REC'].notnull()]
             pdb_df = pdb_df.reset_index(drop=True)
 
             all_atoms_dfs_dict[domain_id] = pdb_df
@@ -4,7 +4,6 @@ import copy
 import isambard_dev as isambard
 import pandas as pd
 import numpy as np
-import networkx as nx
 from collections import OrderedDict
 
 if __name__ == 'subroutines.find_surfaces':
@@ -80,7 +79,7 @@ class barrel_interior_exterior_calcs():
         # If no closed circle of interacting strands, the domain isn't
         # technically a barrel and so DataGen is unable to further analyse the
         # domain
-        if len(nx.cycle_basis(G)) == 0:
+        if len(G.cycle_basis()) == 0:
             unprocessed_list.append(domain_id)
             return orig_strands, unprocessed_list
 
@@ -98,7 +97,7 @@ class barrel_interior_exterior_calcs():
                 nodes_dict[strand] = len(list(G.neighbors(strand)))
 
         # Makes list of strands in closed circle network
-        strand_cycles = nx.cycle_basis(G)
+        strand_cycles = G.cycle_basis()
         strands = max(strand_cycles, key=len)  # Finds longest complete cycle
 
         return strands, unprocessed_list
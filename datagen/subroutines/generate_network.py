@@ -3,81 +3,80 @@ import matplotlib
 matplotlib.use('agg')
 import matplotlib.pyplot as plt  # Necessary to make prevent 'Invalid DISPLAY
 # variable' error, don't remove!
+import numpy as np
 import pandas as pd
 import networkx as nx
 from collections import OrderedDict
 
 if __name__ == 'subroutines.generate_network':
+    from subroutines.parse_pdb import format_pdb_blocks
     from subroutines.run_stages import run_stages
+    from subroutines.strand_network import strand_network
 else:
+    from datagen.subroutines.parse_pdb import format_pdb_blocks
     from datagen.subroutines.run_stages import run_stages
+    from datagen.subroutines.strand_network import strand_network
 
 
 class network_calcs():
 
-    def create_strands_dict(sheet_df):
-        # Creates a dictionary of each of the strand labels plus the residue
-        # ranges they span in an individual beta-sheet
-        strands_dict = {}
-        strands = [strand for strand in set(sheet_df['STRAND_NUM'].tolist()) if
-                   strand != '']
-        for strand in strands:
-            strand_df = sheet_df[sheet_df['STRAND_NUM'] == strand]
-
-            strand_res_num = [int(res) for res in strand_df['DSSP_NUM'].tolist()]
-            strand_min = min(strand_res_num)
-            strand_max = max(strand_res_num)
-
-            strands_dict[strand] = [num for num in range(strand_min, strand_max+1)]
-
-        return strands_dict
-
-    def identify_strand_interactions(sheet_df, strands_dict, dssp_df):
+    def create_strand_intervals(sheet_df):
+        # Lists the strand labels plus the (inclusive) ranges of DSSP residue
+        # numbers they span in an individual beta-sheet, as arrays sorted by
+        # the start of each range
+        strand_df = sheet_df[sheet_df['STRAND_NUM'] != '']
+        strand_res_nums = pd.DataFrame({
+            'STRAND_NUM': strand_df['STRAND_NUM'].values,
+            'DSSP_NUM': strand_df['DSSP_NUM'].astype(int).values
+        }).groupby('STRAND_NUM')['DSSP_NUM'].agg(['min', 'max'])
+        strand_res_nums = strand_res_nums.sort_values('min', kind='stable')
+
+        strand_nums = strand_res_nums.index.values.astype(object)
+        starts = strand_res_nums['min'].values
+        ends = strand_res_nums['max'].values
+
+        return strand_nums, starts, ends
+
+    def locate_strands(res_nums, strand_intervals):
+        # Looks up the strand that spans each of the input DSSP residue
+        # numbers by binary search of the strand ranges, returning None for
+        # residues that don't lie within any strand (including the 0 used by
+        # DSSP to denote no bridge partner)
+        strand_nums, starts, ends = strand_intervals
+        res_nums = np.asarray(res_nums, dtype=int)
+        strands = np.full(res_nums.shape[0], None, dtype=object)
+        if starts.shape[0] == 0:
+            return strands
+
+        indices = np.searchsorted(starts, res_nums, side='right') - 1
+        clipped = np.maximum(indices, 0)
+        found = (indices >= 0) & (res_nums <= ends[clipped]) & (res_nums != 0)
+        strands[found] = strand_nums[clipped[found]]
+        return strands
+
+    def identify_strand_interactions(sheet_df, strand_intervals, dssp_df):
         # Identifies pairs of hydrogen-bonded strands plus their relative
         # orientation (antiparallel or parallel) from the strand numbers of the
         # bridge-paired residues listed in the DSSP file info
         strand_pairs = {}
-        for index, pair in enumerate(sheet_df['BRIDGE_PAIRS'].tolist()):
-            res_num_1 = int(sheet_df['DSSP_NUM'].tolist()[index])
-            res_num_2 = int(pair[0])
-            orientation_2 = sheet_df['ORIENTATION'].tolist()[index][0]
-            res_num_3 = int(pair[1])
-            orientation_3 = sheet_df['ORIENTATION'].tolist()[index][1]
-
-            """
-            # Commented out to avoid warnings for beta-bridge pairs
-            # (DSSP code = 'B' rather than 'E') - might want to include
-            # these in my analysis in the future (at which point the
-            # warning given by this section would be useful)
-            #
-            # Checks that all bridge pair residues are classified
-            # (according to DSSP) as being located within beta-strands
-            for res_num in (res_num_1, res_num_2, res_num_3):
-                if not (
-                        res_num in [num for num_range in
-                        list(strands_dict.values()) for num in num_range]+[0]
-                ):
-                    print('Warning: {} unable to be located in any of '
-                          'the beta-strands listed in the DSSP '
-                          'classification.'
-                          '\nCheck the bridge pairs formed by residue {} '
-                          '(DSSP ID)'.format(
-                          res_num, res_num))
-            """
-
-            strand_1, strand_2, strand_3 = None, None, None
-            # Identifies corresponding strand numbers of bridge pairs
-            for key in list(strands_dict.keys()):
-                if res_num_1 in strands_dict[key]:
-                    strand_1 = key
-
-                if not res_num_2 == 0:
-                    if res_num_2 in strands_dict[key]:
-                        strand_2 = key
-
-                if not res_num_3 == 0:
-                    if res_num_3 in strands_dict[key]:
-                        strand_3 = key
+        bridge_pairs = sheet_df['BRIDGE_PAIRS'].tolist()
+        orientations = sheet_df['ORIENTATION'].tolist()
+
+        # Identifies corresponding strand numbers of bridge pairs (all
+        # residues in the sheet are looked up in a single call). Bridge pair
+        # residues that aren't located within any of the beta-strands (i.e.
+        # beta-bridge pairs, DSSP code = 'B' rather than 'E') are ignored.
+        res_nums = np.concatenate([
+            sheet_df['DSSP_NUM'].astype(int).values,
+            [int(pair[0]) for pair in bridge_pairs],
+            [int(pair[1]) for pair in bridge_pairs]
+        ])
+        strands = network_calcs.locate_strands(res_nums, strand_intervals)
+        strands = strands.reshape(3, -1).T.tolist()
+
+        for index, (strand_1, strand_2, strand_3) in enumerate(strands):
+            orientation_2 = orientations[index][0]
+            orientation_3 = orientations[index][1]
 
             if strand_1 is not None and strand_2 is not None:
                 strand_pair = [strand_1, strand_2]
@@ -92,26 +91,16 @@ class network_calcs():
                 if not strand_pair in strand_pairs:
                     strand_pairs[strand_pair] = orientation_3
 
-        # Removes strands with no hydrogen bonding pairs from dssp_df
-        strands_in_df = [strand for strand in set(sheet_df['STRAND_NUM'].tolist())
-                         if strand != '']
-        strands_in_dict = [strand for strand_pair in list(strand_pairs.keys())
-                           for strand in strand_pair]
-
-        strands_to_remove = []
-        for strand in strands_in_df:
-            if not strand in strands_in_dict:
-                strands_to_remove.append(strand)
+        # Removes (all residues of) strands with no hydrogen bonding pairs
+        # from dssp_df
+        strands_in_dict = set([strand for strand_pair in list(strand_pairs.keys())
+                               for strand in strand_pair])
+        strands_to_remove = [strand for strand in strand_intervals[0].tolist()
+                             if not strand in strands_in_dict]
 
-        res_id_to_remove = []
-        for row in range(dssp_df.shape[0]):
-            if dssp_df['STRAND_NUM'][row] in strands_to_remove:
-                res_id_to_remove.append(dssp_df['RES_ID'][row])
-
-        for row in range(dssp_df.shape[0]):
-            if dssp_df['RES_ID'][row] in res_id_to_remove:
-                dssp_df.loc[row, 'REC'] = None
-        dssp_df = dssp_df[dssp_df['REC'].notnull()]
+        res_id_to_remove = dssp_df['RES_ID'][dssp_df['STRAND_NUM'].isin(strands_to_remove)]
+        remove_mask = dssp_df['RES_ID'].isin(res_id_to_remove)
+        dssp_df = dssp_df[~remove_mask & dssp_df['REC'].notnull()]
         dssp_df = dssp_df.reset_index(drop=True)
 
         return strand_pairs, dssp_df
@@ -119,9 +108,9 @@ class network_calcs():
     def create_network(domain_id, sheet, strand_pairs, edge_labels,
                        domain_sheets, domain_sheets_dict):
         # Creates network of the interacting strands in the sheet
-        G = nx.Graph()
+        G = strand_network()
         for pair in strand_pairs:
-            G.add_edge(pair[0], pair[1], attr=strand_pairs[pair])
+            G.add_edge(pair[0], pair[1], strand_pairs[pair])
 
         # Discards sheets with fewer than 3 beta-strands
         if G.number_of_nodes() > 2:
@@ -138,28 +127,37 @@ class network_calcs():
         return edge_labels, domain_sheets, domain_sheets_dict
 
     def write_network_pdb(domain_id, dssp_df, domain_sheets):
-        # Writes pdb file of individual sheets
-        for sheet in list(domain_sheets.keys()):
-            sheet = sheet.replace('{}_sheet_'.format(domain_id), '')
+        # Writes pdb file of individual sheets. The residues of dssp_df are
+        # grouped by sheet and strand in a single pass, and the records of
+        # all of the sheets are then formatted together (with each strand
+        # terminated by a TER card).
+        strand_res_ids = OrderedDict()
+        strand_df = dssp_df[dssp_df['STRAND_NUM'] != '']
+        for sheet, strand, res_id in zip(strand_df['SHEET_NUM'].tolist(),
+                                         strand_df['STRAND_NUM'].tolist(),
+                                         strand_df['RES_ID'].tolist()):
+            strand_res_ids.setdefault((sheet, strand), []).append(res_id)
+
+        sheets = [sheet.replace('{}_sheet_'.format(domain_id), '') for sheet
+                  in list(domain_sheets.keys())]
+        blocks = []
+        sheet_strands = OrderedDict()
+        for sheet in sheets:
+            strands = sorted([strand for sheet_num, strand in strand_res_ids
+                              if sheet_num == sheet])
+            sheet_strands[sheet] = strands
+            blocks += [strand_res_ids[(sheet, strand)] for strand in strands]
+        block_texts = format_pdb_blocks(dssp_df, blocks)
+
+        start = 0
+        for sheet, strands in sheet_strands.items():
             print('Writing PDB file of beta-strands in {} sheet {}'.format(
                   domain_id, sheet))
-
             with open(
                 'Beta_strands/{}_sheet_{}.pdb'.format(domain_id, sheet), 'w'
             ) as sheet_pdb_file:
-                sheet_df = dssp_df[dssp_df['SHEET_NUM'] == sheet]
-                sheet_df = sheet_df.reset_index(drop=True)
-
-                strands = sorted([strand for strand in set(sheet_df['STRAND_NUM'].tolist())
-                                  if strand != ''])
-                for strand in strands:
-                    strand_df = sheet_df[sheet_df['STRAND_NUM'] == strand]
-                    chain_res_num = strand_df['RES_ID'].tolist()
-
-                    for row in range(dssp_df.shape[0]):
-                        if dssp_df['RES_ID'][row] in chain_res_num:
-                            sheet_pdb_file.write('{}\n'.format(dssp_df['PDB_FILE_LINES'][row]))
-                    sheet_pdb_file.write('TER'.ljust(80)+'\n')
+                sheet_pdb_file.write(''.join(block_texts[start:start+len(strands)]))
+            start += len(strands)
 
     def draw_network(domain_id, domain_sheets, edge_labels):
         # Draws plot of the network of interacting strands (all retained sheets
@@ -168,11 +166,14 @@ class network_calcs():
 
         sheet_1 = list(domain_sheets.keys())[0]
         sheets_2_to_n = list(domain_sheets.keys())[1:]
-        G = domain_sheets[sheet_1]
+        network = domain_sheets[sheet_1]
         for sheet_n in sheets_2_to_n:
-            H = domain_sheets[sheet_n]
-            G = nx.compose(G, H)
+            network = network.compose(domain_sheets[sheet_n])
 
+        # networkx is only used to draw the network
+        G = nx.Graph()
+        G.add_nodes_from(network.nodes())
+        G.add_edges_from(network.edges.tolist())
         pos = nx.circular_layout(G)
         plt.clf()
         nx.draw_networkx(G, pos=pos, with_labels=True, node_shape='v')
@@ -231,9 +232,9 @@ class calculate_beta_network(run_stages):
                 sheet_df = dssp_df[dssp_df['SHEET_NUM'] == sheet]
                 sheet_df = sheet_df.reset_index(drop=True)
 
-                strands_dict = network_calcs.create_strands_dict(sheet_df)
+                strand_intervals = network_calcs.create_strand_intervals(sheet_df)
                 strand_pairs, dssp_df = network_calcs.identify_strand_interactions(
-                    sheet_df, strands_dict, dssp_df
+                    sheet_df, strand_intervals, dssp_df
                 )
                 edge_labels, domain_sheets, domain_sheets_dict = network_calcs.create_network(
                     domain_id, sheet, strand_pairs, edge_labels, domain_sheets,
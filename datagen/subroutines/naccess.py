@@ -6,13 +6,20 @@ import itertools
 import isambard_dev as isambard
 import pandas as pd
 import numpy as np
-import networkx as nx
 from collections import OrderedDict
 if __name__ == 'subroutines.naccess':
+    from subroutines.parent_assemblies import parent_assembly_key
+    from subroutines.parse_pdb import format_pdb_blocks
     from subroutines.run_stages import run_stages
 else:
+    from datagen.subroutines.parent_assemblies import parent_assembly_key
+    from datagen.subroutines.parse_pdb import format_pdb_blocks
     from datagen.subroutines.run_stages import run_stages
 
+# NACCESS output (split into lines) for each parent assembly, so that NACCESS
+# is only run once on a parent assembly shared by multiple domains
+assembly_naccess_out = OrderedDict()
+
 
 class naccess_solv_acsblty_calcs():
 
@@ -148,26 +155,31 @@ class naccess_solv_acsblty_calcs():
         print('Calculating solvent accessible surface areas of individual '
               'residues in {}'.format(domain_id))
 
-        with open('Parent_assemblies/{}.pdb'.format(domain_id), 'r') as pdb_file:
-            for line in pdb_file.readlines():
-                line_start = line[0:16]
-                line_end = line[17:]
-                new_line = line_start + ' ' + line_end  # Removes alternate
-                # conformer labels to prevent problems with running naccess
-                # (for some reason naccess encounters an error if alternate
-                # conformers are removed without also removing the
-                # conformer id of the retained conformer)
-                sheet_sub_strings.append(new_line)
-        sheet_string = ''.join(sheet_sub_strings)
+        assembly_key = parent_assembly_key(domain_id)
+        if not assembly_key in assembly_naccess_out:
+            with open('Parent_assemblies/{}.pdb'.format(domain_id), 'r') as pdb_file:
+                for line in pdb_file.readlines():
+                    line_start = line[0:16]
+                    line_end = line[17:]
+                    new_line = line_start + ' ' + line_end  # Removes
+                    # alternate conformer labels to prevent problems with
+                    # running naccess (for some reason naccess encounters an
+                    # error if alternate conformers are removed without also
+                    # removing the conformer id of the retained conformer)
+                    sheet_sub_strings.append(new_line)
+            sheet_string = ''.join(sheet_sub_strings)
 
-        # Runs NACCESS to calculate absolute solvent accessible surface area of
-        # every residue side chain (note that naccess classes C_alpha atoms as
-        # side-chain rather than main chain so that Gly has a side chain sasa
-        # value) in domain
-        naccess_out = isambard.external_programs.naccess.run_naccess(
-            sheet_string, 'rsa', path=False, include_hetatms=True
-        )
-        naccess_out = naccess_out.split('\n')
+            # Runs NACCESS to calculate absolute solvent accessible surface
+            # area of every residue side chain (note that naccess classes
+            # C_alpha atoms as side-chain rather than main chain so that Gly
+            # has a side chain sasa value) in the parent assembly (once per
+            # parent assembly)
+            naccess_out = isambard.external_programs.naccess.run_naccess(
+                sheet_string, 'rsa', path=False, include_hetatms=True
+            )
+            naccess_out = naccess_out.split('\n')
+            assembly_naccess_out[assembly_key] = naccess_out
+        naccess_out = assembly_naccess_out[assembly_key]
         for line in naccess_out:
             if line[0:3] in ['RES', 'HEM']:
                 chain = line[8:9].strip()
@@ -258,15 +270,16 @@ class naccess_solv_acsblty_calcs():
         strand_number_set = [strand for strand in set(dssp_df['STRAND_NUM'].tolist())
                              if strand != '']
 
+        # Groups the residues of dssp_df by strand in a single pass
+        strand_res_ids = OrderedDict((strand, []) for strand in strand_number_set)
+        strand_df = dssp_df[dssp_df['STRAND_NUM'] != '']
+        for strand, res_id in zip(strand_df['STRAND_NUM'].tolist(),
+                                  strand_df['RES_ID'].tolist()):
+            strand_res_ids[strand].append(res_id)
+
+        block_texts = format_pdb_blocks(dssp_df, list(strand_res_ids.values()))
         with open('Beta_strands/{}.pdb'.format(domain_id), 'w') as new_pdb_file:
-            for strand in strand_number_set:
-                dssp_df_strand = dssp_df[dssp_df['STRAND_NUM'] == strand]
-                chain_res_num = dssp_df_strand['RES_ID'].tolist()
-
-                for row in range(dssp_df.shape[0]):
-                    if dssp_df['RES_ID'][row] in chain_res_num:
-                        new_pdb_file.write('{}\n'.format(dssp_df['PDB_FILE_LINES'][row]))
-                new_pdb_file.write('TER'.ljust(80)+'\n')
+            new_pdb_file.write(''.join(block_texts))
 
     def calc_core_residues_sandwich(domain_id, sheets, sec_struct_dfs_dict):
         # Calculates whether each residue faces towards the interior or the
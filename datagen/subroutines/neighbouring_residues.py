@@ -5,8 +5,10 @@ import numpy as np
 from collections import OrderedDict
 if __name__ == 'subroutines.neighbouring_residues':
     from subroutines.run_stages import run_stages
+    from subroutines.structure_cache import convert_pdb_to_ampal
 else:
     from datagen.subroutines.run_stages import run_stages
+    from datagen.subroutines.structure_cache import convert_pdb_to_ampal
 
 
 class nearest_neighbours(run_stages):
@@ -26,7 +28,7 @@ class nearest_neighbours(run_stages):
             neighbours_dict = OrderedDict()
 
             # Creates AMPAL object
-            domain = isambard.ampal.convert_pdb_to_ampal(
+            domain = convert_pdb_to_ampal(
                 'Parent_assemblies/{}.pdb'.format(domain_id)
             )
 
@@ -2,20 +2,87 @@
 
 import copy
 import os
-import networkx as nx
+import pickle
 import pandas as pd
 import numpy as np
 from collections import OrderedDict
 if __name__ == 'subroutines.output_dataframe':
     from subroutines.run_stages import run_stages
+    from subroutines.structure_cache import load_pdb_records
     from subroutines.twist_bend_shear import find_strand_twist, find_sheet_shear
     from subroutines.variables import gen_amino_acids_dict
 else:
     from datagen.subroutines.run_stages import run_stages
+    from datagen.subroutines.structure_cache import load_pdb_records
     from datagen.subroutines.twist_bend_shear import find_strand_twist, find_sheet_shear
     from datagen.subroutines.variables import gen_amino_acids_dict
 
 
+# Scans of OPM PDB files already carried out in this process, keyed by file
+# path, mtime and size
+opm_scans = OrderedDict()
+
+
+def scan_opm_pdb(opm_database, pdb_code, cache_dir):
+    # Reads the OPM PDB file of the input PDB code in a single pass, listing
+    # the z-coordinate of every C_alpha atom (keyed by (res_id, resname), with
+    # the order in which each residue is first listed in the file, and taking
+    # the final listed conformer's position) plus the membrane boundaries (as
+    # defined by the z-coordinates of the DUM atoms). Scans are cached both
+    # in memory and as a pickle file in the cache directory, and are only
+    # repeated if the OPM PDB file has changed.
+    opm_path = '{}/{}.pdb'.format(opm_database, pdb_code)
+    stat = os.stat(opm_path)
+    key = (os.path.abspath(opm_path), stat.st_mtime_ns, stat.st_size)
+    if key in opm_scans:
+        return opm_scans[key]
+
+    scan_path = '{}OPM_scans/{}.pkl'.format(cache_dir, pdb_code)
+    if os.path.isfile(scan_path):
+        try:
+            with open(scan_path, 'rb') as pickle_file:
+                scan_key, scan = pickle.load(pickle_file)
+            if scan_key == key:
+                opm_scans[key] = scan
+                return scan
+        except (pickle.UnpicklingError, EOFError, ValueError):
+            pass
+
+    calpha_z_coords = OrderedDict()
+    lower_bound = 0
+    upper_bound = 0
+    with open(opm_path, 'r') as opm_file:
+        for line in opm_file:
+            if line[17:20].strip() != 'DUM':
+                if (
+                        line[0:6].strip() in ['ATOM', 'HETATM']
+                    and line[12:16].strip() == 'CA'
+                ):
+                    res_key = (line[21:27].replace(' ', ''), line[17:20].strip())
+                    try:
+                        z_coord = float(line[46:54])
+                    except ValueError:
+                        continue
+                    if res_key in calpha_z_coords:
+                        calpha_z_coords[res_key] = (calpha_z_coords[res_key][0], z_coord)
+                    else:
+                        calpha_z_coords[res_key] = (len(calpha_z_coords), z_coord)
+            else:
+                if float(line[46:54]) > upper_bound:
+                    upper_bound = float(line[46:54])
+                elif float(line[46:54]) < lower_bound:
+                    lower_bound = float(line[46:54])
+
+    scan = (calpha_z_coords, lower_bound, upper_bound)
+    opm_scans[key] = scan
+    if not os.path.isdir('{}OPM_scans'.format(cache_dir)):
+        os.mkdir('{}OPM_scans'.format(cache_dir))
+    with open(scan_path, 'wb') as pickle_file:
+        pickle.dump((key, scan), pickle_file)
+
+    return scan
+
+
 class output_calcs():
 
     def make_res_id_to_fasta_dict(domain_id, amino_acids_dict):
@@ -23,18 +90,13 @@ class output_calcs():
         # amino acid codes from the input dataframe (dssp_df)
 
         # Extracts list of consecutive res_ids from biological assembly PDB file
-        with open('Parent_assemblies/{}.pdb'.format(domain_id), 'r') as pdb_file:
-            pdb_file_lines = pdb_file.readlines()
-        pdb_file_lines = [line for line in pdb_file_lines if line[0:6].strip()
-                          in ['ATOM', 'HETATM']]
-        consec_res_id_list = []
-        consec_res_name_list = []
-        for line in pdb_file_lines:
-            chain_res_num = line[21:27].replace(' ', '')
-            res_name = line[17:20].strip()
-            if not chain_res_num in consec_res_id_list:
-                consec_res_id_list.append(chain_res_num)
-                consec_res_name_list.append(res_name)
+        pdb_columns = load_pdb_records('Parent_assemblies/{}.pdb'.format(domain_id))
+        atom_mask = pdb_columns['REC'] != 'TER'
+        res_ids = pdb_columns['RES_ID'][atom_mask]
+        res_names = pdb_columns['RESNAME'][atom_mask]
+        first_indices = np.sort(np.unique(res_ids, return_index=True)[1])
+        consec_res_id_list = res_ids[first_indices].tolist()
+        consec_res_name_list = res_names[first_indices].tolist()
 
         # Generates res_id to FASTA code dictionary
         fasta_list = ['']*len(consec_res_id_list)
@@ -51,7 +113,7 @@ class output_calcs():
         return res_id_to_fasta_dict, consec_res_id_list
 
     def determine_strand_orientation(domain_id, strand_id, strand_df, tm,
-                                     discard_non_tm, opm_database,
+                                     discard_non_tm, opm_database, cache_dir,
                                      unprocessed_list, unprocessed_strands):
         # Determines orientation of input strand in domain if that domain is in
         # the OPM database. If the N-terminus is in the periplasm
@@ -62,7 +124,6 @@ class output_calcs():
         pdb_code = domain_id[0:4]
         res_ids_pdb = strand_df['RES_ID'].tolist()
         resname_pdb = dict(zip(strand_df['RES_ID'].tolist(), strand_df['RESNAME'].tolist()))
-        conformers_pdb = dict(zip(strand_df['RES_ID'].tolist(), strand_df['CONFORMER'].tolist()))
         strand_coordinates_opm = OrderedDict()
         in_database = False
         lower_bound = 0
@@ -75,32 +136,22 @@ class output_calcs():
                       '{}'.format(domain_id, strand_id))
                 in_database = True
 
-                with open('{}/{}.pdb'.format(opm_database, pdb_code), 'r') as opm_file:
-                    for line in opm_file:
-                        if line[17:20].strip() != 'DUM':  # Don't put as 'and'
-                            # statement with line below (see corresponding 'else' statement)
-                            if line[0:6].strip() in ['ATOM', 'HETATM']:
-                                chain_res_num = line[21:27].replace(' ', '')
-                                if (
-                                        line[12:16].strip() == 'CA'
-                                    and chain_res_num in res_ids_pdb
-                                    and line[17:20].strip() == resname_pdb[chain_res_num]  # NOTE
-                                    # that OPM sometimes adds in alternate conformers that were
-                                    # not present in the original PDB file - consequently, I ignore
-                                    # the alternate conformer label, as I am only interested in the
-                                    # Calpha position (since this would not be expected to vary
-                                    # greatly between conformers unless those conformers are within
-                                    # a consecutive sequence of alternate conformers). This means
-                                    # that the code will always take the final listed conformer's
-                                    # Calpha position.
-                                    # and line[16:17].strip() == conformers_pdb[chain_res_num]
-                                ):
-                                    strand_coordinates_opm[chain_res_num] = float(line[46:54])
-                        else:
-                            if float(line[46:54]) > upper_bound:
-                                upper_bound = float(line[46:54])
-                            elif float(line[46:54]) < lower_bound:
-                                lower_bound = float(line[46:54])
+                # NOTE that OPM sometimes adds in alternate conformers that
+                # were not present in the original PDB file - consequently, I
+                # ignore the alternate conformer label, as I am only
+                # interested in the Calpha position (since this would not be
+                # expected to vary greatly between conformers unless those
+                # conformers are within a consecutive sequence of alternate
+                # conformers). This means that the code will always take the
+                # final listed conformer's Calpha position.
+                calpha_z_coords, lower_bound, upper_bound = scan_opm_pdb(
+                    opm_database, pdb_code, cache_dir
+                )
+                res_keys = [(res_id, resname) for res_id, resname in resname_pdb.items()
+                            if (res_id, resname) in calpha_z_coords]
+                res_keys = sorted(res_keys, key=lambda res_key: calpha_z_coords[res_key][0])
+                for res_key in res_keys:
+                    strand_coordinates_opm[res_key[0]] = calpha_z_coords[res_key][1]
 
                 z_coordinates = list(strand_coordinates_opm.values())
                 # Ensures that all residues in input domain are present in the OPM
@@ -410,7 +461,7 @@ class gen_output(run_stages):
             G = networks[0]
             for num in range(1, len(networks)):
                 H = networks[num]
-                G = nx.compose(G, H)
+                G = G.compose(H)
 
             dssp_df = sec_struct_dfs_dict[domain_id]
 
@@ -684,7 +735,8 @@ class gen_output(run_stages):
                  unprocessed_strands
                  ) = output_calcs.determine_strand_orientation(
                     domain_id, strand_num, strand_df, tm, self.discard_non_tm,
-                    self.opm_database, unprocessed_list, unprocessed_strands
+                    self.opm_database, self.cache_dir, unprocessed_list,
+                    unprocessed_strands
                 )
 
                 # Lists parent domain IDs
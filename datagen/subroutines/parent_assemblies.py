@@ -0,0 +1,154 @@
+import hashlib
+import os
+import sqlite3
+import multiprocessing
+from collections import OrderedDict
+if __name__ == 'subroutines.parent_assemblies':
+    from subroutines.parse_pdb import link_pdb_file, validate_pdb_file
+else:
+    from datagen.subroutines.parse_pdb import link_pdb_file, validate_pdb_file
+
+# Verdicts (file hash: whether the file can be parsed by ISAMBARD) loaded from
+# the verdict cache, shared with the worker processes when they are started
+cached_verdicts = {}
+
+
+def hash_pdb_file(pdb_path):
+    # Calculates the SHA-1 hash of the contents of a PDB file in the PDB
+    # database (of the compressed file if it is gzipped)
+    sha1 = hashlib.sha1()
+    with open(pdb_path, 'rb') as pdb_file:
+        for block in iter(lambda: pdb_file.read(1024*1024), b''):
+            sha1.update(block)
+
+    return sha1.hexdigest()
+
+
+def parent_assembly_name(pdb_code, assembly):
+    # Generates the name under which a parent assembly (the asymmetric unit if
+    # no assembly number is specified) is stored, shared by all of the
+    # domains from that assembly
+    if assembly == '':
+        assembly = 'au'
+    return '{}_assembly_{}'.format(pdb_code, assembly)
+
+
+def link_domain_view(assembly_path, domain_path):
+    # Creates the domain-level view of a stored parent assembly, as a
+    # (relative) symbolic link to the assembly PDB file, falling back to a
+    # hardlink if symbolic links aren't supported
+    try:
+        os.symlink(os.path.relpath(assembly_path, os.path.dirname(domain_path)),
+                   domain_path)
+    except (OSError, NotImplementedError):
+        os.link(assembly_path, domain_path)
+
+
+def parent_assembly_key(domain_id):
+    # Returns the name of the stored parent assembly of the input domain, so
+    # that calculations on the parent assembly can be shared by all of its
+    # domains. Falls back to the domain id if the domain's parent assembly PDB
+    # file is not a view of a stored assembly (e.g. in BetaDesigner runs).
+    pdb_path = os.path.realpath('Parent_assemblies/{}.pdb'.format(domain_id))
+    return os.path.splitext(os.path.basename(pdb_path))[0]
+
+
+def set_cached_verdicts(verdicts):
+    # Initialises the verdicts available to each worker process
+    global cached_verdicts
+    cached_verdicts = verdicts
+
+
+def copy_parent_assembly(task):
+    # Copies a parent assembly PDB file from the PDB database to the output
+    # path, then checks that it can be parsed by ISAMBARD (unless the verdict
+    # for a file with the same contents has already been cached), removing
+    # the copy if not. Defined at the module level so that it can be run in
+    # a process pool.
+    assembly_name, pdb_path, output_path = task
+    file_hash = hash_pdb_file(pdb_path)
+    link_pdb_file(pdb_path, output_path)
+
+    if file_hash in cached_verdicts:
+        valid = cached_verdicts[file_hash]
+    else:
+        valid = validate_pdb_file(output_path)
+    if valid is False:
+        os.remove(output_path)
+
+    return assembly_name, file_hash, valid
+
+
+class pdb_verdict_cache():
+
+    def __init__(self, cache_dir):
+        # Opens (creating if it doesn't already exist) the SQLite cache of
+        # whether PDB files (identified by the hash of their contents) can be
+        # parsed by ISAMBARD
+        self.cache_path = '{}PDB_validation_cache.db'.format(cache_dir)
+        self.connection = sqlite3.connect(self.cache_path)
+        self.connection.execute(
+            'CREATE TABLE IF NOT EXISTS verdicts (file_hash TEXT PRIMARY KEY, '
+            'valid INTEGER)'
+        )
+        self.connection.commit()
+
+    def close(self):
+        self.connection.close()
+
+    def fetch_verdicts(self):
+        verdicts = {}
+        for file_hash, valid in self.connection.execute('SELECT * FROM verdicts'):
+            verdicts[file_hash] = bool(valid)
+
+        return verdicts
+
+    def record_verdicts(self, verdicts):
+        with self.connection:
+            self.connection.executemany(
+                'INSERT OR REPLACE INTO verdicts VALUES (?, ?)',
+                [(file_hash, int(valid)) for file_hash, valid in verdicts.items()]
+            )
+
+
+def copy_parent_assemblies(tasks, cache_dir, workers=1):
+    # Copies and validates the input list of (assembly name, PDB file path,
+    # output path) parent assemblies, distributing them across a process pool
+    # if more than one worker process is specified. Returns an ordered
+    # dictionary of whether each parent assembly could be parsed by ISAMBARD
+    # (in the same order as the input tasks).
+    valid_dict = OrderedDict()
+    if len(tasks) == 0:
+        return valid_dict
+
+    verdict_cache = pdb_verdict_cache(cache_dir)
+    verdicts = verdict_cache.fetch_verdicts()
+
+    if workers > 1:
+        pool = multiprocessing.Pool(
+            workers, initializer=set_cached_verdicts, initargs=(verdicts,)
+        )
+        chunksize = max(1, min(16, len(tasks) // (workers*4)))
+        results = pool.imap(copy_parent_assembly, tasks, chunksize)
+    else:
+        pool = None
+        set_cached_verdicts(verdicts)
+        results = map(copy_parent_assembly, tasks)
+
+    new_verdicts = OrderedDict()
+    try:
+        for num, (assembly_name, file_hash, valid) in enumerate(results):
+            print('Copied parent assembly {}'.format(assembly_name))
+            print('{:0.2f}%'.format(((num+1)/len(tasks))*100))
+            valid_dict[assembly_name] = valid
+            if not file_hash in verdicts:
+                new_verdicts[file_hash] = valid
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+
+    verdict_cache.record_verdicts(new_verdicts)
+    verdict_cache.close()
+
+    return valid_dict
@@ -0,0 +1,378 @@
+import fcntl
+import gzip
+import os
+import shutil
+import numpy as np
+from collections import OrderedDict
+
+# Fixed-width column boundaries of the fields in PDB ATOM / HETATM / TER
+# records (see the PDB file format v3.3 documentation)
+pdb_record_fields = OrderedDict({'REC': (0, 6),
+                                 'ATMNUM': (6, 11),
+                                 'ATMNAME': (12, 16),
+                                 'CONFORMER': (16, 17),
+                                 'RESNAME': (17, 20),
+                                 'CHAIN': (21, 22),
+                                 'RESNUM': (22, 26),
+                                 'INSCODE': (26, 27),
+                                 'XPOS': (30, 38),
+                                 'YPOS': (38, 46),
+                                 'ZPOS': (46, 54),
+                                 'OCC': (54, 60),
+                                 'BFAC': (60, 66),
+                                 'ELEMENT': (76, 78),
+                                 'CHARGE': (78, 80)})
+int_fields = ['ATMNUM', 'RESNUM']
+float_fields = ['XPOS', 'YPOS', 'ZPOS', 'OCC', 'BFAC']
+
+
+def slice_columns(fixed_width, start, stop):
+    # Slices the byte columns start:stop out of every row of the (n x 80)
+    # array of PDB records, returning a 1D array of fixed-length byte strings
+    field = np.ascontiguousarray(fixed_width[:, start:stop])
+    return field.view('S{}'.format(stop-start)).ravel()
+
+
+def convert_numeric(field, dtype, fill):
+    # Converts an array of byte strings into numbers in a single vectorised
+    # call. If any of the entries cannot be converted (e.g. a blank occupancy
+    # value), falls back to converting the entries one at a time, replacing
+    # those that fail with the fill value.
+    try:
+        return field.astype(dtype)
+    except ValueError:
+        values = np.full(field.shape[0], fill, dtype=dtype)
+        for index, value in enumerate(field):
+            try:
+                values[index] = dtype(value)
+            except ValueError:
+                pass
+        return values
+
+
+def decode_strings(field):
+    # Converts an array of byte strings into an array of (unicode) strings.
+    # PDB records should only contain ASCII characters, for which the dtype
+    # cast is much faster than decoding each entry individually.
+    try:
+        return field.astype('U')
+    except UnicodeDecodeError:
+        return np.char.decode(field, 'latin-1')
+
+
+def decode_pdb_records(pdb_bytes):
+    # Decodes all ATOM / HETATM / TER records of a PDB file (input as bytes)
+    # into a dictionary of column arrays in a single pass. String fields are
+    # stripped of whitespace, the residue / atom numbers are converted into
+    # integers and the coordinates, occupancy and B-factor into floats (numeric
+    # fields of TER records are set to 0 / nan). The RES_ID (= chain + residue
+    # number + insertion code) and RES_KEY (= residue number + insertion code)
+    # of each record are also listed.
+    lines = pdb_bytes.splitlines()
+    if len(lines) == 0:
+        lines = np.array([], dtype='S80')
+    else:
+        lines = np.array(lines)
+
+    rec = np.char.strip(lines.astype('S6'))
+    records = lines[np.isin(rec, [b'ATOM', b'HETATM', b'TER'])]
+
+    # Pads (with spaces) / truncates every record to 80 characters, then
+    # views the records as an (n x 80) array of bytes from which each field is
+    # sliced
+    fixed_width = records.astype('S80').view(np.uint8).reshape(-1, 80).copy()
+    fixed_width[fixed_width == 0] = 32
+
+    atom_mask = np.isin(np.char.strip(slice_columns(fixed_width, 0, 6)),
+                        [b'ATOM', b'HETATM'])
+
+    pdb_columns = OrderedDict()
+    pdb_columns['PDB_FILE_LINES'] = decode_strings(records)
+    for field, (start, stop) in pdb_record_fields.items():
+        values = slice_columns(fixed_width, start, stop)
+        if field in int_fields:
+            column = np.zeros(values.shape[0], dtype=np.int64)
+            column[atom_mask] = convert_numeric(values[atom_mask], int, 0)
+        elif field in float_fields:
+            column = np.full(values.shape[0], np.nan)
+            column[atom_mask] = convert_numeric(values[atom_mask], float, np.nan)
+        else:
+            column = decode_strings(np.char.strip(values))
+        pdb_columns[field] = column
+
+    pdb_columns['RES_ID'] = decode_strings(np.char.replace(
+        slice_columns(fixed_width, 21, 27), b' ', b''
+    ))
+    pdb_columns['RES_KEY'] = decode_strings(np.char.strip(
+        slice_columns(fixed_width, 22, 27)
+    ))
+
+    return pdb_columns
+
+
+def find_pdb_file(pdb_path):
+    # Returns the path of the input PDB file in the local PDB database,
+    # allowing for the database to be a mirror of gzipped files (named either
+    # as the uncompressed file plus a '.gz' extension, or in the
+    # 'pdb{code}.ent.gz' format of the PDB FTP archive)
+    directory, file_name = os.path.split(pdb_path)
+    candidate_paths = [pdb_path, '{}.gz'.format(pdb_path)]
+    if file_name.endswith('.pdb'):
+        ent_path = os.path.join(directory, 'pdb{}.ent'.format(file_name[:-4]))
+        candidate_paths += [ent_path, '{}.gz'.format(ent_path)]
+
+    for candidate_path in candidate_paths:
+        if os.path.isfile(candidate_path):
+            return candidate_path
+
+    raise FileNotFoundError('No such file: {}'.format(pdb_path))
+
+
+def open_pdb_file(pdb_path, mode='r'):
+    # Opens a PDB file, decompressing it on the fly if it is gzipped (so only
+    # the portion of the file that is read is decompressed)
+    if pdb_path.endswith('.gz'):
+        if mode == 'r':
+            mode = 'rt'
+        return gzip.open(pdb_path, mode)
+    else:
+        return open(pdb_path, mode)
+
+
+def copy_pdb_file(pdb_path, output_path):
+    # Copies a PDB file to the output path, streaming the decompressed file
+    # straight to the output path if the input file is gzipped
+    if pdb_path.endswith('.gz'):
+        with gzip.open(pdb_path, 'rb') as pdb_file:
+            with open(output_path, 'wb') as output_file:
+                shutil.copyfileobj(pdb_file, output_file)
+    else:
+        shutil.copy(pdb_path, output_path)
+
+
+# ioctl request code used to clone a file as a copy-on-write reflink on
+# filesystems that support it (e.g. btrfs, XFS)
+ficlone = 0x40049409
+
+
+def link_pdb_file(pdb_path, output_path):
+    # Creates a copy of an uncompressed PDB file at the output path without
+    # duplicating its data where possible - as a copy-on-write reflink, else a
+    # hardlink (if on the same filesystem), else falling back to a standard
+    # copy. Gzipped files are decompressed to the output path as in
+    # copy_pdb_file. Note that hardlinked files share their data with the
+    # PDB database, so must only ever be read (or replaced), never modified
+    # in place.
+    if pdb_path.endswith('.gz'):
+        copy_pdb_file(pdb_path, output_path)
+        return 'copy'
+
+    try:
+        with open(pdb_path, 'rb') as pdb_file:
+            with open(output_path, 'wb') as output_file:
+                fcntl.ioctl(output_file.fileno(), ficlone, pdb_file.fileno())
+        return 'reflink'
+    except OSError:
+        if os.path.isfile(output_path):
+            os.remove(output_path)
+
+    try:
+        os.link(pdb_path, output_path)
+        return 'hardlink'
+    except OSError:
+        shutil.copy(pdb_path, output_path)
+        return 'copy'
+
+
+def validate_pdb_bytes(pdb_bytes):
+    # Checks that a PDB file (input as bytes) can be parsed into an AMPAL
+    # object without raising a ValueError, i.e. that the file can be decoded
+    # as text and that the atom / residue numbers of every ATOM / HETATM
+    # record can be converted into integers and its coordinates, occupancy
+    # and B-factor into floats (the conversions performed by ISAMBARD's PDB
+    # parser), without constructing the AMPAL object itself
+    try:
+        pdb_bytes.decode('utf-8')
+    except UnicodeDecodeError:
+        return False
+
+    lines = pdb_bytes.splitlines()
+    if len(lines) == 0:
+        return True
+    lines = np.array(lines)
+    rec = np.char.strip(lines.astype('S6'))
+    records = lines[np.isin(rec, [b'ATOM', b'HETATM'])]
+
+    fixed_width = records.astype('S80').view(np.uint8).reshape(-1, 80).copy()
+    fixed_width[fixed_width == 0] = 32
+
+    for field, (start, stop) in pdb_record_fields.items():
+        if field in int_fields:
+            dtype = int
+        elif field in float_fields:
+            dtype = float
+        else:
+            continue
+
+        # Falls back to converting the entries one at a time if the
+        # vectorised conversion fails, since Python's int / float accept some
+        # (non-ASCII) strings that the numpy cast doesn't
+        values = np.char.strip(slice_columns(fixed_width, start, stop))
+        try:
+            values.astype(dtype)
+        except ValueError:
+            try:
+                for value in values:
+                    dtype(value.decode('utf-8'))
+            except ValueError:
+                return False
+
+    return True
+
+
+def validate_pdb_file(pdb_path):
+    # Reads a (optionally gzipped) PDB file and checks that it can be parsed
+    # by ISAMBARD (see validate_pdb_bytes)
+    with open_pdb_file(pdb_path, 'rb') as pdb_file:
+        pdb_bytes = pdb_file.read()
+
+    return validate_pdb_bytes(pdb_bytes)
+
+
+def parse_pdb_records(pdb_path):
+    # Reads a (optionally gzipped) PDB file and decodes its ATOM / HETATM /
+    # TER records into a dictionary of column arrays
+    with open_pdb_file(pdb_path, 'rb') as pdb_file:
+        pdb_bytes = pdb_file.read()
+
+    return decode_pdb_records(pdb_bytes)
+
+
+def select_pdb_records(pdb_columns, indices, columns):
+    # Selects the rows of the input column arrays at the listed indices,
+    # returning an ordered dictionary of the requested columns (string fields
+    # are converted into object arrays, to match the dtype of a column created
+    # from a list of Python strings)
+    selected = OrderedDict()
+    for column in columns:
+        values = pdb_columns[column][indices]
+        if values.dtype.kind == 'U':
+            values = values.astype(object)
+        selected[column] = values
+
+    return selected
+
+
+def format_pdb_blocks(pdb_df, blocks):
+    # Formats the records of each of the input blocks of residues (each
+    # listed as a sequence of RES_IDs) in pdb_df as PDB text, terminating
+    # each block with a TER card. The records of a block are listed in the
+    # order in which they appear in pdb_df. The coordinates of each record
+    # are written from the XPOS / YPOS / ZPOS columns, and all other fields
+    # are taken from its PDB_FILE_LINES entry. All blocks are grouped and
+    # formatted in a single pass over pdb_df, and the text of each block is
+    # returned.
+    ter_line = '{}\n'.format('TER'.ljust(80))
+    if len(blocks) == 0:
+        return []
+
+    # Groups the rows of pdb_df by RES_ID (retaining their order within
+    # each group)
+    res_ids = np.asarray(pdb_df['RES_ID'].values).astype(str)
+    unique_res_ids, res_codes = np.unique(res_ids, return_inverse=True)
+    res_order = np.argsort(res_codes, kind='stable')
+    res_counts = np.bincount(res_codes, minlength=unique_res_ids.shape[0])
+    res_starts = np.cumsum(res_counts) - res_counts
+
+    # Lists the (block, RES_ID) pairs, discarding duplicates and RES_IDs that
+    # aren't in pdb_df
+    block_sizes = [len(block) for block in blocks]
+    block_nums = np.repeat(np.arange(len(blocks)), block_sizes)
+    block_res_ids = np.array(
+        [res_id for block in blocks for res_id in block], dtype=str
+    )
+    if unique_res_ids.shape[0] == 0 or block_res_ids.shape[0] == 0:
+        return [ter_line]*len(blocks)
+    codes = np.searchsorted(unique_res_ids, block_res_ids)
+    codes = np.minimum(codes, unique_res_ids.shape[0]-1)
+    present = unique_res_ids[codes] == block_res_ids
+    pairs = np.unique(block_nums[present]*unique_res_ids.shape[0] + codes[present])
+    pair_blocks, pair_codes = np.divmod(pairs, unique_res_ids.shape[0])
+
+    # Gathers the rows of every pair, then sorts them by block and row
+    pair_counts = res_counts[pair_codes]
+    offsets = np.cumsum(pair_counts) - pair_counts
+    rows = res_order[np.repeat(res_starts[pair_codes] - offsets, pair_counts)
+                     + np.arange(pair_counts.sum())]
+    row_blocks = np.repeat(pair_blocks, pair_counts)
+    if rows.shape[0] == 0:
+        return [ter_line]*len(blocks)
+    order = np.lexsort((rows, row_blocks))
+    rows = rows[order]
+    row_blocks = row_blocks[order]
+
+    # Formats the selected records as an (n x width) array of bytes, with
+    # the coordinates (columns 31-54) overwritten and each record terminated
+    # by a newline character
+    lines = np.asarray(pdb_df['PDB_FILE_LINES'].values[rows]).astype(str)
+    try:
+        lines = lines.astype('S')
+        encoding = 'ascii'
+    except UnicodeEncodeError:
+        lines = np.char.encode(lines, 'latin-1')
+        encoding = 'latin-1'
+    line_lengths = np.maximum(np.char.str_len(lines), 54)
+    width = int(line_lengths.max(initial=54)) + 1
+    fixed_width = lines.astype('S{}'.format(width)).view(np.uint8).reshape(-1, width).copy()
+    fixed_width[fixed_width == 0] = 32
+
+    coords = np.char.add(np.char.add(
+        np.char.mod('%8.3f', pdb_df['XPOS'].values[rows].astype(float)),
+        np.char.mod('%8.3f', pdb_df['YPOS'].values[rows].astype(float))),
+        np.char.mod('%8.3f', pdb_df['ZPOS'].values[rows].astype(float))
+    )
+    fits = np.char.str_len(coords) == 24  # Coordinates outside of the range
+    # that can be written in the PDB format are left as in the input record
+    coords = coords[fits].astype('S24').view(np.uint8).reshape(-1, 24)
+    fixed_width[np.nonzero(fits)[0][:, None], np.arange(30, 54)] = coords
+
+    fixed_width[np.arange(rows.shape[0]), line_lengths] = ord('\n')
+    keep = np.arange(width)[None, :] <= line_lengths[:, None]
+    pdb_text = fixed_width[keep].tobytes().decode(encoding)
+
+    # Splits the text into blocks
+    line_ends = np.cumsum(line_lengths + 1)
+    block_ends = np.searchsorted(row_blocks, np.arange(len(blocks)), side='right')
+    char_ends = np.append(0, line_ends)[block_ends]
+    char_starts = np.append(0, char_ends[:-1])
+    block_texts = [pdb_text[start:end] + ter_line for start, end in
+                   zip(char_starts.tolist(), char_ends.tolist())]
+
+    return block_texts
+
+
+def index_pdb_residues(pdb_columns):
+    # Builds an index of the line offsets of every residue in the input column
+    # arrays, keyed by (chain, residue number + insertion code), plus a map of
+    # the TER-delimited blocks of records. Each block is listed as the
+    # (start, stop) offsets of its first record and of the TER record that
+    # terminates it (the end of the file is treated as a final TER record).
+    rec = pdb_columns['REC']
+    atom_indices = np.flatnonzero(rec != 'TER')
+    keys = np.char.add(np.char.add(pdb_columns['CHAIN'][atom_indices], ':'),
+                       pdb_columns['RES_KEY'][atom_indices])
+
+    residue_index = OrderedDict()
+    if atom_indices.shape[0] > 0:
+        order = np.argsort(keys, kind='stable')
+        sorted_keys = keys[order]
+        boundaries = np.flatnonzero(sorted_keys[1:] != sorted_keys[:-1]) + 1
+        for group in np.split(order, boundaries):
+            chain, res_key = keys[group[0]].split(':', 1)
+            residue_index[(chain, res_key)] = atom_indices[group]
+
+    ter_offsets = np.append(np.flatnonzero(rec == 'TER'), rec.shape[0])
+    block_starts = np.append(0, ter_offsets[:-1] + 1)
+    ter_blocks = np.column_stack((block_starts, ter_offsets))
+
+    return residue_index, ter_blocks
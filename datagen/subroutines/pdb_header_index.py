@@ -0,0 +1,201 @@
+import os
+import sqlite3
+import multiprocessing
+import pandas as pd
+from collections import OrderedDict
+if __name__ == 'subroutines.pdb_header_index':
+    from subroutines.parse_pdb import find_pdb_file, open_pdb_file
+else:
+    from datagen.subroutines.parse_pdb import find_pdb_file, open_pdb_file
+
+
+def read_pdb_header(pdb_path):
+    # Reads the header lines of a (optionally gzipped) PDB file, stopping at
+    # the first REMARK 4 record (i.e. after the experimental method,
+    # resolution and refinement statistics have been listed, so the remainder
+    # of a gzipped file is never decompressed)
+    header_pdb_lines = []
+    with open_pdb_file(pdb_path, 'r') as pdb_file:
+        for line in pdb_file:
+            if (line.replace(' ', ''))[0:7] == 'REMARK4':
+                break
+            else:
+                header_pdb_lines.append(line)
+
+    return header_pdb_lines
+
+
+def parse_pdb_header(header_pdb_lines):
+    # Extracts the experimental method, resolution and Rfactor (working value)
+    # from the header lines of a PDB file. Returns whether the structure was
+    # not solved by X-ray diffraction, plus its resolution and Rfactor (set to
+    # 0 if a value could not be extracted).
+    not_xray = False
+    resolution = 0
+    rfactor = 0
+    for line in header_pdb_lines:
+        whitespace_remv_line = line.replace(' ', '')
+        if whitespace_remv_line.startswith('EXPDTA'):
+            if not any(x in whitespace_remv_line for x in ['XRAYDIFFRACTION', 'X-RAYDIFFRACTION']):
+                not_xray = True
+                break
+        elif (whitespace_remv_line.startswith('REMARK2')
+              and 'ANGSTROM' in whitespace_remv_line
+              ):
+            try:
+                resolution = float(line[23:30])
+            except ValueError:
+                resolution = 0
+                break
+        elif whitespace_remv_line.startswith('REMARK3RVALUE'):
+            if any(x in whitespace_remv_line for x in ['(WORKINGSET)', '(WORKINGSET,NOCUTOFF)']):
+                rfactor = whitespace_remv_line.split(':')
+                try:
+                    rfactor = float(rfactor[len(rfactor)-1])
+                    break
+                except ValueError:
+                    rfactor = 0
+
+    return not_xray, resolution, rfactor
+
+
+def scan_pdb_header(pdb_path):
+    # Reads and parses the header of a single PDB file (defined at the module
+    # level so that it can be run in a process pool)
+    return parse_pdb_header(read_pdb_header(pdb_path))
+
+
+class pdb_header_index():
+
+    def __init__(self, cache_dir, pdb_database, workers=1):
+        # Opens (creating if it doesn't already exist) the SQLite index of PDB
+        # header information stored in the cache directory. Headers that are
+        # missing from the index are read in parallel if more than one worker
+        # process is specified.
+        self.pdb_database = pdb_database
+        self.workers = workers
+        self.index_path = '{}PDB_header_index.db'.format(cache_dir)
+
+        self.connection = sqlite3.connect(self.index_path)
+        self.connection.execute(
+            'CREATE TABLE IF NOT EXISTS pdb_headers ('
+            'pdb_code TEXT PRIMARY KEY, pdb_path TEXT, mtime_ns INTEGER, '
+            'file_size INTEGER, not_xray INTEGER, resolution REAL, '
+            'rfactor REAL)'
+        )
+        self.connection.commit()
+
+    def close(self):
+        self.connection.close()
+
+    def get_pdb_path(self, pdb_code):
+        # Raises FileNotFoundError if the PDB code is not in the database
+        return find_pdb_file('{}{}/{}.pdb'.format(
+            self.pdb_database, pdb_code[1:3], pdb_code
+        ))
+
+    def fetch_entries(self, pdb_codes):
+        # Retrieves the indexed header information of the input PDB codes
+        entries = OrderedDict()
+        pdb_codes = list(pdb_codes)
+        for start in range(0, len(pdb_codes), 500):
+            chunk = pdb_codes[start:start+500]
+            rows = self.connection.execute(
+                'SELECT pdb_code, pdb_path, mtime_ns, file_size, not_xray, '
+                'resolution, rfactor FROM pdb_headers WHERE pdb_code IN '
+                '({})'.format(', '.join(['?']*len(chunk))), chunk
+            )
+            for row in rows:
+                entries[row[0]] = row[1:]
+
+        return entries
+
+    def scan_headers(self, pdb_paths):
+        # Reads the header information of the input (PDB code: file path)
+        # pairs from the PDB database. When run with multiple worker processes,
+        # the PDB files are distributed across a process pool, with the results
+        # returned in the same order as the input PDB codes.
+        headers = OrderedDict()
+        if len(pdb_paths) == 0:
+            return headers
+
+        if self.workers > 1:
+            pool = multiprocessing.Pool(self.workers)
+            chunksize = max(1, min(64, len(pdb_paths) // (self.workers*4)))
+            results = pool.imap(scan_pdb_header, pdb_paths.values(), chunksize)
+        else:
+            pool = None
+            results = map(scan_pdb_header, pdb_paths.values())
+
+        try:
+            for num, (pdb_code, header) in enumerate(zip(pdb_paths.keys(), results)):
+                print('Obtaining header information for {}'.format(pdb_code))
+                print('{:0.2f}%'.format(((num+1)/len(pdb_paths))*100))
+                headers[pdb_code] = header
+        finally:
+            if pool is not None:
+                pool.close()
+                pool.join()
+
+        return headers
+
+    def lookup(self, pdb_codes):
+        # Returns a dataframe of the header information of each of the input
+        # PDB codes (in the order input). The index is only updated for PDB
+        # files that have not been indexed before, or that have been modified
+        # (or moved to a different database) since they were last indexed.
+        pdb_codes = list(OrderedDict.fromkeys(pdb_codes))
+        entries = self.fetch_entries(pdb_codes)
+
+        file_stats = OrderedDict()
+        stale_paths = OrderedDict()
+        for pdb_code in pdb_codes:
+            try:
+                pdb_path = self.get_pdb_path(pdb_code)
+                stat = os.stat(pdb_path)
+            except FileNotFoundError:
+                continue
+            file_stats[pdb_code] = (pdb_path, stat.st_mtime_ns, stat.st_size)
+            if (
+                not pdb_code in entries
+                or tuple(entries[pdb_code][0:3]) != file_stats[pdb_code]
+            ):
+                stale_paths[pdb_code] = pdb_path
+
+        headers = self.scan_headers(stale_paths)
+        with self.connection:
+            self.connection.executemany(
+                'INSERT OR REPLACE INTO pdb_headers VALUES (?, ?, ?, ?, ?, ?, '
+                '?)', [(pdb_code,) + file_stats[pdb_code]
+                       + (int(not_xray), resolution, rfactor)
+                       for pdb_code, (not_xray, resolution, rfactor)
+                       in headers.items()]
+            )
+        for pdb_code, (not_xray, resolution, rfactor) in headers.items():
+            entries[pdb_code] = file_stats[pdb_code] + (
+                int(not_xray), resolution, rfactor
+            )
+
+        found = []
+        not_xray_list = []
+        resolution_list = []
+        rfactor_list = []
+        for pdb_code in pdb_codes:
+            if pdb_code in file_stats:
+                found.append(True)
+                not_xray_list.append(bool(entries[pdb_code][3]))
+                resolution_list.append(entries[pdb_code][4])
+                rfactor_list.append(entries[pdb_code][5])
+            else:
+                found.append(False)
+                not_xray_list.append(False)
+                resolution_list.append(0)
+                rfactor_list.append(0)
+
+        header_df = pd.DataFrame(OrderedDict({'PDB_CODE': pdb_codes,
+                                              'FOUND': found,
+                                              'NOT_XRAY': not_xray_list,
+                                              'RESOLUTION': resolution_list,
+                                              'RFACTOR': rfactor_list}))
+
+        return header_df
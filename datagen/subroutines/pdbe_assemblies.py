@@ -0,0 +1,306 @@
+import os
+import re
+import sqlite3
+import threading
+import time
+import requests
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+if __name__ == 'subroutines.pdbe_assemblies':
+    from subroutines.parse_pdb import find_pdb_file, open_pdb_file
+else:
+    from datagen.subroutines.parse_pdb import find_pdb_file, open_pdb_file
+
+# URL of the PDBe analysis page listing the assemblies of a PDB entry (can be
+# pointed at a local server, e.g. for running the pipeline offline against
+# previously downloaded pages)
+pdbe_analysis_url = 'https://www.ebi.ac.uk/pdbe/entry/pdb/{}/analysis'
+
+
+def parse_preferred_assembly(page):
+    # Finds the preferred assembly from a screen scrape of the PDBe analysis
+    # page of a PDB entry. Returns the number of lines marked as the preferred
+    # assembly, the preferred assembly number (0 if not found) and whether
+    # there was an error in parsing the assembly number.
+    count = 0
+    assembly = 0
+    error = False
+
+    for line in page.split('\n'):
+        if '(preferred)' in line:
+            count += 1
+            line = [sub_line for sub_line in line.split('<') if
+                    '(preferred)' in sub_line]
+            if len(line) != 1:
+                error = True
+
+            line = line[0]
+            line = [sub_line for sub_line in line.split('>') if
+                    '(preferred)' in sub_line]
+            if len(line) != 1:
+                error = True
+
+            else:
+                line = line[0]
+                assembly_nums = [int(s) for s in line.split() if s.isdigit()]
+                if len(assembly_nums) != 1:
+                    error = True
+                else:
+                    assembly = assembly_nums[0]
+
+    return count, assembly, error
+
+
+class preferred_assembly_cache():
+
+    def __init__(self, cache_dir, connections=8, ttl=30,
+                 url=pdbe_analysis_url):
+        # Opens (creating if it doesn't already exist) the SQLite cache of
+        # preferred assemblies stored in the cache directory. Entries older
+        # than the time to live (in days) are fetched again from the PDBe,
+        # with pages requested concurrently over up to the specified number of
+        # (keep-alive) connections.
+        self.connections = connections
+        self.ttl = ttl*24*60*60
+        self.url = url
+        self.cache_path = '{}PDBe_assembly_cache.db'.format(cache_dir)
+        self.sessions = threading.local()
+
+        self.connection = sqlite3.connect(self.cache_path)
+        self.connection.execute(
+            'CREATE TABLE IF NOT EXISTS preferred_assemblies ('
+            'pdb_code TEXT PRIMARY KEY, count INTEGER, assembly INTEGER, '
+            'error INTEGER, fetched REAL)'
+        )
+        self.connection.commit()
+
+    def close(self):
+        self.connection.close()
+
+    def fetch_entries(self, pdb_codes):
+        # Retrieves the cached preferred assemblies of the input PDB codes
+        # that have not yet expired
+        entries = OrderedDict()
+        min_fetched = time.time() - self.ttl
+        pdb_codes = list(pdb_codes)
+        for start in range(0, len(pdb_codes), 500):
+            chunk = pdb_codes[start:start+500]
+            rows = self.connection.execute(
+                'SELECT pdb_code, count, assembly, error FROM '
+                'preferred_assemblies WHERE fetched >= ? AND pdb_code IN '
+                '({})'.format(', '.join(['?']*len(chunk))),
+                [min_fetched] + chunk
+            )
+            for row in rows:
+                entries[row[0]] = (row[1], row[2], bool(row[3]))
+
+        return entries
+
+    def get_session(self):
+        # Each thread reuses its own session, so that connections to the PDBe
+        # are kept alive between requests
+        if not hasattr(self.sessions, 'session'):
+            self.sessions.session = requests.Session()
+        return self.sessions.session
+
+    def fetch_page(self, pdb_code):
+        # Downloads the PDBe analysis page of a PDB entry, returning None if
+        # the page could not be retrieved
+        try:
+            response = self.get_session().get(
+                self.url.format(pdb_code.lower()), timeout=60
+            )
+        except requests.exceptions.RequestException:
+            return None
+
+        if response.status_code != 200:
+            return None
+        return response.text
+
+    def lookup(self, pdb_codes):
+        # Returns an ordered dictionary of the (count, assembly, error) values
+        # parsed from the PDBe analysis page of each of the input PDB codes.
+        # Each PDB code is only requested once, and pages that could not be
+        # retrieved are recorded as having no preferred assembly (and are not
+        # cached, so will be requested again in the next run).
+        pdb_codes = list(OrderedDict.fromkeys(pdb_codes))
+        entries = self.fetch_entries(pdb_codes)
+        missing_codes = [pdb_code for pdb_code in pdb_codes
+                         if not pdb_code in entries]
+
+        fetched = []
+        if missing_codes != []:
+            with ThreadPoolExecutor(max_workers=self.connections) as executor:
+                pages = executor.map(self.fetch_page, missing_codes)
+                for num, (pdb_code, page) in enumerate(zip(missing_codes, pages)):
+                    print('Obtaining preferred assembly of {}'.format(pdb_code))
+                    print('{:0.2f}%'.format(((num+1)/len(missing_codes))*100))
+                    if page is None:
+                        print('Failed to retrieve PDBe page of {}'.format(pdb_code))
+                        entries[pdb_code] = (0, 0, True)
+                    else:
+                        entries[pdb_code] = parse_preferred_assembly(page)
+                        fetched.append(pdb_code)
+
+        with self.connection:
+            self.connection.executemany(
+                'INSERT OR REPLACE INTO preferred_assemblies VALUES (?, ?, ?, '
+                '?, ?)', [(pdb_code, entries[pdb_code][0],
+                           entries[pdb_code][1], int(entries[pdb_code][2]),
+                           time.time()) for pdb_code in fetched]
+            )
+
+        return OrderedDict((pdb_code, entries[pdb_code]) for pdb_code in pdb_codes)
+
+
+def parse_assembly_table_line(line):
+    # Extracts the PDB code and preferred assembly number from a line of a
+    # bulk table of preferred assemblies (fields separated by commas, tabs
+    # and / or spaces, with the PDB code in the first column and the
+    # assembly number in the second). Returns None for lines (e.g. headers
+    # and comments) that don't list a preferred assembly.
+    fields = [field for field in re.split(r'[,\t ]+', line.strip()) if field != '']
+    if len(fields) < 2:
+        return None
+    pdb_code = fields[0].strip('"\'').lower()
+    assembly = fields[1].strip('"\'')
+    if len(pdb_code) != 4 or not pdb_code.isalnum() or not assembly.isdigit():
+        return None
+
+    return pdb_code, int(assembly)
+
+
+def compile_assembly_table(table_path, cache_dir):
+    # Imports a bulk table of preferred assemblies (e.g. exported from the
+    # PDBe) into an SQLite table (indexed on PDB code) stored in the cache
+    # directory. The table is only (re)imported if the bulk table has changed
+    # since it was last imported.
+    db_path = '{}Preferred_assemblies.db'.format(cache_dir)
+    stat = os.stat(table_path)
+    source = (os.path.abspath(table_path), stat.st_mtime_ns, stat.st_size)
+
+    connection = sqlite3.connect(db_path)
+    connection.execute('CREATE TABLE IF NOT EXISTS source (table_path TEXT, '
+                       'mtime_ns INTEGER, file_size INTEGER)')
+    if connection.execute('SELECT * FROM source').fetchall() == [source]:
+        connection.close()
+        return db_path
+
+    print('Importing preferred assemblies into {}'.format(db_path))
+    rows = OrderedDict()
+    with open(table_path, 'r') as table_file:
+        for line in table_file:
+            entry = parse_assembly_table_line(line)
+            if entry is not None:
+                rows[entry[0]] = entry[1]
+
+    with connection:
+        connection.execute('DROP TABLE IF EXISTS preferred_assemblies')
+        connection.execute('CREATE TABLE preferred_assemblies (pdb_code TEXT '
+                           'PRIMARY KEY, assembly INTEGER)')
+        connection.executemany('INSERT INTO preferred_assemblies VALUES (?, '
+                               '?)', rows.items())
+        connection.execute('DELETE FROM source')
+        connection.execute('INSERT INTO source VALUES (?, ?, ?)', source)
+    connection.close()
+
+    return db_path
+
+
+def parse_remark_350(pdb_path):
+    # Selects a preferred assembly from the REMARK 350 records of a (local)
+    # asymmetric unit PDB file: the lowest numbered biomolecule with an
+    # author determined biological unit, else the lowest numbered
+    # biomolecule listed. Returns the same (count, assembly, error) values
+    # as parse_preferred_assembly.
+    biomolecules = OrderedDict()
+    biomolecule = None
+    with open_pdb_file(pdb_path, 'r') as pdb_file:
+        for line in pdb_file:
+            if line[0:6] in ['ATOM  ', 'HETATM', 'MODEL ']:
+                break
+            elif line[0:10] != 'REMARK 350':
+                continue
+
+            whitespace_remv_line = line[10:].replace(' ', '')
+            if whitespace_remv_line.startswith('BIOMOLECULE:'):
+                biomolecule = whitespace_remv_line.split(':')[1].strip()
+                if biomolecule.isdigit():
+                    biomolecule = int(biomolecule)
+                    biomolecules[biomolecule] = False
+                else:
+                    biomolecule = None
+            elif (
+                    biomolecule is not None
+                and whitespace_remv_line.startswith('AUTHORDETERMINED')
+            ):
+                biomolecules[biomolecule] = True
+
+    if len(biomolecules) == 0:
+        return 0, 0, False
+
+    author_biomolecules = [num for num, author in biomolecules.items() if author]
+    if author_biomolecules != []:
+        return 1, min(author_biomolecules), False
+    else:
+        return 1, min(biomolecules.keys()), False
+
+
+class offline_assembly_resolver():
+
+    def __init__(self, cache_dir, pdb_au_database, assembly_table=''):
+        # Resolves preferred assemblies without network access, from a bulk
+        # table of preferred assemblies (if provided) falling back to the
+        # REMARK 350 records of the local asymmetric unit PDB files
+        self.pdb_au_database = pdb_au_database
+        if assembly_table != '':
+            self.connection = sqlite3.connect(
+                compile_assembly_table(assembly_table, cache_dir)
+            )
+        else:
+            self.connection = None
+
+    def close(self):
+        if self.connection is not None:
+            self.connection.close()
+
+    def fetch_entries(self, pdb_codes):
+        # Retrieves the preferred assemblies of the input PDB codes listed in
+        # the bulk table
+        entries = OrderedDict()
+        if self.connection is None:
+            return entries
+
+        pdb_codes = list(pdb_codes)
+        for start in range(0, len(pdb_codes), 500):
+            chunk = [pdb_code.lower() for pdb_code in pdb_codes[start:start+500]]
+            rows = self.connection.execute(
+                'SELECT pdb_code, assembly FROM preferred_assemblies WHERE '
+                'pdb_code IN ({})'.format(', '.join(['?']*len(chunk))), chunk
+            )
+            for row in rows:
+                entries[row[0]] = (1, row[1], False)
+
+        return entries
+
+    def lookup(self, pdb_codes):
+        # Returns an ordered dictionary of the (count, assembly, error) values
+        # of each of the input PDB codes, in the same format as
+        # preferred_assembly_cache.lookup
+        pdb_codes = list(OrderedDict.fromkeys(pdb_codes))
+        entries = self.fetch_entries(pdb_codes)
+
+        assemblies = OrderedDict()
+        for pdb_code in pdb_codes:
+            if pdb_code.lower() in entries:
+                assemblies[pdb_code] = entries[pdb_code.lower()]
+            else:
+                try:
+                    pdb_path = find_pdb_file('{}{}/{}.pdb'.format(
+                        self.pdb_au_database, pdb_code[1:3], pdb_code
+                    ))
+                    assemblies[pdb_code] = parse_remark_350(pdb_path)
+                except FileNotFoundError:
+                    assemblies[pdb_code] = (0, 0, False)
+
+        return assemblies
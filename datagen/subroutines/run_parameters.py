@@ -8,6 +8,21 @@ from collections import OrderedDict
 prompt = '> '
 
 
+def gen_output_dir_name(run_parameters):
+    # Generates the name of the output directory of the run
+    if run_parameters['betadesigner'] is True:
+        dir_name = run_parameters['workingdirectory']
+    else:
+        dir_name = '{}{}_{}_resn_{}_rfac_{}_{}/'.format(
+            run_parameters['workingdirectory'],
+            run_parameters['structuredatabase'], run_parameters['id'],
+            run_parameters['resolution'], run_parameters['rfactor'],
+            run_parameters['auorba']
+        )
+
+    return dir_name
+
+
 def gen_run_parameters(args):
     # Sets as many run parameters as possible from the input file (if provided)
     run_parameters = OrderedDict()
@@ -20,7 +35,8 @@ def gen_run_parameters(args):
                     if key in ['workingdirectory', 'pdbaudatabase',
                                'pdbbadatabase', 'dsspdatabase', 'opmdatabase',
                                'ringdatabase', 'cdhitsequencefiles',
-                               'dataframes']:  # Only include file paths in this list!
+                               'dataframes', 'cachedirectory',
+                               'assemblytable']:  # Only include file paths in this list!
                         value = value.replace('\\', '/')  # For windows file paths
                         if key == 'cdhitsequencefiles':
                             try:
@@ -30,7 +46,7 @@ def gen_run_parameters(args):
                                          '/{}'.format(files[1].strip('/'))]
                             except:
                                 value = []
-                        elif key == 'dataframes':
+                        elif key in ['dataframes', 'assemblytable']:
                             value = '/{}'.format(value.strip('/'))
                         else:
                             value = '/{}/'.format(value.strip('/'))
@@ -217,6 +233,17 @@ def gen_run_parameters(args):
                 run_parameters['workingdirectory'] = directory
                 break
 
+    # Sets the directory in which indexes / caches that persist between runs
+    # (e.g. of PDB header information) are stored. Defaults to a
+    # 'DataGen_cache' directory within the working directory if not specified
+    # in the input file.
+    if not 'cachedirectory' in run_parameters:
+        run_parameters['cachedirectory'] = '{}DataGen_cache/'.format(
+            run_parameters['workingdirectory']
+        )
+    if not os.path.isdir(run_parameters['cachedirectory']):
+        os.makedirs(run_parameters['cachedirectory'])
+
     # Requires user input if the absolute file path of the (locally saved) PDB
     # database (asymmetric units) is not specified in the input file / is not
     # recognised
@@ -327,52 +354,6 @@ def gen_run_parameters(args):
     else:
         run_parameters['ringdatabase'] = ''
 
-    # Locates input file of CDHIT filtered FASTA sequences required for stage
-    # 2 of the analysis pipeline
-    if run_parameters['stage'] == '2' and run_parameters['betadesigner'] is False:
-        cdhit_entries = ''
-        cdhit_output = ''
-        if 'cdhitsequencefiles' in run_parameters:
-            files = run_parameters['cdhitsequencefiles']
-            for input_file in files:
-                if input_file[-4:] == '.pkl':
-                    cdhit_entries = input_file
-                elif input_file[-4:] == '.txt':
-                    cdhit_output = input_file
-            if cdhit_entries != '' and not os.path.isfile(cdhit_entries):
-                print('Absolute path to CDHIT input pkl file not recognised')
-                cdhit_entries = ''
-            if cdhit_output != '' and not os.path.isfile(cdhit_output):
-                print('Absolute file path to CDHIT output txt file not recognised')
-                cdhit_output = ''
-
-        while not os.path.isfile(cdhit_entries) or not cdhit_entries.endswith('.pkl'):
-            print('Specify absolute file path of input pkl file of FASTA '
-                  'sequences fed into CDHIT')
-            cdhit_entries = '/{}'.format(input(prompt).strip('/'))
-            if not os.path.isfile(cdhit_entries):
-                print('Specified file path not recognised')
-            elif cdhit_entries[-4:] != '.pkl':
-                print('Specified file is not a pkl file')
-            else:
-                break
-
-        while not os.path.isfile(cdhit_output) or not cdhit_output.endswith('.txt'):
-            print('Specify absolute file path of txt file of filtered FASTA '
-                  'sequences output from CDHIT')
-            cdhit_output = '/{}'.format(input(prompt).strip('/'))
-            if not os.path.isfile(cdhit_output):
-                print('Specified file path not recognised')
-            elif cdhit_output[-4:] != '.txt':
-                print('Specified file is not a txt file')
-            else:
-                break
-
-        run_parameters['cdhitsequencefiles'] = {'cdhit_entries': cdhit_entries,
-                                                'cdhit_output': cdhit_output}
-    else:
-        run_parameters['cdhitsequencefiles'] = ''
-
     # Requires user input if the absolute file path of the (locally saved) RING
     # database is not specified in the input file / is not recognised
     if run_parameters['stage'] == '2' and run_parameters['betadesigner'] is True:
@@ -464,6 +445,64 @@ def gen_run_parameters(args):
     else:
         run_parameters['rfactor'] = ''
 
+    # Locates input file of CDHIT filtered FASTA sequences required for stage
+    # 2 of the analysis pipeline. If these files are not specified in the
+    # input file, defaults to the files written to the output directory by
+    # stage 1 when run with local sequence clustering.
+    if run_parameters['stage'] == '2' and run_parameters['betadesigner'] is False:
+        cdhit_entries = ''
+        cdhit_output = ''
+        if 'cdhitsequencefiles' in run_parameters:
+            files = run_parameters['cdhitsequencefiles']
+            for input_file in files:
+                if input_file[-4:] == '.pkl':
+                    cdhit_entries = input_file
+                elif input_file[-4:] == '.txt':
+                    cdhit_output = input_file
+            if cdhit_entries != '' and not os.path.isfile(cdhit_entries):
+                print('Absolute path to CDHIT input pkl file not recognised')
+                cdhit_entries = ''
+            if cdhit_output != '' and not os.path.isfile(cdhit_output):
+                print('Absolute file path to CDHIT output txt file not recognised')
+                cdhit_output = ''
+
+        if 'cdhitsequencefiles' not in run_parameters:
+            dir_name = gen_output_dir_name(run_parameters)
+            if (
+                    os.path.isfile('{}CDHIT_entries.pkl'.format(dir_name))
+                and os.path.isfile('{}CDHIT_output.txt'.format(dir_name))
+            ):
+                cdhit_entries = '{}CDHIT_entries.pkl'.format(dir_name)
+                cdhit_output = '{}CDHIT_output.txt'.format(dir_name)
+                print('Using CDHIT files {} and {}'.format(cdhit_entries, cdhit_output))
+
+        while not os.path.isfile(cdhit_entries) or not cdhit_entries.endswith('.pkl'):
+            print('Specify absolute file path of input pkl file of FASTA '
+                  'sequences fed into CDHIT')
+            cdhit_entries = '/{}'.format(input(prompt).strip('/'))
+            if not os.path.isfile(cdhit_entries):
+                print('Specified file path not recognised')
+            elif cdhit_entries[-4:] != '.pkl':
+                print('Specified file is not a pkl file')
+            else:
+                break
+
+        while not os.path.isfile(cdhit_output) or not cdhit_output.endswith('.txt'):
+            print('Specify absolute file path of txt file of filtered FASTA '
+                  'sequences output from CDHIT')
+            cdhit_output = '/{}'.format(input(prompt).strip('/'))
+            if not os.path.isfile(cdhit_output):
+                print('Specified file path not recognised')
+            elif cdhit_output[-4:] != '.txt':
+                print('Specified file is not a txt file')
+            else:
+                break
+
+        run_parameters['cdhitsequencefiles'] = {'cdhit_entries': cdhit_entries,
+                                                'cdhit_output': cdhit_output}
+    else:
+        run_parameters['cdhitsequencefiles'] = ''
+
     # Determines radius of sphere for location of nearest neighbours
     if run_parameters['stage'] == '3':
         if 'radius' in run_parameters:
@@ -545,17 +584,160 @@ def gen_run_parameters(args):
     else:
         run_parameters['discardnontm'] = False
 
+    # Sets the (approximate) memory cap, in MB, of the cache of parsed PDB
+    # structures shared between the different steps of each stage (defaults
+    # to 1024 MB if not specified in the input file)
+    if 'structurecachesize' in run_parameters:
+        try:
+            structure_cache_size = float(run_parameters['structurecachesize'])
+            if structure_cache_size < 0:
+                print('Specified structure cache size must not be negative - '
+                      'using default value of 1024 MB')
+                structure_cache_size = 1024
+        except ValueError:
+            print('Specified structure cache size must be a number - using '
+                  'default value of 1024 MB')
+            structure_cache_size = 1024
+        run_parameters['structurecachesize'] = structure_cache_size
+    else:
+        run_parameters['structurecachesize'] = 1024
+
+    # Sets the number of worker processes over which parallelisable steps of
+    # the pipeline (e.g. reading PDB headers in stage 1) are distributed
+    # (defaults to 1 if not specified in the input file)
+    if 'workers' in run_parameters:
+        try:
+            workers = int(run_parameters['workers'])
+            if workers < 1:
+                print('Specified number of workers must be at least 1 - using '
+                      'a single worker')
+                workers = 1
+        except ValueError:
+            print('Specified number of workers must be an integer - using a '
+                  'single worker')
+            workers = 1
+        run_parameters['workers'] = workers
+    else:
+        run_parameters['workers'] = 1
+
+    # Sets the maximum number of concurrent connections used to look up the
+    # preferred assemblies of PDB entries on the PDBe website, plus the time
+    # (in days) for which the results of these lookups are cached (defaults
+    # to 8 connections and 30 days if not specified in the input file)
+    if 'pdbeconnections' in run_parameters:
+        try:
+            connections = int(run_parameters['pdbeconnections'])
+            if connections < 1:
+                print('Specified number of PDBe connections must be at least '
+                      '1 - using default value of 8')
+                connections = 8
+        except ValueError:
+            print('Specified number of PDBe connections must be an integer - '
+                  'using default value of 8')
+            connections = 8
+        run_parameters['pdbeconnections'] = connections
+    else:
+        run_parameters['pdbeconnections'] = 8
+
+    if 'pdbecachettl' in run_parameters:
+        try:
+            cache_ttl = float(run_parameters['pdbecachettl'])
+            if cache_ttl < 0:
+                print('Specified PDBe cache time to live must not be negative '
+                      '- using default value of 30 days')
+                cache_ttl = 30
+        except ValueError:
+            print('Specified PDBe cache time to live must be a number - using '
+                  'default value of 30 days')
+            cache_ttl = 30
+        run_parameters['pdbecachettl'] = cache_ttl
+    else:
+        run_parameters['pdbecachettl'] = 30
+
+    # Sets whether the preferred biological assemblies of PDB entries are
+    # looked up online (from the PDBe website) or offline (from a bulk table
+    # of preferred assemblies, if provided, else from the REMARK 350 records
+    # of the asymmetric unit PDB files). Defaults to online lookup if not
+    # specified in the input file.
+    if 'assemblylookup' in run_parameters:
+        if not run_parameters['assemblylookup'] in ['online', 'offline']:
+            print('Assembly lookup selection not recognised - looking up '
+                  'preferred assemblies online')
+            run_parameters['assemblylookup'] = 'online'
+    else:
+        run_parameters['assemblylookup'] = 'online'
+
+    if 'assemblytable' in run_parameters:
+        if not os.path.isfile(run_parameters['assemblytable']):
+            print('Specified bulk table of preferred assemblies not recognised '
+                  '- preferred assemblies will be determined from REMARK 350 '
+                  'records when looked up offline')
+            run_parameters['assemblytable'] = ''
+    else:
+        run_parameters['assemblytable'] = ''
+
+    # Sets whether the DSSP output of parent assemblies not in the DSSP
+    # database is calculated with the DSSP program (run via ISAMBARD) or with
+    # the in-process NumPy implementation of the DSSP beta-strand / sheet
+    # assignment. Defaults to the DSSP program if not specified in the input
+    # file.
+    if 'dsspbackend' in run_parameters:
+        if not run_parameters['dsspbackend'] in ['dssp', 'numpy']:
+            print('DSSP backend selection not recognised - running the DSSP '
+                  'program')
+            run_parameters['dsspbackend'] = 'dssp'
+    else:
+        run_parameters['dsspbackend'] = 'dssp'
+
+    # Sets whether the sequences output from stage 1 are clustered locally
+    # (rather than with the CD-HIT web server), plus the sequence identity
+    # threshold and word length used for clustering (defaults to local
+    # clustering at 0.9 sequence identity with a word length of 5, as per the
+    # CD-HIT web server defaults)
+    if run_parameters['stage'] == '1':
+        if 'localclustering' in run_parameters:
+            if run_parameters['localclustering'] in ['yes', 'y', 'true']:
+                run_parameters['localclustering'] = True
+            elif run_parameters['localclustering'] in ['no', 'n', 'false']:
+                run_parameters['localclustering'] = False
+            else:
+                print('Local clustering selection not recognised - clustering '
+                      'sequences locally')
+                run_parameters['localclustering'] = True
+        else:
+            run_parameters['localclustering'] = True
+
+        try:
+            identity = float(run_parameters.get('clusteridentity', 0.9))
+            if identity < 0.4 or identity > 1:
+                print('Specified clustering sequence identity must be between '
+                      '0.4 and 1 - using default value of 0.9')
+                identity = 0.9
+        except ValueError:
+            print('Specified clustering sequence identity must be a number - '
+                  'using default value of 0.9')
+            identity = 0.9
+        run_parameters['clusteridentity'] = identity
+
+        try:
+            word_length = int(run_parameters.get('clusterwordlength', 5))
+            if word_length < 2 or word_length > 5:
+                print('Specified clustering word length must be between 2 and '
+                      '5 - using default value of 5')
+                word_length = 5
+        except ValueError:
+            print('Specified clustering word length must be an integer - '
+                  'using default value of 5')
+            word_length = 5
+        run_parameters['clusterwordlength'] = word_length
+    else:
+        run_parameters['localclustering'] = ''
+        run_parameters['clusteridentity'] = ''
+        run_parameters['clusterwordlength'] = ''
+
     # Creates and / or sets the output directory as the current working
     # directory
-    if run_parameters['betadesigner'] is True:
-        dir_name = run_parameters['workingdirectory']
-    else:
-        dir_name = '{}{}_{}_resn_{}_rfac_{}_{}/'.format(
-            run_parameters['workingdirectory'],
-            run_parameters['structuredatabase'], run_parameters['id'],
-            run_parameters['resolution'], run_parameters['rfactor'],
-            run_parameters['auorba']
-        )
+    dir_name = gen_output_dir_name(run_parameters)
 
     if run_parameters['stage'] == '1':
         if os.path.isdir(dir_name):
@@ -28,6 +28,25 @@ class run_stages():
         self.radius = self.run_parameters['radius']
         self.suffix = self.run_parameters['suffix']
         self.discard_non_tm = self.run_parameters['discardnontm']
+        self.structure_cache_size = self.run_parameters['structurecachesize']
+        self.cache_dir = self.run_parameters['cachedirectory']
+        self.workers = self.run_parameters['workers']
+        self.pdbe_connections = self.run_parameters['pdbeconnections']
+        self.pdbe_cache_ttl = self.run_parameters['pdbecachettl']
+        self.assembly_lookup = self.run_parameters['assemblylookup']
+        self.assembly_table = self.run_parameters['assemblytable']
+        self.dssp_backend = self.run_parameters['dsspbackend']
+        self.local_clustering = self.run_parameters['localclustering']
+        self.cluster_identity = self.run_parameters['clusteridentity']
+        self.cluster_word_length = self.run_parameters['clusterwordlength']
+
+        # Sets the memory cap of the parsed structure cache shared by all of
+        # the pipeline steps run in this process
+        if __name__ == 'subroutines.run_stages':
+            from subroutines.structure_cache import structure_cache
+        else:
+            from datagen.subroutines.structure_cache import structure_cache
+        structure_cache.set_max_size(self.structure_cache_size)
 
         if self.stage == '2' and self.beta_designer is False:
             self.cdhit_entries = self.run_parameters['cdhitsequencefiles']['cdhit_entries']
@@ -38,22 +57,25 @@ class run_stages():
         # structural domain of interest from the CATH database
         if __name__ == 'subroutines.run_stages':
             from subroutines.CATH import (
-                gen_domain_desc_list, domain_desc_filter
+                compile_domain_desc_table, domain_desc_filter
             )
             from subroutines.CDHIT import filter_beta_structure
         else:
             from datagen.subroutines.CATH import (
-                gen_domain_desc_list, domain_desc_filter
+                compile_domain_desc_table, domain_desc_filter
             )
             from datagen.subroutines.CDHIT import filter_beta_structure
 
-        # Generates a list of the domain descriptions provided in
-        # CATH_domain_description_v_4_2_0.txt. Then filters the domain
-        # descriptions list for beta-structures (the type dependent upon the
+        # Compiles the domain descriptions provided in
+        # CATH_domain_description_v_4_2_0.txt into an indexed table (if not
+        # already compiled by a previous run). Then filters the domain
+        # descriptions for beta-structures (the type dependent upon the
         # earlier user input), picking out PDB accession codes and sequences
         # (whose values are stored in the 'domain_df' dataframe).
-        domains_desc = gen_domain_desc_list(orig_dir)
-        domain_df = domain_desc_filter(self.code, domains_desc, self.discard_non_tm)
+        domain_desc_table = compile_domain_desc_table(orig_dir, self.cache_dir)
+        domain_df = domain_desc_filter(
+            self.code, domain_desc_table, self.discard_non_tm
+        )
 
         # Filters the domain_df for X-ray structures below user-specified
         # resolution and R_factor (working value) cutoffs. Writes a file
@@ -248,15 +270,15 @@ class run_stages():
         if self.code[0:4] in ['2.40']:
             beta_structure = extract_barrel_info_from_OPM(self.run_parameters)
 
-            opm_df = beta_structure.parse_opm(orig_dir)
+            opm_index = beta_structure.parse_opm(orig_dir)
             tilt_angles = beta_structure.find_strand_tilt(
-                sec_struct_dfs_dict, opm_df
+                sec_struct_dfs_dict, opm_index
             )
             barrel_structure = calculate_barrel_geometry(self.run_parameters)
             strand_numbers = barrel_structure.find_barrel_strand_number(
                 sec_struct_dfs_dict
             )
-            del opm_df  # To save memory and reduce the number of variables
+            del opm_index  # To save memory and reduce the number of variables
             # considered
 
         # Classifies each beta-strand as either 'edge' or 'central' based upon
@@ -0,0 +1,121 @@
+import sys
+import time
+from collections import Counter, OrderedDict
+from difflib import SequenceMatcher
+
+
+class segment_similarity():
+
+    def __init__(self, threshold=0.95):
+        # Decides whether sequences extracted from a PDB file match a domain
+        # segment sequence, giving the same decisions as
+        # SequenceMatcher(a=segment, b=sequence).ratio() >= threshold, but
+        # only running SequenceMatcher when its decision can't be determined
+        # more cheaply
+        self.threshold = threshold
+        self.ratios = {}
+        self.counts = OrderedDict({'exact': 0,
+                                   'length_bound': 0,
+                                   'composition_bound': 0,
+                                   'cached': 0,
+                                   'sequence_matcher': 0})
+
+    def is_similar(self, segment, sequence, segment_counts=None):
+        # Exact matches have a ratio of 1.0 (with no junk function, the first
+        # matching block that SequenceMatcher finds between two identical
+        # sequences always lies on the diagonal, and so is extended to cover
+        # the full sequence)
+        if segment == sequence:
+            self.counts['exact'] += 1
+            return True
+
+        # The ratio (= 2*matches / total length) is bounded above by the
+        # ratio calculated with the number of matches set to the length of
+        # the shorter sequence, and then to the number of residues the two
+        # sequences have in common (irrespective of their order) - these are
+        # calculated as in SequenceMatcher.real_quick_ratio and quick_ratio
+        # respectively, so rejections are always consistent with ratio()
+        length = len(segment) + len(sequence)
+        if 2.0*min(len(segment), len(sequence))/length < self.threshold:
+            self.counts['length_bound'] += 1
+            return False
+
+        if segment_counts is None:
+            segment_counts = Counter(segment)
+        shared = sum((segment_counts & Counter(sequence)).values())
+        if 2.0*shared/length < self.threshold:
+            self.counts['composition_bound'] += 1
+            return False
+
+        # Remaining pairs are compared with SequenceMatcher, caching the
+        # result for assemblies with many copies of the same chain
+        if (segment, sequence) in self.ratios:
+            self.counts['cached'] += 1
+            ratio = self.ratios[(segment, sequence)]
+        else:
+            self.counts['sequence_matcher'] += 1
+            ratio = SequenceMatcher(a=segment, b=sequence).ratio()
+            self.ratios[(segment, sequence)] = ratio
+
+        return ratio >= self.threshold
+
+
+def benchmark_segment_similarity(domain_desc_file, max_domains=2000):
+    # Compares the speed of segment_similarity against SequenceMatcher for
+    # matching the SSEQS segments listed in a CATH domain description file,
+    # checking that every decision is the same. Each segment is compared
+    # against an exact copy (as for a homo-oligomer with several identical
+    # chains), copies with a single residue substituted / truncated at
+    # either end (as for near-identical sequences extracted from the PDB
+    # file), and the neighbouring segments in the file.
+    segments = []
+    with open(domain_desc_file, 'r') as domains_file:
+        segment = []
+        num_domains = 0
+        for line in domains_file:
+            if line.startswith('SSEQS'):
+                segment.append(line[10:].strip())
+            elif segment != []:
+                segments.append(''.join(segment))
+                segment = []
+            if line.startswith('DOMAIN'):
+                num_domains += 1
+                if num_domains > max_domains:
+                    break
+
+    pairs = []
+    for index, segment in enumerate(segments):
+        middle = len(segment) // 2
+        candidates = [segment, segment,
+                      segment[:middle] + 'X' + segment[middle+1:],
+                      segment[1:], segment[:-3]]
+        candidates += segments[index+1:index+4]
+        pairs += [(segment, candidate) for candidate in candidates]
+
+    start = time.time()
+    ref_decisions = [SequenceMatcher(a=segment, b=sequence).ratio() >= 0.95
+                     for segment, sequence in pairs]
+    ref_time = time.time() - start
+
+    matcher = segment_similarity(0.95)
+    start = time.time()
+    decisions = [matcher.is_similar(segment, sequence)
+                 for segment, sequence in pairs]
+    fast_time = time.time() - start
+
+    mismatches = sum(1 for ref, fast in zip(ref_decisions, decisions) if ref != fast)
+    print('{} segment / sequence pairs from {} segments'.format(len(pairs), len(segments)))
+    print('SequenceMatcher: {:0.3f} s'.format(ref_time))
+    print('segment_similarity: {:0.3f} s ({:0.1f}x faster)'.format(
+        fast_time, ref_time / max(fast_time, 1e-9)
+    ))
+    print('Decisions differing: {}'.format(mismatches))
+    print('Pairs decided by each method: {}'.format(dict(matcher.counts)))
+
+    return mismatches
+
+
+# Runs the benchmark on the input CATH domain description file, e.g.
+# python sequence_similarity.py docs/CATH_domain_desc_v_4_2_0.txt
+if __name__ == '__main__':
+    benchmark_segment_similarity(sys.argv[1])
@@ -0,0 +1,176 @@
+import numpy as np
+from collections import OrderedDict
+
+# Codes used to store the relative orientation of each pair of interacting
+# strands (A = antiparallel, P = parallel, as assigned from the DSSP ladder
+# labels)
+orientation_codes = OrderedDict({'A': 0, 'P': 1, '': 2})
+orientation_labels = list(orientation_codes.keys())
+
+
+class strand_network():
+
+    def __init__(self):
+        # Network of the hydrogen-bonded strands in a beta-sheet, stored as an
+        # array of strand numbers (nodes, in the order in which they were
+        # added), an (n x 2) array of the strand numbers of each pair of
+        # interacting strands (edges, in the order in which they were added)
+        # and an array of the orientation code of each edge. The methods of
+        # networkx Graphs used by the DataGen pipeline are replicated,
+        # including the order of the nodes / neighbours that they return, so
+        # that sheets can be pickled and loaded without importing networkx.
+        self.strands = np.zeros(0, dtype=np.int64)
+        self.edges = np.zeros((0, 2), dtype=np.int64)
+        self.orientations = np.zeros(0, dtype=np.uint8)
+
+    def __getstate__(self):
+        # Pickles the arrays as raw bytes, in the smallest integer dtype that
+        # can hold the strand numbers
+        dtype = np.min_scalar_type(-max(1, np.abs(self.strands).max(initial=0)))
+        return (dtype.str, self.strands.astype(dtype).tobytes(),
+                self.edges.astype(dtype).tobytes(), self.orientations.tobytes())
+
+    def __setstate__(self, state):
+        dtype, strands, edges, orientations = state
+        self.strands = np.frombuffer(strands, dtype=dtype).astype(np.int64)
+        self.edges = np.frombuffer(edges, dtype=dtype).astype(np.int64).reshape(-1, 2)
+        self.orientations = np.frombuffer(orientations, dtype=np.uint8).copy()
+
+    def add_edge(self, strand_1, strand_2, orientation=''):
+        # Adds an interaction between two strands (adding the strands to the
+        # network if they aren't already present). The orientation of an
+        # existing interaction is updated rather than duplicated.
+        for strand in [strand_1, strand_2]:
+            if not strand in self.strands:
+                self.strands = np.append(self.strands, strand)
+
+        code = orientation_codes[orientation]
+        existing = np.nonzero(
+            ((self.edges[:, 0] == strand_1) & (self.edges[:, 1] == strand_2))
+            | ((self.edges[:, 0] == strand_2) & (self.edges[:, 1] == strand_1))
+        )[0]
+        if existing.shape[0] > 0:
+            self.orientations[existing[0]] = code
+        else:
+            self.edges = np.append(self.edges, [[strand_1, strand_2]], axis=0)
+            self.orientations = np.append(self.orientations, np.uint8(code))
+
+    def nodes(self):
+        return self.strands.tolist()
+
+    def number_of_nodes(self):
+        return self.strands.shape[0]
+
+    def neighbors(self, strand):
+        # Lists the strands that interact with the input strand, in the order
+        # in which the interactions were added
+        is_first = self.edges[:, 0] == strand
+        is_second = self.edges[:, 1] == strand
+        return np.where(is_first, self.edges[:, 1], self.edges[:, 0])[
+            is_first | is_second
+        ].tolist()
+
+    def degree(self):
+        # Returns an ordered dictionary of the number of strands that each
+        # strand interacts with
+        indices = np.searchsorted(np.sort(self.strands), self.edges.ravel())
+        counts = np.bincount(indices, minlength=self.strands.shape[0])
+        counts = counts[np.argsort(np.argsort(self.strands))]
+        return OrderedDict(zip(self.strands.tolist(), counts.tolist()))
+
+    def edge_labels(self):
+        # Returns a dictionary of the orientation of each pair of interacting
+        # strands
+        return {(strand_1, strand_2): orientation_labels[code] for
+                (strand_1, strand_2), code in
+                zip(self.edges.tolist(), self.orientations.tolist())}
+
+    def remove_node(self, strand):
+        # Removes a strand, plus all of its interactions, from the network
+        keep = (self.edges[:, 0] != strand) & (self.edges[:, 1] != strand)
+        self.edges = self.edges[keep]
+        self.orientations = self.orientations[keep]
+        self.strands = self.strands[self.strands != strand]
+
+    def compose(self, network):
+        # Returns a new network containing the strands and interactions of
+        # both this and the input network
+        composed = strand_network()
+        composed.strands = np.append(
+            self.strands, network.strands[~np.isin(network.strands, self.strands)]
+        )
+        composed.edges = np.append(self.edges, network.edges, axis=0)
+        composed.orientations = np.append(self.orientations, network.orientations)
+        return composed
+
+    def adjacency(self):
+        # Returns an ordered dictionary of the neighbours of each strand
+        adjacency = OrderedDict((strand, []) for strand in self.strands.tolist())
+        for strand_1, strand_2 in self.edges.tolist():
+            adjacency[strand_1].append(strand_2)
+            if strand_2 != strand_1:
+                adjacency[strand_2].append(strand_1)
+        return adjacency
+
+    def components(self):
+        # Lists the sets of (directly or indirectly) interacting strands in
+        # the network, by repeated merging of the labels of interacting
+        # strands
+        if self.strands.shape[0] == 0:
+            return []
+
+        order = np.argsort(self.strands)
+        edges = order[np.searchsorted(self.strands[order], self.edges)]
+        labels = np.arange(self.strands.shape[0])
+        while edges.shape[0] > 0:
+            merged = np.minimum(labels[edges[:, 0]], labels[edges[:, 1]])
+            new_labels = labels.copy()
+            np.minimum.at(new_labels, edges[:, 0], merged)
+            np.minimum.at(new_labels, edges[:, 1], merged)
+            new_labels = new_labels[new_labels]
+            if np.array_equal(new_labels, labels):
+                break
+            labels = new_labels
+
+        components = OrderedDict()
+        for strand, label in zip(self.strands.tolist(), labels.tolist()):
+            components.setdefault(label, []).append(strand)
+        return list(components.values())
+
+    def cycle_basis(self):
+        # Lists a basis of the cycles of interacting strands in the network,
+        # with the strands of each cycle listed in order around the cycle
+        # (uses the same algorithm as networkx.cycle_basis, walking a
+        # spanning tree of each component in turn, so the cycles are
+        # returned in the same order as for the equivalent networkx Graph)
+        adjacency = self.adjacency()
+        strands = OrderedDict.fromkeys(adjacency)
+        cycles = []
+        while strands:
+            root = strands.popitem()[0]
+            stack = [root]
+            pred = {root: root}
+            used = {root: set()}
+            while stack:
+                z = stack.pop()
+                z_used = used[z]
+                for nbr in adjacency[z]:
+                    if not nbr in used:
+                        pred[nbr] = z
+                        stack.append(nbr)
+                        used[nbr] = set([z])
+                    elif nbr == z:
+                        cycles.append([z])
+                    elif not nbr in z_used:
+                        pn = used[nbr]
+                        cycle = [nbr, z]
+                        p = pred[z]
+                        while not p in pn:
+                            cycle.append(p)
+                            p = pred[p]
+                        cycle.append(p)
+                        cycles.append(cycle)
+                        used[nbr].add(z)
+            for strand in pred:
+                strands.pop(strand, None)
+        return cycles
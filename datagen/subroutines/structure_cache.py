@@ -0,0 +1,107 @@
+import os
+from collections import OrderedDict
+if __name__ == 'subroutines.structure_cache':
+    from subroutines.parse_pdb import parse_pdb_records
+else:
+    from datagen.subroutines.parse_pdb import parse_pdb_records
+
+# The memory footprint of an AMPAL object cannot be measured directly, so is
+# approximated as a multiple of the size of the PDB file from which it was
+# parsed (each ~80 byte ATOM record is converted into an Atom object plus its
+# coordinates array and tags dictionary)
+ampal_size_factor = 15
+
+
+class parsed_structure_cache():
+
+    def __init__(self, max_size=1024):
+        # max_size is the (approximate) memory cap of the cache in MB
+        self.max_size = max_size*(1024**2)
+        self.structures = OrderedDict()
+        self.sizes = OrderedDict()
+        self.current_size = 0
+        self.hits = 0
+        self.misses = 0
+
+    def set_max_size(self, max_size):
+        # Updates the memory cap of the cache (in MB), evicting structures if
+        # the cache now exceeds the new cap
+        self.max_size = max_size*(1024**2)
+        self.evict()
+
+    def estimate_size(self, structure, file_size):
+        # Measures the size of a dictionary of column arrays from the total
+        # size of its arrays, and approximates the size of any other parsed
+        # structure (i.e. AMPAL objects) from the size of its PDB file
+        if isinstance(structure, dict):
+            return sum(column.nbytes for column in structure.values())
+        else:
+            return file_size*ampal_size_factor
+
+    def evict(self):
+        # Discards the least recently used structures until the cache is back
+        # under its memory cap
+        while self.current_size > self.max_size and len(self.structures) > 0:
+            key, structure = self.structures.popitem(last=False)
+            self.current_size -= self.sizes.pop(key)
+
+    def get(self, pdb_path, parser_name, parser):
+        # Returns the structure parsed from the input PDB file with the input
+        # parser function, only parsing the file if it has not already been
+        # parsed by this process since it was last modified (symbolic links
+        # are resolved, so a parent assembly is only parsed once for all of
+        # its domain-level views). Structures are shared between all callers,
+        # so must not be modified in place.
+        stat = os.stat(pdb_path)
+        key = (os.path.realpath(pdb_path), parser_name, stat.st_mtime_ns,
+               stat.st_size)
+
+        if key in self.structures:
+            self.hits += 1
+            self.structures.move_to_end(key)
+            return self.structures[key]
+
+        self.misses += 1
+        structure = parser(pdb_path)
+        size = self.estimate_size(structure, stat.st_size)
+        if size <= self.max_size:
+            self.structures[key] = structure
+            self.sizes[key] = size
+            self.current_size += size
+            self.evict()
+
+        return structure
+
+    def clear(self):
+        self.structures = OrderedDict()
+        self.sizes = OrderedDict()
+        self.current_size = 0
+
+    def stats(self):
+        # Returns the cache hit / miss counts plus its current size and number
+        # of entries, for use in sizing the memory cap
+        stats = OrderedDict({'hits': self.hits,
+                             'misses': self.misses,
+                             'entries': len(self.structures),
+                             'size_mb': self.current_size / (1024**2),
+                             'max_size_mb': self.max_size / (1024**2)})
+        return stats
+
+
+# Single cache shared by all pipeline stages run in the same process
+structure_cache = parsed_structure_cache()
+
+
+def convert_pdb_to_ampal(pdb_path):
+    # Cached equivalent of isambard.ampal.convert_pdb_to_ampal (ISAMBARD is
+    # imported here since it is only installed in the ISAMBARD docker
+    # container)
+    import isambard_dev as isambard
+    return structure_cache.get(
+        pdb_path, 'ampal', isambard.ampal.convert_pdb_to_ampal
+    )
+
+
+def load_pdb_records(pdb_path):
+    # Cached equivalent of parse_pdb.parse_pdb_records
+    return structure_cache.get(pdb_path, 'records', parse_pdb_records)
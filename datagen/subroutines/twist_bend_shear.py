@@ -2,15 +2,16 @@
 import copy
 import os
 import isambard_dev as isambard
-import networkx as nx
 import numpy as np
 import pandas as pd
 import scipy.stats as stats
 from collections import OrderedDict
 if __name__ == 'subroutines.twist_bend_shear':
     from subroutines.run_stages import run_stages
+    from subroutines.structure_cache import convert_pdb_to_ampal
 else:
     from datagen.subroutines.run_stages import run_stages
+    from datagen.subroutines.structure_cache import convert_pdb_to_ampal
 
 
 def find_strand_bend(domain_id, dssp_df):
@@ -23,7 +24,7 @@ def find_strand_bend(domain_id, dssp_df):
     print('Calculating bend for residues in {}'.format(domain_id))
 
     # Creates AMPAL object
-    pdb = isambard.ampal.convert_pdb_to_ampal(
+    pdb = convert_pdb_to_ampal(
         'Parent_assemblies/{}.pdb'.format(domain_id)
     )
 
@@ -102,7 +103,7 @@ def find_strand_twist(domain_id, domain_df, strand_or_res):
     print('Calculating twist for residues in {}'.format(domain_id))
 
     # Creates AMPAL object
-    pdb = isambard.ampal.convert_pdb_to_ampal(
+    pdb = convert_pdb_to_ampal(
         'Parent_assemblies/{}.pdb'.format(domain_id)
     )
 
@@ -282,7 +283,7 @@ def find_sheet_shear(domain_id, domain_df, domain_sheets_dict):
         raise Exception('Only a single sheet expected in {}'.format(domain_id))
     G = networks[0]
 
-    strand_order = nx.cycle_basis(G)
+    strand_order = G.cycle_basis()
     if len(strand_order) > 1:
         # Appends shear to domain_df
         shear_df = pd.DataFrame(OrderedDict({'shear_number': ['']*domain_df.shape[0]}))